@@ -0,0 +1,85 @@
+"""
+Measures recall@k, latency and code size of the NumpyBackend quantization modes
+(int8 / binary sign bits, each with full-precision rescoring) against exact search.
+
+Queries are the golden-set questions (embedded through the embedding cache, so
+repeated runs make no API calls). With --synthetic, stored chunk embeddings plus
+noise are used instead and no API key is needed.
+
+    uv run python scripts/benchmark_quantization.py --collection eu_ai_gdpr_parent_child
+    uv run python scripts/benchmark_quantization.py --synthetic --rescore 1 4 10
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmark_vector_backends import open_collection, sample_queries
+
+GOLDEN_SET_PATH = "data/golden_qa/compliance_test_set.json"
+
+def golden_queries() -> np.ndarray:
+    from src.utils.embeddings import GoogleGenAIEmbeddingFunction
+
+    load_dotenv()
+    with open(GOLDEN_SET_PATH, "r", encoding="utf-8") as f:
+        questions = [item['question'] for item in json.load(f)]
+    embedding_fn = GoogleGenAIEmbeddingFunction(api_key=os.getenv("GEMINI_API_KEY"))
+    return np.asarray(embedding_fn(questions), dtype=np.float32)
+
+def timed_query(store, queries: np.ndarray, k: int):
+    latencies, ids = [], []
+    for q in queries:
+        t = time.perf_counter()
+        res = store.query(query_embeddings=[q.tolist()], n_results=k, include=["distances"])
+        latencies.append((time.perf_counter() - t) * 1000)
+        ids.append(res['ids'][0])
+    return ids, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default="eu_ai_gdpr_parent_child")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore", type=int, nargs="+", default=[1, 4, 10])
+    parser.add_argument("--synthetic", action="store_true", help="Use noisy stored vectors instead of the golden set")
+    parser.add_argument("--queries", type=int, default=200, help="Number of synthetic queries")
+    args = parser.parse_args()
+
+    from src.retrieval.vector_backends import VECTOR_INDEX_DIR, NumpyBackend
+
+    collection = open_collection(args.collection)
+    path = VECTOR_INDEX_DIR / args.collection
+    if not NumpyBackend.exists(path) or not (path / "binary_codes.npy").exists():
+        NumpyBackend.build(collection, path)
+
+    queries = sample_queries(collection, args.queries) if args.synthetic else golden_queries()
+    exact = NumpyBackend(path)
+    reference, latencies = timed_query(exact, queries, args.k)
+
+    def size_mb(*names):
+        return sum((path / name).stat().st_size for name in names) / 1e6
+
+    print(f"\n{len(queries)} queries, {len(exact)} vectors, k={args.k}")
+    print(f"{'mode':<8} {'rescore':>7} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8} {'codes MB':>9}")
+    print(f"{'exact':<8} {'-':>7} {1.0:>9.3f} {np.percentile(latencies, 50):>8.3f} "
+          f"{np.percentile(latencies, 95):>8.3f} {size_mb('embeddings.npy'):>9.1f}")
+
+    code_files = {"int8": ("int8_codes.npy", "int8_scale.npy"), "binary": ("binary_codes.npy",)}
+    for mode, files in code_files.items():
+        for factor in args.rescore:
+            store = NumpyBackend(path, quantization=mode, rescore_factor=factor)
+            store.query(query_embeddings=queries[:1].tolist(), n_results=args.k) # warm-up
+            ids, latencies = timed_query(store, queries, args.k)
+            recall = np.mean([len(set(a) & set(b)) / max(len(b), 1) for a, b in zip(ids, reference, strict=True)])
+            print(f"{mode:<8} {factor:>7} {recall:>9.3f} {np.percentile(latencies, 50):>8.3f} "
+                  f"{np.percentile(latencies, 95):>8.3f} {size_mb(*files):>9.1f}")
+
+if __name__ == "__main__":
+    main()
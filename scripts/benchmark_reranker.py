@@ -0,0 +1,126 @@
+"""
+Measures cross-encoder reranking throughput (pairs/s) and latency per query for
+the ReRanker backends, against the original configuration (fp32, full article
+text, no cache).
+
+Candidates are the top BM25 articles for each golden-set question, so no API
+key is needed. Each configuration is timed cold (empty score cache) and warm
+(the same queries again), and its top-k is compared with the baseline's.
+pairs/s counts reranked (query, article) pairs; `scored` is how many
+(query, passage) pairs actually went through the model.
+
+    uv run python scripts/benchmark_reranker.py
+    uv run python scripts/benchmark_reranker.py --backends torch int8 onnx --candidates 30
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+GOLDEN_SET_PATH = "data/golden_qa/compliance_test_set.json"
+ARTICLE_FILES = ["data/processed/gdpr_articles.json", "data/processed/eu_ai_act_articles.json"]
+
+def load_workload(n_candidates: int):
+    from src.retrieval.bm25_index import BM25Index
+
+    articles = []
+    for path in ARTICLE_FILES:
+        with open(path, "r", encoding="utf-8") as f:
+            articles.extend(json.load(f))
+    texts = [a['full_text'] for a in articles]
+    index = BM25Index.build([a['id'] for a in articles], texts)
+
+    with open(GOLDEN_SET_PATH, "r", encoding="utf-8") as f:
+        questions = [item['question'] for item in json.load(f)]
+
+    workload = []
+    for q in questions:
+        docs = [{"id": articles[i]['id'], "text": texts[i], "metadata": {}} for i, _ in index.top_k(q, n_candidates)]
+        workload.append((q, docs))
+    return workload
+
+def run(reranker, workload, top_k: int):
+    """
+    Returns (candidate pairs reranked, pairs the model scored, wall seconds,
+    per-query latencies ms, top-k ids per query).
+    """
+    latencies, rankings = [], []
+    misses_before = getattr(reranker, "misses", 0)
+    pairs = 0
+    start = time.perf_counter()
+    for query, docs in workload:
+        t = time.perf_counter()
+        ranked = reranker.rerank(query, [dict(d) for d in docs], top_k=top_k)
+        latencies.append((time.perf_counter() - t) * 1000)
+        rankings.append([d['id'] for d in ranked])
+        pairs += len(docs)
+    elapsed = time.perf_counter() - start
+    scored = reranker.misses - misses_before if hasattr(reranker, "misses") else pairs
+    return pairs, scored, elapsed, latencies, rankings
+
+class BaselineReRanker:
+    """
+    The original reranker: one fp32 pair per full article text, default batch size, no cache.
+    """
+    def __init__(self, model_name: str):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def rerank(self, query, docs, top_k=5):
+        scores = self.model.predict([(query, d['text']) for d in docs], show_progress_bar=False)
+        for d, s in zip(docs, scores, strict=True):
+            d['rerank_score'] = float(s)
+        return sorted(docs, key=lambda x: x['rerank_score'], reverse=True)[:top_k]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8"])
+    parser.add_argument("--candidates", type=int, default=20, help="Articles reranked per query")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-length", type=int, nargs="+", default=[256])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--passages", action="store_true", help="Score passages of each article and max-pool")
+    args = parser.parse_args()
+
+    from src.retrieval.reranker import RERANKER_MODEL, ReRanker
+
+    workload = load_workload(args.candidates)
+    baseline = BaselineReRanker(RERANKER_MODEL)
+    baseline.rerank(*workload[0]) # warm-up
+    pairs, scored, elapsed, latencies, reference = run(baseline, workload, args.top_k)
+
+    print(f"\n{len(workload)} queries x {args.candidates} candidates, top_k={args.top_k}")
+    print(f"{'config':<22} {'pass':<5} {'scored':>7} {'pairs/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'overlap@k':>10}")
+    print(f"{'baseline (fp32, full)':<22} {'-':<5} {scored:>7} {pairs / elapsed:>8.1f} "
+          f"{np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 95):>8.1f} {1.0:>10.3f}")
+
+    for backend in args.backends:
+        for max_length in args.max_length:
+            try:
+                reranker = ReRanker(
+                    backend=backend, max_length=max_length, batch_size=args.batch_size,
+                    passages=args.passages
+                )
+            except ImportError as e:
+                print(f"{backend:<22} skipped: {e}")
+                continue
+            if reranker.backend != backend: # ONNX could not load and fell back
+                print(f"{backend:<22} skipped: fell back to {reranker.backend}")
+                continue
+            reranker.score_pairs("warm-up", ["warm-up"])
+            label = f"{backend} (len {max_length})"
+            for phase in ("cold", "warm"):
+                pairs, scored, elapsed, latencies, rankings = run(reranker, workload, args.top_k)
+                overlap = np.mean([len(set(a) & set(b)) / max(len(b), 1) for a, b in zip(rankings, reference, strict=True)])
+                print(f"{label:<22} {phase:<5} {scored:>7} {pairs / elapsed:>8.1f} "
+                      f"{np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 95):>8.1f} {overlap:>10.3f}")
+            print(f"{'':<22} cache: {reranker.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmarks the Chroma and NumPy vector backends on query latency and RSS.
+
+Queries are stored chunk embeddings plus small noise, so no API calls are made.
+Each backend runs in a fresh subprocess so RSS numbers are not mixed up.
+
+    uv run python scripts/benchmark_vector_backends.py --collection eu_ai_gdpr_parent_child
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+CHROMA_DIR = "data/chroma"
+
+def rss_mb() -> float:
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def sample_queries(collection, n: int, seed: int = 0) -> np.ndarray:
+    data = collection.get(include=["embeddings"])
+    embeddings = np.asarray(data['embeddings'], dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    picks = embeddings[rng.choice(len(embeddings), size=min(n, len(embeddings)), replace=False)]
+    return picks + rng.normal(scale=0.01, size=picks.shape).astype(np.float32)
+
+def open_collection(name: str):
+    import chromadb
+    from chromadb.config import Settings
+    client = chromadb.PersistentClient(path=CHROMA_DIR, settings=Settings(anonymized_telemetry=False))
+    return client.get_collection(name=name)
+
+def run_backend(backend: str, collection_name: str, n_queries: int, k: int, batch: int) -> dict:
+    from src.retrieval.vector_backends import VECTOR_INDEX_DIR, ChromaBackend, NumpyBackend
+
+    rss_start = rss_mb()
+    load_start = time.perf_counter()
+    collection = open_collection(collection_name)
+    if backend == "chroma":
+        store = ChromaBackend(collection)
+    else:
+        dtype = "float16" if backend == "numpy-fp16" else "float32"
+        path = VECTOR_INDEX_DIR / f"{collection_name}-{dtype}-bench"
+        if not NumpyBackend.exists(path):
+            NumpyBackend.build(collection, path, dtype=dtype)
+        store = NumpyBackend(path)
+    load_s = time.perf_counter() - load_start
+
+    queries = sample_queries(collection, n_queries)
+    store.query(query_embeddings=queries[:1].tolist(), n_results=k) # warm-up
+
+    latencies = []
+    results = []
+    for q in queries:
+        t = time.perf_counter()
+        res = store.query(query_embeddings=[q.tolist()], n_results=k, include=["distances"])
+        latencies.append((time.perf_counter() - t) * 1000)
+        results.append(res['ids'][0])
+
+    batched_ms = None
+    if batch > 1:
+        t = time.perf_counter()
+        for i in range(0, len(queries), batch):
+            store.query(query_embeddings=queries[i:i + batch].tolist(), n_results=k, include=["distances"])
+        batched_ms = (time.perf_counter() - t) * 1000 / len(queries)
+
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "batched_ms_per_query": batched_ms,
+        "rss_mb": rss_mb() - rss_start,
+        "ids": results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default="eu_ai_gdpr_parent_child")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--only", help=argparse.SUPPRESS) # internal: run one backend and print JSON
+    args = parser.parse_args()
+
+    if args.only:
+        print(json.dumps(run_backend(args.only, args.collection, args.queries, args.k, args.batch)))
+        return
+
+    reports = []
+    for backend in ["chroma", "numpy", "numpy-fp16"]:
+        out = subprocess.run(
+            [sys.executable, __file__, "--only", backend, "--collection", args.collection,
+             "--queries", str(args.queries), "--k", str(args.k), "--batch", str(args.batch)],
+            capture_output=True, text=True, check=True
+        )
+        reports.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    # Agreement with Chroma (HNSW is approximate, numpy is exact)
+    reference = reports[0]["ids"]
+    print(f"\n{'backend':<12} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'batch ms/q':>11} {'RSS MB':>8} {'overlap@k':>10}")
+    for r in reports:
+        overlap = np.mean([len(set(a) & set(b)) / max(len(a), 1) for a, b in zip(r["ids"], reference, strict=True)])
+        batched = f"{r['batched_ms_per_query']:.3f}" if r["batched_ms_per_query"] is not None else "-"
+        print(f"{r['backend']:<12} {r['load_s']:>7.2f} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} {batched:>11} {r['rss_mb']:>8.1f} {overlap:>10.3f}")
+
+if __name__ == "__main__":
+    main()
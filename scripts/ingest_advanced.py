@@ -1,3 +1,4 @@
+import argparse
 import json
 import logging
 from pathlib import Path
@@ -12,6 +13,10 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.data.advanced_chunking import AdvancedRegulationChunker
+from src.data.batch_embedder import BATCH_SIZE, BatchEmbedder
+from src.data.ingestion_manifest import IngestionManifest, log_plan
+from src.data.parent_store import PARENT_STORE_DIR, ParentStore
+from src.retrieval.vector_backends import VECTOR_INDEX_DIR, NumpyBackend
 from src.utils.embeddings import GoogleGenAIEmbeddingFunction
 
 # Load env for API keys
@@ -59,16 +64,23 @@ class AdvancedIngestionManager:
                     all_articles.extend(json.load(file))
         return all_articles
 
-    def run(self):
+    def run(self, full: bool = False) -> Dict[str, int]:
+        """
+        Incremental by default: only chunks whose text/metadata hash changed since
+        the last run are re-embedded. `full=True` re-upserts everything.
+        """
         logger.info(f"Starting Advanced Ingestion to collection: {COLLECTION_NAME}")
         
         # 1. Load
         articles = self.load_data()
         if not articles:
             logger.error("No data found!")
-            return
+            return {}
 
-        # 2. Chunk (Advanced)
+        # 2. Parent Store (full article texts, one copy each)
+        ParentStore.build(articles, PARENT_STORE_DIR)
+        
+        # 3. Chunk (Advanced)
         chunker = AdvancedRegulationChunker()
         chunks = []
         logger.info("Chunking articles with metadata extraction...")
@@ -77,29 +89,44 @@ class AdvancedIngestionManager:
             
         logger.info(f"Generated {len(chunks)} chunks (Paragraphs).")
         
-        # 3. Ingest
-        ids = [c['id'] for c in chunks]
-        documents = [c['text'] for c in chunks] # Embedding child text
-        metadatas = [c['metadata'] for c in chunks] # Storing parent text here
+        # 4. Diff against last ingested state
+        manifest = IngestionManifest(COLLECTION_NAME)
+        if not full and self.collection.count() != len(manifest.hashes):
+            logger.warning("Collection does not match manifest. Falling back to full ingestion.")
+            full = True
+        plan = manifest.plan(chunks)
+        if full:
+            plan["changed"] += plan["unchanged"]
+            plan["unchanged"] = []
+        log_plan(plan)
         
-        BATCH_SIZE = 100
-        logger.info("Upserting to ChromaDB...")
+        # 5. Ingest
+        # Child text is embedded; parents are resolved via article_id
+        to_upsert = set(plan["added"]) | set(plan["changed"])
+        pending = [c for c in chunks if c['id'] in to_upsert]
         
-        for i in range(0, len(chunks), BATCH_SIZE):
-            batch_ids = ids[i:i+BATCH_SIZE]
-            batch_docs = documents[i:i+BATCH_SIZE]
-            batch_meta = metadatas[i:i+BATCH_SIZE]
+        logger.info("Upserting to ChromaDB...")
+        BatchEmbedder(self.embedding_fn).upsert(self.collection, pending)
             
-            self.collection.upsert(
-                ids=batch_ids,
-                documents=batch_docs,
-                metadatas=batch_meta
-            )
-            print(f"Batch {i//BATCH_SIZE + 1} done...", end="\r")
+        if plan["removed"]:
+            for i in range(0, len(plan["removed"]), BATCH_SIZE):
+                self.collection.delete(ids=plan["removed"][i:i+BATCH_SIZE])
             
+        manifest.save(chunks)
+        
+        # 6. Refresh the numpy vector index if one is in use
+        vector_path = VECTOR_INDEX_DIR / COLLECTION_NAME
+        if NumpyBackend.exists(vector_path) and (plan["added"] or plan["changed"] or plan["removed"]):
+            NumpyBackend.build(self.collection, vector_path)
+        
         logger.info("\nIngestion Complete!")
         logger.info(f"Final Collection Count: {self.collection.count()}")
+        return {k: len(v) for k, v in plan.items()}
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parent-Child ingestion into ChromaDB")
+    parser.add_argument("--full", action="store_true", help="Re-embed every chunk instead of only changed ones")
+    args = parser.parse_args()
+    
     manager = AdvancedIngestionManager()
-    manager.run()
+    manager.run(full=args.full)
@@ -10,7 +10,7 @@ class AdvancedRegulationChunker:
     Implements Hierarchical (Parent-Child) Chunking with Legal Metadata extraction.
     
     Structure:
-    - Parent: Full Article text (stored in metadata, not embedded)
+    - Parent: Full Article text (stored once in the ParentStore, keyed by article_id)
     - Child: Individual Paragraphs (embedded for retrieval)
     
     Metadata:
@@ -18,7 +18,10 @@ class AdvancedRegulationChunker:
     - contains_obligation: boolean
     """
     
-    def __init__(self):
+    def __init__(self, store_parent_text: bool = False):
+        # Legacy layout: copy the full parent text into every child's metadata
+        self.store_parent_text = store_parent_text
+        
         # Regex patterns for legal analysis
         self.obligation_pattern = re.compile(r'\b(shall|must|required to|obligation)\b', re.IGNORECASE)
         self.mandatory_pattern = re.compile(r'\bshall\b', re.IGNORECASE)
@@ -52,17 +55,17 @@ class AdvancedRegulationChunker:
         title = article.get('title', '')
         
         # 1. Base Metadata (Shared)
-        # We store the FULL PARENT TEXT in the metadata of every child.
-        # This allows the retriever to grab the full context immediately.
-        # Note: This increases storage size but simplifies retrieval logic (no separate key-value store needed).
+        # Children only carry `article_id`; the retriever resolves the full parent
+        # text from the ParentStore instead of every child duplicating it.
         base_metadata = {
             "article_id": article_id,
             "article_number": article_num,
             "title": title,
             "regulation": regulation,
-            "parent_text": full_text, # <--- THE KEY UPGRADE
             "total_tokens": len(full_text.split()) # Rough estimate
         }
+        if self.store_parent_text:
+            base_metadata["parent_text"] = full_text
         
         # 2. Split into Children (Paragraphs)
         # Using double newline as heuristic for paragraph separation
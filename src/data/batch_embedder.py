@@ -0,0 +1,71 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any
+
+from src.utils.embeddings import GoogleGenAIEmbeddingFunction
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+BATCH_SIZE = 100
+
+class BatchEmbedder:
+    """
+    Embeds chunks concurrently (`workers` batches in flight) and writes the
+    precomputed vectors to Chroma with `embeddings=` so the collection never
+    embeds on its own. Pacing to the embedding quota (EMBED_RPM / EMBED_TPM)
+    and retries happen in the shared LLM gateway.
+    """
+    def __init__(
+        self,
+        embedding_fn: GoogleGenAIEmbeddingFunction,
+        workers: int = INGEST_WORKERS,
+        batch_size: int = BATCH_SIZE
+    ):
+        self.embedding_fn = embedding_fn
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return self.embedding_fn(texts)
+
+    def upsert(self, collection, chunks: List[Dict[str, Any]]) -> Dict[str, float]:
+        """
+        Embeds `chunks` concurrently and upserts each batch as soon as it is ready.
+        Returns {"chunks": n, "seconds": t, "chunks_per_second": r}.
+        """
+        if not chunks:
+            return {"chunks": 0, "seconds": 0.0, "chunks_per_second": 0.0}
+
+        batches = [chunks[i:i + self.batch_size] for i in range(0, len(chunks), self.batch_size)]
+        logger.info(f"Embedding {len(chunks)} chunks in {len(batches)} batches ({self.workers} workers)...")
+
+        start = time.perf_counter()
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed") as pool:
+            futures = {
+                pool.submit(self._embed_batch, [c['text'] for c in batch]): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                batch = futures[future]
+                embeddings = future.result()
+
+                # Chroma writes stay on this thread
+                collection.upsert(
+                    ids=[c['id'] for c in batch],
+                    documents=[c['text'] for c in batch],
+                    metadatas=[c['metadata'] for c in batch],
+                    embeddings=embeddings
+                )
+
+                done += len(batch)
+                elapsed = time.perf_counter() - start
+                logger.info(f"  {done}/{len(chunks)} chunks ({done / elapsed:.1f} chunks/s)")
+
+        elapsed = time.perf_counter() - start
+        stats = {"chunks": len(chunks), "seconds": elapsed, "chunks_per_second": len(chunks) / elapsed}
+        logger.info(f"Embedded {len(chunks)} chunks in {elapsed:.1f}s ({stats['chunks_per_second']:.1f} chunks/s)")
+        return stats
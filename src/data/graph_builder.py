@@ -1,15 +1,24 @@
+import argparse
 import json
 import logging
+import os
+import pickle
 import re
 import networkx as nx
-import pickle
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from dotenv import load_dotenv
+
+from src.utils.embeddings import GoogleGenAIEmbeddingFunction
+from src.data.graph_store import GRAPH_DIR, CompactGraph
+
+load_dotenv()
 
 logger = logging.getLogger(__name__)
 
 PROCESSED_DIR = Path("data/processed")
-GRAPH_PATH = Path("data/knowledge_graph.pkl")
+EMBED_BATCH_SIZE = 100
+EMBED_MAX_CHARS = 8000 # ~2k tokens, the text-embedding-004 input limit
 
 class LegalGraphBuilder:
     """
@@ -92,13 +101,70 @@ class LegalGraphBuilder:
                     
         logger.info(f"Graph built: {self.graph.number_of_nodes()} nodes, {edge_count} edges.")
         
-    def save_graph(self):
-        with open(GRAPH_PATH, "wb") as f:
-            pickle.dump(self.graph, f)
-        logger.info(f"Graph saved to {GRAPH_PATH}")
+    def load_pickle(self, path: Path):
+        """
+        One-time conversion of a legacy pickled `nx.DiGraph` (data/knowledge_graph.pkl).
+        Only run this on a pickle you produced yourself: unpickling executes code.
+        """
+        with open(path, "rb") as f:
+            self.graph = pickle.load(f)
+        logger.info(f"Loaded pickled graph: {self.graph.number_of_nodes()} nodes, {self.graph.number_of_edges()} edges.")
+        
+    def embed_nodes(self, embedding_fn: Optional[GoogleGenAIEmbeddingFunction] = None):
+        """
+        Precomputes one embedding per article node (title + leading text) and stores
+        it on the node as `embedding`, so the retriever can gate graph neighbours by
+        cosine similarity instead of LLM calls.
+        """
+        if embedding_fn is None:
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY not found")
+            embedding_fn = GoogleGenAIEmbeddingFunction(
+                api_key=api_key,
+                model_name="models/text-embedding-004"
+            )
+            
+        node_ids = list(self.graph.nodes)
+        logger.info(f"Embedding {len(node_ids)} article nodes...")
+        
+        for i in range(0, len(node_ids), EMBED_BATCH_SIZE):
+            batch_ids = node_ids[i:i+EMBED_BATCH_SIZE]
+            texts = []
+            for nid in batch_ids:
+                data = self.graph.nodes[nid]
+                texts.append(f"{data.get('title', '')}\n{data.get('full_text', '')}"[:EMBED_MAX_CHARS])
+                
+            embeddings = embedding_fn(texts)
+            for nid, emb in zip(batch_ids, embeddings, strict=True):
+                self.graph.nodes[nid]['embedding'] = [float(x) for x in emb]
+                
+        logger.info("Node embeddings stored on graph.")
+        
+    def save_graph(self, path: Path = GRAPH_DIR):
+        """
+        Persists the graph in the compact (CSR + string store) layout read by the
+        retriever, with its precomputed node features.
+        """
+        graph = CompactGraph.from_networkx(self.graph, path)
+        # Per-node features (reachability bitsets, PageRank, degrees) so retrieval
+        # reads them instead of traversing per request
+        graph.write_features()
+        logger.info(f"Graph saved to {path}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the citation graph artifact")
+    parser.add_argument("--from-pickle", type=Path, help="Convert a legacy pickled graph instead of building from data/processed")
+    parser.add_argument("--embed", action="store_true",
+                        help="Embed every node for GRAPH_EXPANSION_MODE=embedding (needs GEMINI_API_KEY; paid API calls)")
+    args = parser.parse_args()
+    
     logging.basicConfig(level=logging.INFO)
     builder = LegalGraphBuilder()
-    builder.build_graph()
+    if args.from_pickle:
+        builder.load_pickle(args.from_pickle)
+    else:
+        builder.build_graph()
+    if args.embed:
+        builder.embed_nodes()
     builder.save_graph()
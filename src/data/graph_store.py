@@ -0,0 +1,354 @@
+import json
+import logging
+import mmap
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+GRAPH_DIR = Path("data/graph")
+NODE_ATTRIBUTES = ("title", "full_text", "regulation", "article_number")
+REACH_DEPTH = 3 # Precomputed reachability bitsets cover 1..REACH_DEPTH hops
+REACH_DIRECTIONS = ("out", "both")
+
+class CompactGraph:
+    """
+    Read-only citation graph in flat, memory-mappable arrays (replaces the
+    pickled `nx.DiGraph`).
+
+    Layout (one directory):
+    - node_ids.npy        node ids ("GDPR_35"); node index = position
+    - out_indptr.npy      int64[N + 1] / out_indices.npy int32: CSR of citations (successors)
+    - in_indptr.npy       int64[N + 1] / in_indices.npy  int32: reverse CSR (predecessors)
+    - attr_<name>.npy     int32[N] string id per node, for each of NODE_ATTRIBUTES
+    - strings.bin         UTF-8 string store shared by all attributes (memory-mapped)
+    - string_offsets.npy  int64[S + 1], string s is strings.bin[offsets[s]:offsets[s + 1]]
+    - embeddings.npy      float32 [N, dim] node embeddings + has_embedding.npy bool[N] (optional)
+    - meta.json           {"n_nodes", "n_edges", "dim", "reach_depth"}
+
+    Precomputed node features (written by `write_features`, at graph build time):
+    - reach_<direction>.npy  uint8 [REACH_DEPTH, N, ceil(N / 8)]: row d-1 of node i is the
+                             packed set of nodes within d hops of i (i itself excluded)
+    - pagerank.npy           float64 [N], global PageRank over citations
+    - in_degree.npy / out_degree.npy  int64 [N]
+
+    Loading maps the files and builds the id -> index dict; nothing is unpickled.
+    """
+    def __init__(self, path: Path = GRAPH_DIR):
+        self.path = Path(path)
+        with open(self.path / "meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.node_ids = np.load(self.path / "node_ids.npy")
+        self.out_indptr = self._map("out_indptr")
+        self.out_indices = self._map("out_indices")
+        self.in_indptr = self._map("in_indptr")
+        self.in_indices = self._map("in_indices")
+        self.attributes = {name: self._map(f"attr_{name}") for name in NODE_ATTRIBUTES}
+        self.string_offsets = self._map("string_offsets")
+        self._strings_file = open(self.path / "strings.bin", "rb")
+        # mmap cannot map an empty file
+        self._strings = (
+            mmap.mmap(self._strings_file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.string_offsets[-1] > 0 else b""
+        )
+
+        self.embeddings = None
+        self.has_embedding = None
+        if self.meta.get("dim"):
+            self.embeddings = self._map("embeddings")
+            self.has_embedding = self._map("has_embedding")
+
+        self._index = {str(nid): i for i, nid in enumerate(self.node_ids)}
+        self._transitions: Dict[str, tuple] = {}
+        self._load_features()
+
+    def _load_features(self):
+        self.reach_depth = self.meta.get("reach_depth", 0)
+        self.reach_bits = {
+            direction: self._map(f"reach_{direction}")
+            for direction in REACH_DIRECTIONS
+            if self.reach_depth and (self.path / f"reach_{direction}.npy").exists()
+        }
+        if (self.path / "pagerank.npy").exists():
+            self.pagerank_scores = self._map("pagerank")
+            self.in_degree = self._map("in_degree")
+            self.out_degree = self._map("out_degree")
+        else:
+            # Older artifact: cheap enough to derive at load time
+            self.pagerank_scores = self.pagerank(direction="out")
+            self.in_degree = np.diff(self.in_indptr)
+            self.out_degree = np.diff(self.out_indptr)
+
+    def _map(self, name: str) -> np.ndarray:
+        # Plain ndarray view of the memory map (np.memmap indexing is slow on small gathers)
+        return np.asarray(np.load(self.path / f"{name}.npy", mmap_mode='r'))
+
+    @staticmethod
+    def exists(path: Path = GRAPH_DIR) -> bool:
+        return (Path(path) / "meta.json").exists()
+
+    @staticmethod
+    def build(node_ids: List[str], attributes: List[Dict[str, Any]], edges: Iterable[tuple],
+              path: Path = GRAPH_DIR, embeddings: Optional[List[Optional[List[float]]]] = None):
+        """
+        Writes the compact layout. `attributes[i]` holds NODE_ATTRIBUTES of
+        `node_ids[i]`; `edges` are (source_id, target_id) pairs.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        index = {nid: i for i, nid in enumerate(node_ids)}
+        n = len(node_ids)
+
+        # Deduplicated, in input order: neighbour lists keep the citation order
+        pairs = np.array(
+            list(dict.fromkeys((index[s], index[t]) for s, t in edges if s in index and t in index)),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        for direction, (src, dst) in (("out", (0, 1)), ("in", (1, 0))):
+            order = np.argsort(pairs[:, src], kind="stable")
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(pairs[:, src], minlength=n), out=indptr[1:])
+            np.save(path / f"{direction}_indptr.npy", indptr)
+            np.save(path / f"{direction}_indices.npy", pairs[order, dst].astype(np.int32))
+
+        # Shared string store (identical strings, e.g. empty titles, are stored once)
+        string_ids: Dict[str, int] = {}
+        blobs = []
+        for name in NODE_ATTRIBUTES:
+            column = np.empty(n, dtype=np.int32)
+            for i, attrs in enumerate(attributes):
+                value = str(attrs.get(name) or "")
+                if value not in string_ids:
+                    string_ids[value] = len(blobs)
+                    blobs.append(value.encode("utf-8"))
+                column[i] = string_ids[value]
+            np.save(path / f"attr_{name}.npy", column)
+        offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in blobs], out=offsets[1:])
+        with open(path / "strings.bin", "wb") as f:
+            f.write(b"".join(blobs))
+        np.save(path / "string_offsets.npy", offsets)
+        np.save(path / "node_ids.npy", np.array(node_ids, dtype=str))
+
+        dim = 0
+        if embeddings is not None and any(e is not None for e in embeddings):
+            dim = len(next(e for e in embeddings if e is not None))
+            matrix = np.zeros((n, dim), dtype=np.float32)
+            has = np.zeros(n, dtype=bool)
+            for i, emb in enumerate(embeddings):
+                if emb is not None:
+                    matrix[i] = emb
+                    has[i] = True
+            np.save(path / "embeddings.npy", matrix)
+            np.save(path / "has_embedding.npy", has)
+
+        with open(path / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({"n_nodes": n, "n_edges": len(pairs), "dim": dim}, f)
+        logger.info(f"Compact graph written: {path} ({n} nodes, {len(pairs)} edges, {offsets[-1] / 1e6:.1f} MB text)")
+
+    @classmethod
+    def from_networkx(cls, graph, path: Path = GRAPH_DIR) -> "CompactGraph":
+        """
+        Converts an `nx.DiGraph` (as built by LegalGraphBuilder) and loads the result.
+        """
+        node_ids = [str(nid) for nid in graph.nodes]
+        cls.build(
+            node_ids=node_ids,
+            attributes=[graph.nodes[nid] for nid in graph.nodes],
+            edges=[(str(s), str(t)) for s, t in graph.edges],
+            path=path,
+            embeddings=[graph.nodes[nid].get('embedding') for nid in graph.nodes]
+        )
+        return cls(path)
+
+    def write_features(self, depth: int = REACH_DEPTH):
+        """
+        Computes and persists reachability bitsets (1..depth hops, per direction),
+        PageRank and in/out degree next to the graph, then reloads them.
+        """
+        n = len(self)
+        n_bytes = (n + 7) // 8
+        rows = np.arange(n)
+        identity = np.zeros((n, n_bytes), dtype=np.uint8)
+        identity[rows, rows // 8] = (0x80 >> (rows % 8)).astype(np.uint8) # packbits bit order
+        for direction in REACH_DIRECTIONS:
+            src, dst, _, _ = self.edge_arrays(direction)
+            reach = np.zeros((depth, n, n_bytes), dtype=np.uint8)
+            within = identity.copy() # nodes within d hops, self included
+            for d in range(depth):
+                # within_{d+1}[u] = self | union of within_d[v] over edges u -> v
+                expanded = identity.copy()
+                np.bitwise_or.at(expanded, src, within[dst])
+                within = expanded
+                reach[d] = within & ~identity
+            np.save(self.path / f"reach_{direction}.npy", reach)
+
+        np.save(self.path / "pagerank.npy", self.pagerank(direction="out"))
+        np.save(self.path / "in_degree.npy", np.diff(self.in_indptr))
+        np.save(self.path / "out_degree.npy", np.diff(self.out_indptr))
+
+        self.meta["reach_depth"] = depth
+        with open(self.path / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        self._load_features()
+        logger.info(f"Graph features written: reachability <= {depth} hops, PageRank, degrees")
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self._index
+
+    def has_node(self, node_id: str) -> bool:
+        return node_id in self._index
+
+    def index(self, node_id: str) -> int:
+        return self._index[node_id]
+
+    def _string(self, string_id: int) -> str:
+        return self._strings[self.string_offsets[string_id]:self.string_offsets[string_id + 1]].decode("utf-8")
+
+    def attribute(self, node_id: str, name: str) -> str:
+        return self._string(self.attributes[name][self._index[node_id]])
+
+    def node(self, node_id: str, text: bool = True) -> Dict[str, Any]:
+        """
+        Node attributes as a dict; `text=False` skips decoding `full_text`.
+        """
+        i = self._index[node_id]
+        return {
+            name: self._string(column[i])
+            for name, column in self.attributes.items()
+            if text or name != "full_text"
+        }
+
+    def successors(self, node_id: str) -> List[str]:
+        i = self._index[node_id]
+        return [str(n) for n in self.node_ids[self.out_indices[self.out_indptr[i]:self.out_indptr[i + 1]]]]
+
+    def predecessors(self, node_id: str) -> List[str]:
+        i = self._index[node_id]
+        return [str(n) for n in self.node_ids[self.in_indices[self.in_indptr[i]:self.in_indptr[i + 1]]]]
+
+    def edge_arrays(self, direction: str = "both"):
+        """
+        (source_rows, target_rows, weights, dangling) of the row-normalised
+        transition matrix over citations ("out"), reverse citations ("in") or
+        both; `dangling` marks nodes without edges in that direction. Cached.
+        """
+        cached = self._transitions.get(direction)
+        if cached is not None:
+            return cached
+        n = len(self)
+        out_src = np.repeat(np.arange(n), np.diff(self.out_indptr))
+        out_dst = np.asarray(self.out_indices, dtype=np.int64)
+        src, dst = [], []
+        if direction in ("out", "both"):
+            src.append(out_src)
+            dst.append(out_dst)
+        if direction in ("in", "both"):
+            src.append(out_dst)
+            dst.append(out_src)
+        src = np.concatenate(src) if src else np.array([], dtype=np.int64)
+        dst = np.concatenate(dst) if dst else np.array([], dtype=np.int64)
+        degree = np.bincount(src, minlength=n).astype(np.float64)
+        weights = 1.0 / degree[src] if len(src) else np.array([], dtype=np.float64)
+        self._transitions[direction] = (src, dst, weights, degree == 0)
+        return self._transitions[direction]
+
+    def pagerank(self, personalization: Optional[np.ndarray] = None, damping: float = 0.85,
+                 direction: str = "both", max_iter: int = 50, tol: float = 1e-6) -> np.ndarray:
+        """
+        (Personalized) PageRank by power iteration over the CSR edge arrays, one
+        `np.bincount` per step. `personalization` is a non-negative weight per
+        node (uniform if None); dangling mass restarts at the personalization.
+        """
+        n = len(self)
+        if not n:
+            return np.array([], dtype=np.float64)
+        if personalization is None:
+            restart = np.full(n, 1.0 / n)
+        else:
+            restart = np.asarray(personalization, dtype=np.float64)
+            restart = restart / restart.sum() if restart.sum() > 0 else np.full(n, 1.0 / n)
+
+        src, dst, weights, dangling = self.edge_arrays(direction)
+        dangling = np.flatnonzero(dangling)
+        teleport = (1 - damping) * restart
+        scores = restart.copy()
+        for _ in range(max_iter):
+            updated = np.bincount(dst, weights=scores[src] * weights, minlength=n)
+            updated += scores[dangling].sum() * restart
+            updated *= damping
+            updated += teleport
+            converged = np.abs(updated - scores).sum() < tol
+            scores = updated
+            if converged:
+                break
+        return scores
+
+    def text_lengths(self, name: str = "full_text") -> np.ndarray:
+        """
+        UTF-8 byte length of an attribute for every node (no decoding).
+        """
+        string_ids = np.asarray(self.attributes[name])
+        return np.asarray(self.string_offsets[string_ids + 1]) - np.asarray(self.string_offsets[string_ids])
+
+    def k_hop_rows(self, rows: np.ndarray, k: int = 1, direction: str = "out") -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Row-level k_hop: (rows, hop_distances) of the nodes within k hops of `rows`.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        src, dst, _, _ = self.edge_arrays(direction)
+        visited = np.zeros(len(self), dtype=bool)
+        visited[rows] = True
+        frontier = visited.copy()
+        depth_of = np.zeros(len(self), dtype=np.int64)
+        for depth in range(1, k + 1):
+            # One vectorised step over the edge list: nodes reached from the frontier
+            reached = np.zeros(len(self), dtype=bool)
+            reached[dst[frontier[src]]] = True
+            frontier = reached & ~visited
+            if not frontier.any():
+                break
+            visited |= frontier
+            depth_of[frontier] = depth
+        found = np.flatnonzero(depth_of)
+        return found, depth_of[found]
+
+    def reach_mask(self, rows: np.ndarray, k: int = 1, direction: str = "out") -> np.ndarray:
+        """
+        Boolean mask of the nodes within k hops of `rows` (excluding `rows`).
+        Reads the precomputed bitsets when they cover k, else traverses.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        mask = np.zeros(len(self), dtype=bool)
+        if not len(rows) or k <= 0:
+            return mask
+        bits = self.reach_bits.get(direction)
+        if bits is not None and k <= self.reach_depth:
+            mask = np.unpackbits(np.bitwise_or.reduce(bits[k - 1, rows], axis=0), count=len(self)).astype(bool)
+            mask[rows] = False
+            return mask
+        found, _ = self.k_hop_rows(rows, k, direction)
+        mask[found] = True
+        return mask
+
+    def depends_on(self, node_id: str, depth: int = REACH_DEPTH) -> List[str]:
+        """
+        Articles transitively cited by `node_id` within `depth` hops.
+        """
+        mask = self.reach_mask(np.array([self._index[node_id]]), depth, "out")
+        return [str(nid) for nid in self.node_ids[mask]]
+
+    def k_hop(self, node_ids: List[str], k: int = 1, direction: str = "out") -> Dict[str, int]:
+        """
+        Nodes within k hops of `node_ids` (excluding them), mapped to their hop
+        distance. `direction` is "out" (cites), "in" (cited by) or "both".
+        """
+        rows = np.array([self._index[nid] for nid in node_ids if nid in self._index], dtype=np.int64)
+        found, depths = self.k_hop_rows(rows, k, direction)
+        return {str(nid): int(d) for nid, d in zip(self.node_ids[found], depths, strict=True)}
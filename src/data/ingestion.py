@@ -1,3 +1,4 @@
+import argparse
 import json
 import logging
 from pathlib import Path
@@ -10,7 +11,11 @@ import tiktoken
 from dotenv import load_dotenv
 import os
 
+from src.data.batch_embedder import BATCH_SIZE, BatchEmbedder
 from src.data.chunking import RegulationChunker
+from src.data.ingestion_manifest import IngestionManifest, log_plan
+from src.retrieval.bm25_index import BM25_DIR, BM25Index
+from src.retrieval.vector_backends import VECTOR_INDEX_DIR, NumpyBackend
 from src.utils.cost_tracker import estimate_cost
 
 # Load env for API keys
@@ -25,6 +30,7 @@ CHROMA_DIR = Path("data/chroma")
 
 class VectorStoreManager:
     def __init__(self, collection_name: str = "eu_ai_gdpr_rules"):
+        self.collection_name = collection_name
         self.chroma_client = chromadb.PersistentClient(
             path=str(CHROMA_DIR),
             settings=Settings(allow_reset=True, anonymized_telemetry=False)
@@ -70,12 +76,15 @@ class VectorStoreManager:
         logger.info(f"Total articles loaded: {len(all_articles)}")
         return all_articles
         
-    def process_and_ingest(self):
+    def process_and_ingest(self, full: bool = False) -> Dict[str, int]:
+        """
+        Incremental by default (see IngestionManifest); `full=True` re-upserts every chunk.
+        """
         # 1. Load Data
         articles = self.load_processed_data()
         if not articles:
             logger.error("No articles found to ingest.")
-            return
+            return {}
 
         # 2. Chunk Data
         logger.info("Chunking articles...")
@@ -91,31 +100,50 @@ class VectorStoreManager:
         # cost = estimate_cost(total_text, "text-embedding-3-small", "input")
         # logger.info(f"Estimated Embedding Cost: ${cost:.5f}")
         
-        # 4. Prepare Batch Ingestion
-        # ChromaDB Upsert requires lists of ids, documents, metadatas
-        ids = [c['id'] for c in chunks]
-        documents = [c['text'] for c in chunks]
-        metadatas = [c['metadata'] for c in chunks]
+        # 4. Diff against last ingested state
+        manifest = IngestionManifest(self.collection_name)
+        if not full and self.collection.count() != len(manifest.hashes):
+            logger.warning("Collection does not match manifest. Falling back to full ingestion.")
+            full = True
+        plan = manifest.plan(chunks)
+        if full:
+            plan["changed"] += plan["unchanged"]
+            plan["unchanged"] = []
+        log_plan(plan)
         
-        # Batch size (limit to prevent timeout/payload issues)
-        BATCH_SIZE = 100
+        # 5. Concurrent, rate-limited embedding + upsert
+        to_upsert = set(plan["added"]) | set(plan["changed"])
+        pending = [c for c in chunks if c['id'] in to_upsert]
         
         logger.info("Starting ingestion...")
-        for i in range(0, len(chunks), BATCH_SIZE):
-            batch_ids = ids[i:i+BATCH_SIZE]
-            batch_docs = documents[i:i+BATCH_SIZE]
-            batch_meta = metadatas[i:i+BATCH_SIZE]
+        BatchEmbedder(self.embedding_fn).upsert(self.collection, pending)
             
-            self.collection.upsert(
-                ids=batch_ids,
-                documents=batch_docs,
-                metadatas=batch_meta
-            )
-            print(f"Ingested batch {i // BATCH_SIZE + 1} / {len(chunks) // BATCH_SIZE + 1}", end="\r")
+        if plan["removed"]:
+            for i in range(0, len(plan["removed"]), BATCH_SIZE):
+                self.collection.delete(ids=plan["removed"][i:i+BATCH_SIZE])
+            
+        manifest.save(chunks)
+        
+        # 6. Keyword index for HybridRetriever (rebuilt when the corpus changed)
+        index_path = BM25_DIR / self.collection_name
+        if plan["added"] or plan["changed"] or plan["removed"] or not BM25Index.exists(index_path):
+            logger.info("Building BM25 index...")
+            all_docs = self.collection.get(include=["documents"])
+            BM25Index.build(all_docs['ids'], all_docs['documents']).save(index_path)
+            
+        # 7. Refresh the numpy vector index if one is in use
+        vector_path = VECTOR_INDEX_DIR / self.collection_name
+        if NumpyBackend.exists(vector_path) and (plan["added"] or plan["changed"] or plan["removed"]):
+            NumpyBackend.build(self.collection, vector_path)
             
         logger.info("\nIngestion Complete!")
         logger.info(f"Collection count: {self.collection.count()}")
+        return {k: len(v) for k, v in plan.items()}
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest regulation chunks into ChromaDB")
+    parser.add_argument("--full", action="store_true", help="Re-embed every chunk instead of only changed ones")
+    args = parser.parse_args()
+    
     manager = VectorStoreManager()
-    manager.process_and_ingest()
+    manager.process_and_ingest(full=args.full)
@@ -0,0 +1,67 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import List, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DIR = Path("data/manifests")
+
+def chunk_hash(chunk: Dict[str, Any]) -> str:
+    """Content hash over a chunk's text and metadata."""
+    payload = json.dumps(
+        {"text": chunk['text'], "metadata": chunk['metadata']},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class IngestionManifest:
+    """
+    Records {chunk_id: content_hash} of the last successful ingestion of a
+    collection, so re-ingestion only upserts new/changed chunks and deletes
+    chunk ids that disappeared.
+    """
+    def __init__(self, collection_name: str, manifest_dir: Path = MANIFEST_DIR):
+        self.path = Path(manifest_dir) / f"{collection_name}.json"
+        self.hashes: Dict[str, str] = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.hashes = json.load(f).get("chunks", {})
+
+    def plan(self, chunks: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+        """
+        Compares chunks against the manifest.
+        Returns chunk ids grouped as added / changed / removed / unchanged.
+        """
+        plan = {"added": [], "changed": [], "removed": [], "unchanged": []}
+        current = set()
+        for chunk in chunks:
+            chunk_id = chunk['id']
+            current.add(chunk_id)
+            previous = self.hashes.get(chunk_id)
+            if previous is None:
+                plan["added"].append(chunk_id)
+            elif previous != chunk_hash(chunk):
+                plan["changed"].append(chunk_id)
+            else:
+                plan["unchanged"].append(chunk_id)
+        plan["removed"] = [cid for cid in self.hashes if cid not in current]
+        return plan
+
+    def save(self, chunks: List[Dict[str, Any]]):
+        self.hashes = {c['id']: chunk_hash(c) for c in chunks}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"chunks": self.hashes}, f)
+        tmp_path.replace(self.path)
+        logger.info(f"Manifest written: {self.path} ({len(self.hashes)} chunks)")
+
+def log_plan(plan: Dict[str, List[str]]):
+    logger.info(
+        "Ingestion plan: "
+        + ", ".join(f"{len(plan[k])} {k}" for k in ("added", "changed", "removed", "unchanged"))
+    )
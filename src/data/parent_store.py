@@ -0,0 +1,66 @@
+import json
+import logging
+import mmap
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+PARENT_STORE_DIR = Path("data/parent_store")
+
+class ParentStore:
+    """
+    Read-only store of full article texts keyed by `article_id`.
+
+    Layout:
+    - texts.bin   UTF-8 texts, concatenated (memory-mapped on load)
+    - index.json  {article_id: [byte_offset, byte_length]}
+
+    Chunks only carry `article_id`; the retriever resolves the parent text here
+    after deduplicating hits, so each article is stored (and read) once.
+    """
+    def __init__(self, path: Path = PARENT_STORE_DIR):
+        self.path = Path(path)
+        with open(self.path / "index.json", "r", encoding="utf-8") as f:
+            self.index: Dict[str, List[int]] = json.load(f)
+        self._file = open(self.path / "texts.bin", "rb")
+        # mmap cannot map an empty file
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.index else b""
+
+    @staticmethod
+    def exists(path: Path = PARENT_STORE_DIR) -> bool:
+        return (Path(path) / "index.json").exists()
+
+    @staticmethod
+    def build(articles: List[Dict[str, Any]], path: Path = PARENT_STORE_DIR):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        index = {}
+        offset = 0
+        with open(path / "texts.bin.tmp", "wb") as f:
+            for art in articles:
+                article_id = art.get('id')
+                if not article_id or article_id in index:
+                    continue
+                data = art.get('full_text', '').encode("utf-8")
+                f.write(data)
+                index[article_id] = [offset, len(data)]
+                offset += len(data)
+        with open(path / "index.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        (path / "texts.bin.tmp").replace(path / "texts.bin")
+        (path / "index.json.tmp").replace(path / "index.json")
+        logger.info(f"Parent store written: {path} ({len(index)} articles, {offset / 1e6:.1f} MB)")
+
+    def get(self, article_id: str) -> Optional[str]:
+        entry = self.index.get(article_id)
+        if entry is None:
+            return None
+        offset, length = entry
+        return self._data[offset:offset + length].decode("utf-8")
+
+    def __contains__(self, article_id: str) -> bool:
+        return article_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
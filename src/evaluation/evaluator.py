@@ -1,13 +1,12 @@
 import json
 import logging
 import os
-import time
 from typing import List, Dict, Any
 from pathlib import Path
 from dotenv import load_dotenv
-from google import genai
 
 from src.generation.generator import RAGGenerator
+from src.utils.llm_gateway import get_gateway
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
@@ -19,7 +18,7 @@ class RAGEvaluator:
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY not found")
         
-        self.client = genai.Client(api_key=self.api_key)
+        self.llm = get_gateway(self.api_key)
         self.generator = RAGGenerator()
         self.golden_set_path = Path("data/golden_qa/compliance_test_set.json")
         
@@ -59,27 +58,14 @@ class RAGEvaluator:
         """
         
         try:
-            # Retry logic for Judge
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    # Rate limit safety
-                    time.sleep(2.0) # Increased sleep
-                    
-                    response = self.client.models.generate_content(
-                        model='gemini-2.0-flash-lite-preview-02-05',
-                        contents=prompt,
-                        config={'response_mime_type': 'application/json'}
-                    )
-                    return json.loads(response.text)
-                except Exception as e:
-                    if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                         if attempt < max_retries - 1:
-                            sleep_time = (attempt + 1) * 5
-                            logger.warning(f"Judge Rate Limit. Retrying in {sleep_time}s...")
-                            time.sleep(sleep_time)
-                            continue
-                    raise e
+            # Pacing and retries are handled by the shared gateway
+            response = self.llm.generate_content(
+                model='gemini-2.0-flash-lite-preview-02-05',
+                contents=prompt,
+                config={'response_mime_type': 'application/json'},
+                component="judge"
+            )
+            return json.loads(response.text)
                     
         except Exception as e:
             logger.error(f"Evaluation failed: {e}")
@@ -0,0 +1,133 @@
+import logging
+import os
+from functools import lru_cache
+from typing import List, Dict, Any, Set, Tuple
+
+import numpy as np
+
+from src.retrieval.bm25_index import BM25Index
+from src.utils.cost_tracker import get_encoding
+from src.utils.rate_limiter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Max tokens of retrieved text in the prompt (0 = no limit)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+TOKENIZER_MODEL = "gpt-4o" # Close enough to Gemini's tokenizer for budgeting
+DOC_RANK_WEIGHT = 0.3 # Relevance bonus of the first retrieved article (decays as 1 / (rank + 1))
+LEAD_PARAGRAPH_BONUS = 0.2 # Opening paragraphs usually state the article's subject
+OMISSION_MARKER = "[...]"
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        return get_encoding(TOKENIZER_MODEL)
+    except Exception as e: # BPE table not downloadable (e.g. offline)
+        logger.warning(f"Tokenizer unavailable ({e}). Estimating tokens from length.")
+        return None
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    return len(encoding.encode(text)) if encoding is not None else estimate_tokens(text)
+
+# Paragraphs of popular articles recur across requests
+paragraph_tokens = lru_cache(maxsize=8192)(count_tokens)
+
+def article_header(doc: Dict[str, Any]) -> str:
+    return f"--- [Article {doc['metadata']['article_number']}] {doc['metadata']['title']} ---"
+
+def build_context(docs: List[Dict[str, Any]]) -> str:
+    """
+    Unpacked context: every article in full under its header.
+    """
+    return "\n\n".join([f"{article_header(d)}\n{d['text']}" for d in docs])
+
+class ContextPacker:
+    """
+    Fits the retrieved articles into a token budget.
+
+    Every article keeps its header (so citations still resolve); the budget left
+    after the headers is filled with the paragraphs that score highest for the
+    query: BM25 over the candidate paragraphs (normalised to [0, 1]), plus small
+    priors for the article's retrieval rank and for lead paragraphs. Kept paragraphs are emitted in
+    their original order, with OMISSION_MARKER where text was dropped.
+
+    Headers, separators and omission markers count against the budget; the
+    packed text is measured as a whole and trimmed (lowest-scoring paragraphs
+    first) until it fits, since token counts of parts do not add up exactly.
+    """
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+
+    @staticmethod
+    def _paragraphs(text: str) -> List[str]:
+        return [p.strip() for p in text.split('\n') if p.strip()]
+
+    def pack(self, query: str, docs: List[Dict[str, Any]]) -> str:
+        full = build_context(docs)
+        if self.token_budget <= 0 or not docs:
+            return full
+        full_tokens = count_tokens(full)
+        if full_tokens <= self.token_budget:
+            logger.info(f"Context: {full_tokens} tokens (within budget {self.token_budget})")
+            return full
+
+        headers = [article_header(d) for d in docs]
+        # Headers with their section separators, and one omission marker per article
+        remaining = self.token_budget - count_tokens("\n\n".join(f"{h}\n{OMISSION_MARKER}" for h in headers))
+
+        # (doc index, paragraph index, text) for every candidate paragraph
+        candidates = [
+            (d, p, para)
+            for d, doc in enumerate(docs)
+            for p, para in enumerate(self._paragraphs(doc['text']))
+        ]
+        if not candidates:
+            return full
+
+        bm25 = BM25Index.build([str(i) for i in range(len(candidates))], [c[2] for c in candidates])
+        scores = np.zeros(len(candidates))
+        for idx, score in bm25.top_k(query, len(candidates)):
+            scores[idx] = score
+        if scores.max() > 0:
+            scores /= scores.max()
+        scores += np.array([DOC_RANK_WEIGHT / (d + 1) + (LEAD_PARAGRAPH_BONUS if p == 0 else 0.0) for d, p, _ in candidates])
+
+        selected = []
+        for idx in np.argsort(-scores, kind="stable"):
+            tokens = paragraph_tokens(candidates[idx][2]) + 1 # + line separator
+            if tokens > remaining:
+                continue # A shorter paragraph may still fit
+            selected.append(int(idx))
+            remaining -= tokens
+
+        # Enforce the cap on the rendered text; `selected` is in descending score order
+        packed = self._render(headers, candidates, set(selected))
+        packed_tokens = count_tokens(packed)
+        while packed_tokens > self.token_budget and selected:
+            selected.pop()
+            packed = self._render(headers, candidates, set(selected))
+            packed_tokens = count_tokens(packed)
+
+        logger.info(
+            f"Context packed: {full_tokens} -> {packed_tokens} tokens "
+            f"(budget {self.token_budget}, {len(selected)}/{len(candidates)} paragraphs)"
+        )
+        return packed
+
+    @staticmethod
+    def _render(headers: List[str], candidates: List[Tuple[int, int, str]], selected: Set[int]) -> str:
+        sections = []
+        cursor = 0
+        for d, header in enumerate(headers):
+            lines, omitted = [header], False
+            while cursor < len(candidates) and candidates[cursor][0] == d:
+                if cursor in selected:
+                    lines.append(candidates[cursor][2])
+                    omitted = False
+                elif not omitted:
+                    lines.append(OMISSION_MARKER)
+                    omitted = True
+                cursor += 1
+            sections.append("\n".join(lines))
+        return "\n\n".join(sections)
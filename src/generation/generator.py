@@ -1,56 +1,66 @@
 import os
+import asyncio
+import json
 import logging
-import time
+import re
 from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
-from google import genai
 from google.genai import types
 
 from src.retrieval.parent_child_retriever import ParentChildRetriever
-from src.generation.prompts import LEGAL_SYSTEM_PROMPT, USER_PROMPT_TEMPLATE, CROSS_REGULATION_SYSTEM_PROMPT
+from src.generation.prompts import USER_PROMPT_TEMPLATE, CROSS_REGULATION_SYSTEM_PROMPT
+from src.generation.semantic_cache import SemanticCache
+from src.generation.context_packer import CONTEXT_TOKEN_BUDGET, ContextPacker
+from src.utils.deadline import degraded_stages, stage_allowed
+from src.utils.llm_gateway import get_gateway
+from src.utils.tracing import incr, span
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+GENERATION_MODEL = 'gemini-2.0-flash-lite-preview-02-05'
+
+# Semantic answer cache (paraphrased queries reuse a previous answer)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1024"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH") # e.g. data/cache/semantic_cache.sqlite
+REPLAY_WORDS_PER_TOKEN = 4 # Words per NDJSON token event when replaying a cached answer
+UNSCORED_CONFIDENCE = 85 # Reported when no confidence pass ran (streams, deadline-degraded answers)
+
 class RAGGenerator:
     def __init__(self):
         self.api_key = os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY not found")
         
-        self.client = genai.Client(api_key=self.api_key)
+        # Shared, rate-limited client (retries transient errors itself)
+        self.llm = get_gateway(self.api_key)
         
         # PHASE 2: Parent-Child Retrieval (Full Context)
         logger.info("Initializing RAG Pipeline (Phase 2: Parent-Child + CoT)...")
         self.retriever = ParentChildRetriever() 
         
-    def generate_answer(self, query: str, regulation_filter: Optional[str] = None) -> Dict[str, Any]:
-        """
-        Retrieves context and generates an answer using Gemini.
-        """
-        try:
-            # 1. Retrieve (Get Full Parent Articles)
-            logger.info(f"Retrieving context for: {query} (Filter: {regulation_filter})")
-            docs = self.retriever.retrieve(query, k=5, regulation_filter=regulation_filter)
-            
-            if not docs:
-                return {
-                    "answer": "I found no relevant documents to answer this question.",
-                    "context": []
-                }
-                
-            # 2. Prepare Context String
-            # Now we have full articles, so the context is richer.
-            context_str = "\n\n".join([
-                f"--- [Article {d['metadata']['article_number']}] {d['metadata']['title']} ---\n{d['text']}" 
-                for d in docs
-            ])
-            
-            # 3. Generate with System Prompt & Confidence
-            logger.info("Generating answer with Confidence Score...")
-            
-            # Updated Prompt to ask for Confidence
-            final_prompt = f"""
+        self.cache = None
+        if SEMANTIC_CACHE_ENABLED:
+            self.cache = SemanticCache(
+                threshold=SEMANTIC_CACHE_THRESHOLD,
+                max_size=SEMANTIC_CACHE_SIZE,
+                ttl_seconds=SEMANTIC_CACHE_TTL,
+                disk_path=SEMANTIC_CACHE_PATH
+            )
+        
+        self.packer = ContextPacker(token_budget=CONTEXT_TOKEN_BUDGET)
+
+    def _build_context(self, query: str, docs: List[Dict[str, Any]]) -> str:
+        # Highest-value paragraphs within CONTEXT_TOKEN_BUDGET, article headers kept
+        return self.packer.pack(query, docs)
+
+    @staticmethod
+    def _json_prompt(query: str) -> str:
+        # Updated Prompt to ask for Confidence
+        return f"""
             {USER_PROMPT_TEMPLATE.format(query=query)}
             
             ---------------------
@@ -66,67 +76,252 @@ class RAGGenerator:
                 "reasoning": "brief explanation of why you are confident or not"
             }}
             """
+
+    @staticmethod
+    def _stream_prompt(query: str) -> str:
+        return f"""
+            {USER_PROMPT_TEMPLATE.format(query=query)}
             
-            # Add delay to avoid rate limits
-            time.sleep(1.0)
-            
-            response = self.client.models.generate_content(
-                model='gemini-2.0-flash-lite-preview-02-05',
-                config=types.GenerateContentConfig(
-                    system_instruction=CROSS_REGULATION_SYSTEM_PROMPT.format(context=context_str),
-                    temperature=0.1, # Lower temp for JSON stability
-                    response_mime_type="application/json"
-                ),
-                contents=final_prompt
-            )
+            Based on the context, answer the user's question directly and concisely.
+            Do not include JSON formatting in your output, just the text answer.
+            """
+
+    @staticmethod
+    def _json_config(context_str: str) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            system_instruction=CROSS_REGULATION_SYSTEM_PROMPT.format(context=context_str),
+            temperature=0.1, # Lower temp for JSON stability
+            response_mime_type="application/json"
+        )
+
+    @staticmethod
+    def _stream_config(context_str: str) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            system_instruction=CROSS_REGULATION_SYSTEM_PROMPT.format(context=context_str),
+            temperature=0.3,
+        )
+
+    def _parse_json_answer(self, response_text: str, docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        try:
+            data = json.loads(response_text)
+        except json.JSONDecodeError:
+            return {
+                "answer": response_text, 
+                "confidence": 0, 
+                "context": docs
+            }
             
-            import json
-            try:
-                data = json.loads(response.text)
-                answer = data.get("answer", "Error parsing answer")
-                confidence = data.get("confidence_score", 0)
-                
-                # REFUSAL MECHANISM
-                if confidence < 60:
-                     answer = f"I am not confident enough to answer this question based on the available legal texts (Confidence: {confidence}%). Please consult a legal professional."
-                
-                # Get Graph Data for Visualization
-                node_ids = [d.get('node_id') for d in docs if d.get('node_id')]
-                graph_data = self.retriever.get_subgraph_for_nodes(node_ids)
+        answer = data.get("answer", "Error parsing answer")
+        confidence = data.get("confidence_score", 0)
+        
+        # REFUSAL MECHANISM
+        if confidence < 60:
+             answer = f"I am not confident enough to answer this question based on the available legal texts (Confidence: {confidence}%). Please consult a legal professional."
+        
+        # Get Graph Data for Visualization
+        node_ids = [d.get('node_id') for d in docs if d.get('node_id')]
+        graph_data = self.retriever.get_subgraph_for_nodes(node_ids)
 
+        return {
+            "answer": answer,
+            "confidence": confidence,
+            "context": docs,
+            "graph_data": graph_data,
+            "raw_response": data
+        }
+
+    def _plain_answer(self, response_text: str, docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # Answer without the JSON confidence pass (request deadline too close)
+        node_ids = [d.get('node_id') for d in docs if d.get('node_id')]
+        return {
+            "answer": response_text,
+            "confidence": UNSCORED_CONFIDENCE,
+            "context": docs,
+            "graph_data": self.retriever.get_subgraph_for_nodes(node_ids)
+        }
+
+    def _stream_metadata(self, docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        node_ids = [d.get('node_id') for d in docs if d.get('node_id')]
+        metadata = {
+            "type": "metadata",
+            "confidence": UNSCORED_CONFIDENCE, # Placeholder or calc separately
+            "context": docs,
+            "graph_data": self.retriever.get_subgraph_for_nodes(node_ids)
+        }
+        degraded = degraded_stages()
+        if degraded:
+            metadata["degraded"] = degraded
+        return metadata
+
+    @staticmethod
+    def _with_degraded(result: Dict[str, Any]) -> Dict[str, Any]:
+        # Stages the request deadline skipped or cut short
+        degraded = degraded_stages()
+        if degraded:
+            result["degraded"] = degraded
+        return result
+
+    @staticmethod
+    def _is_cacheable(result: Dict[str, Any]) -> bool:
+        # Only successful, fully-formed answers (errors/no-docs paths lack graph_data),
+        # and never one that was degraded to meet a deadline
+        return "graph_data" in result and bool(result.get("context")) and not result.get("degraded")
+
+    @staticmethod
+    def _replay_events(cached: Dict[str, Any]):
+        """
+        Yields the NDJSON events of a cached answer: metadata first, then the
+        answer text as a sequence of token events.
+        """
+        yield json.dumps({
+            "type": "metadata",
+            "confidence": cached.get("confidence", 0),
+            "context": cached.get("context", []),
+            "graph_data": cached.get("graph_data", {"nodes": [], "edges": []})
+        }) + "\n"
+        words = re.findall(r'\S+\s*', cached.get("answer", ""))
+        for i in range(0, len(words), REPLAY_WORDS_PER_TOKEN):
+            yield json.dumps({
+                "type": "token",
+                "content": "".join(words[i:i + REPLAY_WORDS_PER_TOKEN])
+            }) + "\n"
+
+    def _cache_lookup(self, query_embedding, regulation_filter: Optional[str], stream: bool = False) -> Optional[Dict[str, Any]]:
+        # Streams may replay scored answers; JSON answers never reuse unscored streamed text
+        modes = ("json", "stream") if stream else ("json",)
+        with span("semantic_cache"):
+            cached = self.cache.lookup(query_embedding, regulation_filter, modes)
+        incr("semantic_cache_lookups", result="hit" if cached else "miss")
+        return cached
+
+    def generate_answer(self, query: str, regulation_filter: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Retrieves context and generates an answer using Gemini.
+        """
+        docs = []
+        try:
+            # 0. Explicit article references skip embedding, cache and vector search
+            query_embedding = None
+            with span("article_lookup"):
+                docs = self.retriever.lookup_articles(query, regulation_filter) or []
+            if not docs:
+                # Semantic Cache
+                with span("embed_query"):
+                    query_embedding = self.retriever.embed_query(query)
+                if self.cache:
+                    cached = self._cache_lookup(query_embedding, regulation_filter)
+                    if cached:
+                        return cached
+                
+                # 1. Retrieve (Get Full Parent Articles)
+                logger.info(f"Retrieving context for: {query} (Filter: {regulation_filter})")
+                with span("retrieve"):
+                    docs = self.retriever.retrieve(query, k=5, regulation_filter=regulation_filter, query_embedding=query_embedding)
+            
+            if not docs:
                 return {
-                    "answer": answer,
-                    "confidence": confidence,
-                    "context": docs,
-                    "graph_data": graph_data,
-                    "raw_response": data
-                }
-            except json.JSONDecodeError:
-                return {
-                    "answer": response.text, 
-                    "confidence": 0, 
-                    "context": docs
+                    "answer": "I found no relevant documents to answer this question.",
+                    "context": []
                 }
+                
+            # 2. Prepare Context String
+            # Now we have full articles, so the context is richer.
+            with span("pack_context"):
+                context_str = self._build_context(query, docs)
+            
+            # 3. Generate with System Prompt & Confidence (plain answer if the deadline is close)
+            if stage_allowed("confidence"):
+                logger.info("Generating answer with Confidence Score...")
+                final_prompt = self._json_prompt(query)
+                
+                with span("generate"):
+                    response = self.llm.generate_content(
+                        model=GENERATION_MODEL,
+                        config=self._json_config(context_str),
+                        contents=final_prompt,
+                        component="generation"
+                    )
+                with span("parse_answer"):
+                    result = self._parse_json_answer(response.text, docs)
+            else:
+                with span("generate"):
+                    response = self.llm.generate_content(
+                        model=GENERATION_MODEL,
+                        config=self._stream_config(context_str),
+                        contents=self._stream_prompt(query),
+                        component="generation_plain"
+                    )
+                result = self._plain_answer(response.text, docs)
+            result = self._with_degraded(result)
+            if self.cache and query_embedding is not None and self._is_cacheable(result):
+                self.cache.store(query, query_embedding, regulation_filter, result)
+            return result
             
         except Exception as e:
             logger.error(f"Generation failed: {e}")
-            if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                logger.warning("Rate limit hit, retrying once...")
-                time.sleep(10)
-                try:
-                    # Simple retry of the same call
-                    response = self.client.models.generate_content(
-                        model='gemini-2.0-flash-lite-preview-02-05',
-                        config=types.GenerateContentConfig(
-                            system_instruction=LEGAL_SYSTEM_PROMPT.format(context=context_str),
-                            temperature=0.3 
-                        ),
-                        contents=final_prompt
+            return {"answer": f"Error generating answer: {e}", "context": docs}
+
+    async def agenerate_answer(self, query: str, regulation_filter: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Async variant of `generate_answer` for the serving layer.
+        Retrieval and generation await the async Gemini client, so concurrent
+        requests overlap their I/O instead of blocking the event loop.
+        """
+        docs = []
+        try:
+            query_embedding = None
+            with span("article_lookup"):
+                docs = self.retriever.lookup_articles(query, regulation_filter) or []
+            if not docs:
+                with span("embed_query"):
+                    query_embedding = await self.retriever.aembed_query(query)
+                if self.cache:
+                    cached = await asyncio.to_thread(self._cache_lookup, query_embedding, regulation_filter) # SQLite tier
+                    if cached:
+                        return cached
+                
+                logger.info(f"Retrieving context for: {query} (Filter: {regulation_filter})")
+                with span("retrieve"):
+                    docs = await self.retriever.aretrieve(query, k=5, regulation_filter=regulation_filter, query_embedding=query_embedding)
+            
+            if not docs:
+                return {
+                    "answer": "I found no relevant documents to answer this question.",
+                    "context": []
+                }
+                
+            with span("pack_context"):
+                context_str = self._build_context(query, docs)
+            
+            if stage_allowed("confidence"):
+                logger.info("Generating answer with Confidence Score...")
+                final_prompt = self._json_prompt(query)
+                
+                with span("generate"):
+                    response = await self.llm.agenerate_content(
+                        model=GENERATION_MODEL,
+                        config=self._json_config(context_str),
+                        contents=final_prompt,
+                        component="generation"
+                    )
+                with span("parse_answer"):
+                    result = self._parse_json_answer(response.text, docs)
+            else:
+                with span("generate"):
+                    response = await self.llm.agenerate_content(
+                        model=GENERATION_MODEL,
+                        config=self._stream_config(context_str),
+                        contents=self._stream_prompt(query),
+                        component="generation_plain"
                     )
-                    return {"answer": response.text, "context": docs}
-                except Exception as e2:
-                    return {"answer": f"Error generating answer after retry: {e2}", "context": docs}
+                result = self._plain_answer(response.text, docs)
+            result = self._with_degraded(result)
+            if self.cache and query_embedding is not None and self._is_cacheable(result):
+                await asyncio.to_thread(self.cache.store, query, query_embedding, regulation_filter, result)
+            return result
             
+        except Exception as e:
+            logger.error(f"Generation failed: {e}")
             return {"answer": f"Error generating answer: {e}", "context": docs}
 
     def generate_answer_stream(self, query: str, regulation_filter: Optional[str] = None):
@@ -137,52 +332,111 @@ class RAGGenerator:
         - {"type": "metadata", "context": [...], "graph_data": ..., "confidence": ...}
         """
         try:
-            # 1. Retrieve
-            logger.info(f"Retrieving context for: {query} (Filter: {regulation_filter})")
-            docs = self.retriever.retrieve(query, k=5, regulation_filter=regulation_filter)
+            # 0. Article lookup fast path, then Semantic Cache (replayed as a token stream)
+            query_embedding = None
+            with span("article_lookup"):
+                docs = self.retriever.lookup_articles(query, regulation_filter) or []
+            if not docs:
+                with span("embed_query"):
+                    query_embedding = self.retriever.embed_query(query)
+                if self.cache:
+                    cached = self._cache_lookup(query_embedding, regulation_filter, stream=True)
+                    if cached:
+                        yield from self._replay_events(cached)
+                        return
+                
+                # 1. Retrieve
+                logger.info(f"Retrieving context for: {query} (Filter: {regulation_filter})")
+                with span("retrieve"):
+                    docs = self.retriever.retrieve(query, k=5, regulation_filter=regulation_filter, query_embedding=query_embedding)
             
             # 2. Context
-            context_str = "\n\n".join([
-                f"--- [Article {d['metadata']['article_number']}] {d['metadata']['title']} ---\n{d['text']}" 
-                for d in docs
-            ]) if docs else "No relevant documents found."
+            with span("pack_context"):
+                context_str = self._build_context(query, docs) if docs else "No relevant documents found."
 
             # 3. Stream Answer
-            prompt = f"""
-            {USER_PROMPT_TEMPLATE.format(query=query)}
+            prompt = self._stream_prompt(query)
             
-            Based on the context, answer the user's question directly and concisely.
-            Do not include JSON formatting in your output, just the text answer.
-            """
+            # Send Metadata First (so UI can render graph while text streams)
+            with span("graph_metadata"):
+                metadata = self._stream_metadata(docs)
+            yield json.dumps(metadata) + "\n"
+
+            with span("generate"):
+                response = self.llm.generate_content_stream(
+                    model=GENERATION_MODEL,
+                    config=self._stream_config(context_str),
+                    contents=prompt,
+                    component="generation_stream"
+                )
+                
+                tokens = []
+                for chunk in response:
+                    if chunk.text:
+                        tokens.append(chunk.text)
+                        yield json.dumps({
+                            "type": "token",
+                            "content": chunk.text
+                        }) + "\n"
             
-            # Start Graph Data Prep (Async-ish)
-            node_ids = [d.get('node_id') for d in docs if d.get('node_id')]
-            graph_data = self.retriever.get_subgraph_for_nodes(node_ids)
+            result = {"answer": "".join(tokens), **{k: v for k, v in metadata.items() if k != "type"}}
+            if self.cache and query_embedding is not None and tokens and self._is_cacheable(result):
+                self.cache.store(query, query_embedding, regulation_filter, result, mode="stream")
+                    
+        except Exception as e:
+            logger.error(f"Streaming failed: {e}")
+            yield json.dumps({"type": "error", "content": str(e)}) + "\n"
+
+    async def agenerate_answer_stream(self, query: str, regulation_filter: Optional[str] = None):
+        """
+        Async generator variant of `generate_answer_stream` (same NDJSON events).
+        """
+        try:
+            query_embedding = None
+            with span("article_lookup"):
+                docs = self.retriever.lookup_articles(query, regulation_filter) or []
+            if not docs:
+                with span("embed_query"):
+                    query_embedding = await self.retriever.aembed_query(query)
+                if self.cache:
+                    cached = await asyncio.to_thread(self._cache_lookup, query_embedding, regulation_filter, True) # SQLite tier
+                    if cached:
+                        for event in self._replay_events(cached):
+                            yield event
+                        return
+                
+                logger.info(f"Retrieving context for: {query} (Filter: {regulation_filter})")
+                with span("retrieve"):
+                    docs = await self.retriever.aretrieve(query, k=5, regulation_filter=regulation_filter, query_embedding=query_embedding)
             
-            # Send Metadata First (so UI can render graph while text streams)
-            import json
-            yield json.dumps({
-                "type": "metadata",
-                "confidence": 85, # Placeholder or calc separately
-                "context": docs,
-                "graph_data": graph_data
-            }) + "\n"
+            with span("pack_context"):
+                context_str = self._build_context(query, docs) if docs else "No relevant documents found."
+            prompt = self._stream_prompt(query)
+            
+            with span("graph_metadata"):
+                metadata = self._stream_metadata(docs)
+            yield json.dumps(metadata) + "\n"
 
-            response = self.client.models.generate_content_stream(
-                model='gemini-2.0-flash-lite-preview-02-05',
-                config=types.GenerateContentConfig(
-                    system_instruction=CROSS_REGULATION_SYSTEM_PROMPT.format(context=context_str),
-                    temperature=0.3,
-                ),
-                contents=prompt
-            )
+            with span("generate"):
+                response = await self.llm.agenerate_content_stream(
+                    model=GENERATION_MODEL,
+                    config=self._stream_config(context_str),
+                    contents=prompt,
+                    component="generation_stream"
+                )
+                
+                tokens = []
+                async for chunk in response:
+                    if chunk.text:
+                        tokens.append(chunk.text)
+                        yield json.dumps({
+                            "type": "token",
+                            "content": chunk.text
+                        }) + "\n"
             
-            for chunk in response:
-                if chunk.text:
-                    yield json.dumps({
-                        "type": "token",
-                        "content": chunk.text
-                    }) + "\n"
+            result = {"answer": "".join(tokens), **{k: v for k, v in metadata.items() if k != "type"}}
+            if self.cache and query_embedding is not None and tokens and self._is_cacheable(result):
+                await asyncio.to_thread(self.cache.store, query, query_embedding, regulation_filter, result, "stream")
                     
         except Exception as e:
             logger.error(f"Streaming failed: {e}")
@@ -0,0 +1,220 @@
+import copy
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """
+    Answer cache keyed by query embedding.
+
+    A lookup is a hit when a cached query with the same regulation filter has
+    cosine similarity >= threshold to the new query. Entries live in a fixed-size
+    matrix (one row per slot) so a lookup is a single matmul.
+
+    Each entry records the `mode` that produced it ("json": scored by the
+    confidence pass, "stream": unscored streamed text); a lookup states which
+    modes it accepts. Entries are keyed by (mode, regulation, normalised query),
+    so storing the same query again replaces its entry instead of adding one.
+
+    - LRU eviction once `max_size` entries are held
+    - TTL expiry (`ttl_seconds`, 0 disables)
+    - Optional SQLite tier (`disk_path`) that is reloaded on restart and
+      mirrors evictions and expiries
+    """
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_size: int = 1024,
+        ttl_seconds: float = 86400,
+        disk_path: Optional[str] = None
+    ):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict() # key -> entry (LRU order)
+        self._slot_keys: List[Optional[str]] = [None] * max_size
+        self._slot_regulation: List[Optional[str]] = [None] * max_size
+        self._slot_mode: List[Optional[str]] = [None] * max_size
+        self._slot_created = np.zeros(max_size, dtype=np.float64)
+        self._valid = np.zeros(max_size, dtype=bool)
+        self._matrix = None # Allocated on first store (embedding dim unknown until then)
+
+        self._db = None
+        if disk_path:
+            Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, query TEXT, regulation TEXT, "
+                "embedding BLOB, result TEXT, created REAL, mode TEXT)"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(answers)")]
+            if "mode" not in columns: # Tables written before modes were recorded held unscored streamed answers too
+                self._db.execute("ALTER TABLE answers ADD COLUMN mode TEXT DEFAULT 'stream'")
+            self._db.commit()
+            self._load_from_disk()
+
+    @staticmethod
+    def _regulation_key(regulation_filter: Optional[str]) -> str:
+        return regulation_filter or ""
+
+    @staticmethod
+    def _entry_key(query: str, regulation: str, mode: str) -> str:
+        # Case-folded, whitespace collapsed, trailing punctuation dropped
+        normalised = re.sub(r'\s+', ' ', query).strip().lower().rstrip('?!. ')
+        return hashlib.sha1(f"{mode}\x00{regulation}\x00{normalised}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalise(embedding) -> np.ndarray:
+        v = np.asarray(embedding, dtype=np.float32)
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    def _expired(self, created: float, now: float) -> bool:
+        return bool(self.ttl_seconds) and now - created > self.ttl_seconds
+
+    def _free_slot(self) -> int:
+        free = np.flatnonzero(~self._valid)
+        if len(free):
+            return int(free[0])
+        # Evict least recently used entry
+        key, evicted = self._entries.popitem(last=False)
+        slot = evicted["slot"]
+        self._valid[slot] = False
+        self._slot_keys[slot] = None
+        self._delete_rows([key])
+        return slot
+
+    def _delete_rows(self, keys: Iterable[str]):
+        if self._db is None:
+            return
+        try:
+            self._db.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key in keys])
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Semantic cache disk delete failed: {e}")
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._valid[entry["slot"]] = False
+            self._slot_keys[entry["slot"]] = None
+
+    def _insert(self, key: str, query: str, regulation: str, mode: str, vector: np.ndarray, result: Dict[str, Any], created: float):
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_size, len(vector)), dtype=np.float32)
+        self._drop(key)
+        slot = self._free_slot()
+        self._matrix[slot] = vector
+        self._slot_keys[slot] = key
+        self._slot_regulation[slot] = regulation
+        self._slot_mode[slot] = mode
+        self._slot_created[slot] = created
+        self._valid[slot] = True
+        self._entries[key] = {"slot": slot, "query": query, "result": result}
+
+    def lookup(self, query_embedding, regulation_filter: Optional[str] = None,
+               modes: Tuple[str, ...] = ("json",)) -> Optional[Dict[str, Any]]:
+        """
+        Returns a copy of the cached result for the most similar cached query
+        stored in one of `modes`, or None.
+        """
+        regulation = self._regulation_key(regulation_filter)
+        with self._lock:
+            if self._matrix is None or not self._valid.any():
+                self.misses += 1
+                return None
+
+            now = time.time()
+            sims = self._matrix @ self._normalise(query_embedding)
+            mask = self._valid & (sims >= self.threshold)
+
+            for slot in np.flatnonzero(mask)[np.argsort(-sims[mask])]:
+                if self._slot_regulation[slot] != regulation or self._slot_mode[slot] not in modes:
+                    continue
+                key = self._slot_keys[slot]
+                if self._expired(self._slot_created[slot], now):
+                    self._drop(key)
+                    self._delete_rows([key])
+                    continue
+
+                self._entries.move_to_end(key)
+                self.hits += 1
+                entry = self._entries[key]
+                logger.info(f"Semantic cache hit (sim={sims[slot]:.3f}): '{entry['query']}'")
+                result = copy.deepcopy(entry["result"])
+                result["cache_hit"] = True
+                return result
+
+            self.misses += 1
+            return None
+
+    def store(self, query: str, query_embedding, regulation_filter: Optional[str], result: Dict[str, Any],
+              mode: str = "json"):
+        """
+        Caches `result` (answer, confidence, context, graph_data) for this query.
+        """
+        regulation = self._regulation_key(regulation_filter)
+        vector = self._normalise(query_embedding)
+        result = copy.deepcopy(result)
+        key = self._entry_key(query, regulation, mode)
+        created = time.time()
+
+        with self._lock:
+            self._insert(key, query, regulation, mode, vector, result, created)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO answers (key, query, regulation, embedding, result, created, mode) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (key, query, regulation, vector.tobytes(), json.dumps(result), created, mode)
+                    )
+                    self._db.commit()
+                except (sqlite3.Error, TypeError, ValueError) as e:
+                    logger.warning(f"Semantic cache disk write failed: {e}")
+
+    def _load_from_disk(self):
+        now = time.time()
+        if self.ttl_seconds:
+            self._db.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl_seconds,))
+        # Rows beyond max_size would never be loaded again
+        self._db.execute(
+            "DELETE FROM answers WHERE key NOT IN (SELECT key FROM answers ORDER BY created DESC LIMIT ?)",
+            (self.max_size,)
+        )
+        self._db.commit()
+
+        rows = self._db.execute(
+            "SELECT key, query, regulation, mode, embedding, result, created FROM answers "
+            "ORDER BY created DESC"
+        ).fetchall()
+
+        # Oldest first so the newest end up most-recently-used
+        for key, query, regulation, mode, blob, result, created in reversed(rows):
+            self._insert(key, query, regulation, mode, np.frombuffer(blob, dtype=np.float32), json.loads(result), created)
+        logger.info(f"Semantic cache restored {len(rows)} entries from disk.")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
@@ -0,0 +1,164 @@
+import logging
+import re
+from typing import List, Dict, Any, Optional, Tuple
+
+from src.data.graph_store import CompactGraph
+
+logger = logging.getLogger(__name__)
+
+MAX_LOOKUP_ARTICLES = 5 # More explicit references than this are treated as a semantic query
+MAX_LOOKUP_CITATIONS = 3 # Cited articles added as context per lookup
+
+# A listed number only continues the reference if it is followed by what can follow
+# an article number: the end, punctuation, another list item or a regulation name
+# ("Articles 13 and 14 GDPR", but not the 20 in "Article 5 and 20 days")
+_LISTED_ARTICLE_END = (
+    r'(?=\s*(?:$|[^\w\s]|(?:and|or|of|in|under|gdpr|eu|ai|artificial|general|regulation'
+    r'|say|says|state|states|require|requires|cover|covers|mean|means)\b))'
+)
+# "Article 35", "Art. 6(2)", "Articles 13 and 14", "Art 5, 6 or 7"
+ARTICLE_PATTERN = re.compile(
+    r'\b(?:articles?|arts?\.?)\s+(\d+(?:\s*\(\w+\))*'
+    r'(?:\s*(?:,|and|or|&)\s*(?:arts?\.?\s*|articles?\s+)?\d+(?:\s*\(\w+\))*' + _LISTED_ARTICLE_END + r')*)',
+    re.IGNORECASE
+)
+ARTICLE_NUMBER = re.compile(r'(\d+)(?:\s*\(\w+\))*')
+# Words a pure lookup ("What does Article 35 GDPR say?", "Show me Art. 6") may contain
+# besides its references; anything else makes it a question that needs retrieval
+LOOKUP_WORDS = {
+    "what", "does", "do", "did", "say", "says", "said", "state", "states", "show", "me", "give",
+    "quote", "read", "print", "text", "full", "wording", "content", "contents", "of", "the", "in",
+    "is", "are", "a", "an", "and", "or", "please", "can", "you", "i", "see", "explain", "summarise",
+    "summarize", "summary", "about", "regulation", "eu"
+}
+REGULATION_PATTERNS = {
+    "GDPR": re.compile(r'\b(gdpr|general data protection regulation|regulation \(eu\) 2016/679)\b', re.IGNORECASE),
+    "EU_AI_Act": re.compile(r'\b((eu )?ai act|artificial intelligence act|regulation \(eu\) 2024/1689)\b', re.IGNORECASE),
+}
+
+def parse_article_refs(query: str) -> Tuple[List[str], List[str]]:
+    """
+    Extracts explicit article references and regulation mentions.
+    Returns (article_numbers, regulations), both in order of appearance;
+    paragraph/point suffixes ("6(2)(a)") resolve to the article ("6").
+    """
+    numbers = []
+    for match in ARTICLE_PATTERN.finditer(query):
+        for num in ARTICLE_NUMBER.findall(match.group(1)):
+            if num not in numbers:
+                numbers.append(num)
+    regulations = [reg for reg, pattern in REGULATION_PATTERNS.items() if pattern.search(query)]
+    return numbers, regulations
+
+def is_lookup_query(query: str) -> bool:
+    """
+    True if the query only asks for the articles it names: with the references
+    and regulation names removed, nothing but LOOKUP_WORDS is left.
+    """
+    rest = ARTICLE_PATTERN.sub(" ", query)
+    for pattern in REGULATION_PATTERNS.values():
+        rest = pattern.sub(" ", rest)
+    return all(word in LOOKUP_WORDS for word in re.findall(r'[a-z]+', rest.lower()))
+
+class ArticleLookup:
+    """
+    Fast path for queries that only ask for the articles they name ("What does
+    Article 35 GDPR say?").
+
+    References are resolved straight to knowledge-graph nodes (`GDPR_35`,
+    `EU_AI_Act_6`), which hold the full article text, and the articles they cite
+    are added as context from the graph edges. No embedding or LLM call is made.
+    Questions that merely mention an article ("Under Article 6 GDPR, when do I
+    need a DPIA?") and references that cannot be resolved to one regulation
+    go through semantic retrieval; the retriever merges resolvable references
+    into its results (`referenced`, `articles`).
+    """
+    def __init__(self, graph: CompactGraph):
+        self.graph = graph
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, query: str, regulation_filter: Optional[str] = None) -> Optional[List[str]]:
+        """
+        Returns the node ids referenced by the query, or None if the query is
+        not a pure article lookup (asks more than the article text, or its
+        references do not resolve, see `referenced`).
+        """
+        if not is_lookup_query(query):
+            return None
+        return self.referenced(query, regulation_filter)
+
+    def referenced(self, query: str, regulation_filter: Optional[str] = None) -> Optional[List[str]]:
+        """
+        Returns the node ids of the articles the query names, or None (no / too
+        many references, ambiguous or mixed regulations, unknown articles).
+        """
+        numbers, regulations = parse_article_refs(query)
+        if not numbers or len(numbers) > MAX_LOOKUP_ARTICLES:
+            return None
+
+        if regulation_filter and regulation_filter != "BOTH":
+            if regulations and regulations != [regulation_filter]:
+                return None # Query names another regulation than the filter
+            regulation = regulation_filter
+        elif len(regulations) == 1:
+            regulation = regulations[0]
+        else:
+            return None # "Article 6" alone exists in both; mixed queries need retrieval
+
+        node_ids = [f"{regulation}_{num}" for num in numbers]
+        if not all(self.graph.has_node(nid) for nid in node_ids):
+            return None
+        return node_ids
+
+    def lookup(self, query: str, regulation_filter: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Returns the referenced articles plus up to MAX_LOOKUP_CITATIONS cited
+        articles, in the retriever's result format; None if the query needs
+        semantic retrieval.
+        """
+        node_ids = self.resolve(query, regulation_filter)
+        if node_ids is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        results = self.articles(node_ids)
+
+        # Articles cited by the requested ones, most-cited first
+        cited_counts = {}
+        for nid in node_ids:
+            for neighbor_id in self.graph.successors(nid):
+                if neighbor_id not in node_ids:
+                    cited_counts[neighbor_id] = cited_counts.get(neighbor_id, 0) + 1
+        cited = sorted(cited_counts, key=lambda nid: -cited_counts[nid])[:MAX_LOOKUP_CITATIONS]
+        results.extend(self._result(nid, "graph_citation") for nid in cited)
+
+        logger.info(f"Article lookup: {node_ids} (+{len(cited)} cited)")
+        return results
+
+    def articles(self, node_ids: List[str]) -> List[Dict[str, Any]]:
+        return [self._result(nid, "article_lookup") for nid in node_ids]
+
+    def _result(self, node_id: str, match_type: str) -> Dict[str, Any]:
+        data = self.graph.node(node_id)
+        return {
+            "text": data.get('full_text', ''),
+            "metadata": {
+                "title": data.get('title', ''),
+                "article_number": data.get('article_number'),
+                "regulation": data.get('regulation'),
+                "source": match_type
+            },
+            "score": 0.0,
+            "match_type": match_type,
+            "node_id": node_id
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
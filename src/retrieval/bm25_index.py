@@ -0,0 +1,162 @@
+import json
+import logging
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BM25_DIR = Path("data/bm25")
+TOKEN_PATTERN = re.compile(r'\w+')
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """
+    Okapi BM25 (same scoring as `rank_bm25.BM25Okapi`) over a CSR inverted index.
+
+    On-disk layout (one directory, every array memory-mappable):
+    - vocab.npy    sorted terms (term id = position)
+    - indptr.npy   int64[V + 1], postings of term t are [indptr[t], indptr[t + 1])
+    - postings.npy int32 document indices
+    - weights.npy  float32 precomputed idf * tf-saturation per posting
+    - ids.npy      document ids (e.g. Chroma chunk ids)
+    - meta.json    build parameters
+
+    Since the BM25 contribution of a posting does not depend on the query, it is
+    computed at build time; a query only gathers the postings of its terms.
+    """
+    def __init__(self, vocab: np.ndarray, indptr: np.ndarray, postings: np.ndarray,
+                 weights: np.ndarray, ids: np.ndarray, meta: dict):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.postings = postings
+        self.weights = weights
+        self.ids = ids
+        self.meta = meta
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, ids: List[str], documents: List[str], k1: float = 1.5, b: float = 0.75,
+              epsilon: float = 0.25) -> "BM25Index":
+        n_docs = len(documents)
+        doc_len = np.zeros(n_docs, dtype=np.float32)
+        term_postings = {} # term -> ([doc indices], [tf])
+
+        for d, text in enumerate(documents):
+            counts = Counter(tokenize(text or ""))
+            doc_len[d] = sum(counts.values())
+            for term, tf in counts.items():
+                docs, tfs = term_postings.setdefault(term, ([], []))
+                docs.append(d)
+                tfs.append(tf)
+
+        avgdl = float(doc_len.mean()) if n_docs else 0.0
+        terms = sorted(term_postings)
+
+        # IDF as in rank_bm25: negative idfs are floored to epsilon * mean idf
+        idf = np.array(
+            [math.log(n_docs - len(term_postings[t][0]) + 0.5) - math.log(len(term_postings[t][0]) + 0.5) for t in terms],
+            dtype=np.float64
+        )
+        if len(idf):
+            idf[idf < 0] = epsilon * idf.mean()
+
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        postings, weights = [], []
+        for t, term in enumerate(terms):
+            docs, tfs = term_postings[term]
+            docs = np.asarray(docs, dtype=np.int32)
+            tfs = np.asarray(tfs, dtype=np.float64)
+            norm = k1 * (1 - b + b * doc_len[docs] / avgdl)
+            postings.append(docs)
+            weights.append((idf[t] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32))
+            indptr[t + 1] = indptr[t] + len(docs)
+
+        return cls(
+            vocab=np.array(terms, dtype=str) if terms else np.array([], dtype="<U1"),
+            indptr=indptr,
+            postings=np.concatenate(postings) if postings else np.array([], dtype=np.int32),
+            weights=np.concatenate(weights) if weights else np.array([], dtype=np.float32),
+            ids=np.array(ids, dtype=str),
+            meta={"k1": k1, "b": b, "epsilon": epsilon, "n_docs": n_docs, "avgdl": avgdl}
+        )
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in ("vocab", "indptr", "postings", "weights", "ids"):
+            np.save(path / f"{name}.npy", getattr(self, name))
+        with open(path / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        logger.info(f"BM25 index saved to {path} ({len(self.ids)} docs, {len(self.vocab)} terms)")
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True) -> "BM25Index":
+        path = Path(path)
+        mode = 'r' if mmap else None
+        arrays = {
+            name: np.load(path / f"{name}.npy", mmap_mode=mode)
+            for name in ("vocab", "indptr", "postings", "weights", "ids")
+        }
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(meta=meta, **arrays)
+
+    @staticmethod
+    def exists(path: Path) -> bool:
+        return (Path(path) / "meta.json").exists()
+
+    def _term_ids(self, terms: List[str]) -> List[int]:
+        if not len(self.vocab):
+            return []
+        # Casting to the vocab's fixed-width dtype would truncate longer terms (and
+        # possibly match another term); no vocab entry is longer anyway
+        max_len = self.vocab.dtype.itemsize // 4 # "<U n": 4 bytes per character
+        terms = [t for t in terms if len(t) <= max_len]
+        if not terms:
+            return []
+        terms = np.asarray(terms, dtype=self.vocab.dtype)
+        pos = np.searchsorted(self.vocab, terms)
+        pos = np.minimum(pos, len(self.vocab) - 1)
+        return [int(p) for p, t in zip(pos, terms, strict=True) if self.vocab[p] == t]
+
+    def top_k(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """
+        Returns up to k (doc_index, score) pairs, best first. Only documents
+        containing at least one query term are scored.
+        """
+        query_counts = Counter(tokenize(query))
+        if not query_counts or k <= 0:
+            return []
+
+        terms = list(query_counts)
+        term_ids = self._term_ids(terms)
+        if not term_ids:
+            return []
+        found = {str(self.vocab[t]): t for t in term_ids}
+
+        docs, contribs = [], []
+        for term, t in found.items():
+            start, end = self.indptr[t], self.indptr[t + 1]
+            docs.append(self.postings[start:end])
+            # Repeated query terms count repeatedly (as in BM25Okapi.get_scores)
+            contribs.append(self.weights[start:end] * query_counts[term])
+
+        docs = np.concatenate(docs)
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contribs))
+
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(unique_docs[i]), float(scores[i])) for i in top]
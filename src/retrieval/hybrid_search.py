@@ -1,17 +1,37 @@
 import logging
+import re
+import time
 import chromadb
 from chromadb.config import Settings
-from rank_bm25 import BM25Okapi
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, List, Dict, Tuple
 import os
 from dotenv import load_dotenv
 
 # Use our custom embedding function
 from src.utils.embeddings import GoogleGenAIEmbeddingFunction
+from src.retrieval.bm25_index import BM25_DIR, BM25Index
+from src.retrieval.vector_backends import make_vector_backend
+from src.data.graph_store import GRAPH_DIR, CompactGraph
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+COLLECTION_NAME = "eu_ai_gdpr_rules"
+RRF_K = 60
+
+# Per-leg deadlines (seconds from the start of retrieve). A leg that misses its
+# deadline is dropped from fusion instead of stalling the request.
+VECTOR_LEG_TIMEOUT = float(os.getenv("HYBRID_VECTOR_TIMEOUT", "3.0"))
+BM25_LEG_TIMEOUT = float(os.getenv("HYBRID_BM25_TIMEOUT", "1.0"))
+LEG_WORKERS = int(os.getenv("HYBRID_LEG_WORKERS", "4")) # Threads per leg
+
+# Article centrality (precomputed PageRank) as an extra, down-weighted RRF
+# ranking over the fused candidates. Off by default (0): it reorders every
+# hybrid result list and has not been evaluated on the golden set yet.
+CENTRALITY_WEIGHT = float(os.getenv("HYBRID_CENTRALITY_WEIGHT", "0"))
+CHUNK_ARTICLE_PATTERN = re.compile(r'^(?P<regulation>.+)_Article_(?P<number>[^_]+)_') # "GDPR_Article_35_chunk_2"
+
 class HybridRetriever:
     def __init__(self):
         self.api_key = os.getenv("GEMINI_API_KEY")
@@ -26,35 +46,53 @@ class HybridRetriever:
             model_name="models/text-embedding-004"
         )
         self.collection = self.chroma_client.get_collection(
-            name="eu_ai_gdpr_rules",
+            name=COLLECTION_NAME,
             embedding_function=self.embedding_fn
         )
+        self.vector_store = make_vector_backend(self.collection, COLLECTION_NAME)
         
-        # 2. Setup BM25 (Keyword)
-        logger.info("Initializing BM25 Index (this may take a moment)...")
-        all_docs = self.collection.get() 
-        self.documents = all_docs['documents']
-        self.metadatas = all_docs['metadatas']
-        self.ids = all_docs['ids']
+        # 2. Setup BM25 (Keyword) - memory-mapped index built at ingestion time
+        index_path = BM25_DIR / COLLECTION_NAME
+        if BM25Index.exists(index_path):
+            self.bm25 = BM25Index.load(index_path)
+        else:
+            logger.info("BM25 index not found. Building it from the collection (one-time)...")
+            all_docs = self.collection.get(include=["documents"])
+            self.bm25 = BM25Index.build(all_docs['ids'], all_docs['documents'])
+            self.bm25.save(index_path)
+        logger.info(f"BM25 Index loaded with {len(self.bm25)} documents.")
         
-        # Better Tokenization
-        import re
-        def preprocess(text):
-            return re.findall(r'\w+', text.lower())
-
-        self.preprocess = preprocess
-        tokenized_corpus = [self.preprocess(doc) for doc in self.documents]
-        self.bm25 = BM25Okapi(tokenized_corpus)
-        logger.info(f"BM25 Index built with {len(self.documents)} documents.")
+        # 3. Retrieval legs, run concurrently and fused with RRF.
+        # Each leg: (name, fn(query, n) -> {doc_id: {"rank", ["doc", "meta"]}}, timeout)
+        self.legs: List[Tuple[str, Callable[[str, int], Dict[str, Dict]], float]] = [
+            ("vector", self._vector_leg, VECTOR_LEG_TIMEOUT),
+            ("bm25", self._bm25_leg, BM25_LEG_TIMEOUT),
+        ]
+        # One pool per leg: a leg that missed its deadline keeps running (e.g. the
+        # vector leg retrying in the LLM gateway), and must not queue the others behind it
+        self._leg_pools = {
+            name: ThreadPoolExecutor(max_workers=LEG_WORKERS, thread_name_prefix=f"hybrid-{name}")
+            for name, _, _ in self.legs
+        }
         
-    def retrieve(self, query: str, k: int = 5) -> List[Dict]:
-        # 1. Vector Search
-        vector_results = self.collection.query(
-            query_texts=[query],
-            n_results=k * 2 # Fetch more for fusion candidates
+        # 4. Centrality prior from the citation graph features
+        self.centrality = {}
+        if CENTRALITY_WEIGHT > 0 and CompactGraph.exists(GRAPH_DIR):
+            graph = CompactGraph(GRAPH_DIR)
+            self.centrality = {str(nid): float(score) for nid, score in zip(graph.node_ids, graph.pagerank_scores, strict=True)}
+
+    def _centrality_of(self, doc_id: str) -> float:
+        match = CHUNK_ARTICLE_PATTERN.match(doc_id)
+        if not match:
+            return 0.0
+        return self.centrality.get(f"{match['regulation']}_{match['number']}", 0.0)
+
+    def _vector_leg(self, query: str, n: int) -> Dict[str, Dict]:
+        vector_results = self.vector_store.query(
+            query_embeddings=self.embedding_fn([query]),
+            n_results=n
         )
         
-        # Format Vector Results
         vector_candidates = {}
         if vector_results['documents']:
             for i, doc_id in enumerate(vector_results['ids'][0]):
@@ -63,48 +101,73 @@ class HybridRetriever:
                     "doc": vector_results['documents'][0][i],
                     "meta": vector_results['metadatas'][0][i]
                 }
-                
-        # 2. BM25 Search
-        tokenized_query = self.preprocess(query)
-        bm25_scores = self.bm25.get_scores(tokenized_query)
-        # Get top indices
-        top_n_indices = sorted(range(len(bm25_scores)), key=lambda i: bm25_scores[i], reverse=True)[:k*2]
+        return vector_candidates
+
+    def _bm25_leg(self, query: str, n: int) -> Dict[str, Dict]:
+        # Only postings of the query terms are touched; text is fetched after fusion
+        return {
+            str(self.bm25.ids[idx]): {"rank": rank + 1}
+            for rank, (idx, _) in enumerate(self.bm25.top_k(query, n))
+        }
+
+    def _run_legs(self, query: str, n: int) -> Dict[str, Dict[str, Dict]]:
+        """
+        Runs every leg concurrently; returns {leg_name: candidates} for the legs
+        that finished before their deadline.
+        """
+        start = time.monotonic()
+        futures = [(name, self._leg_pools[name].submit(fn, query, n), timeout) for name, fn, timeout in self.legs]
         
-        bm25_candidates = {}
-        for rank, idx in enumerate(top_n_indices):
-            doc_id = self.ids[idx]
-            bm25_candidates[doc_id] = {
-                "rank": rank + 1,
-                "doc": self.documents[idx],
-                "meta": self.metadatas[idx]
-            }
-            
-        # 3. Reciprocal Rank Fusion (RRF)
-        # score = 1 / (k + rank)
-        fused_scores = {}
-        all_ids = set(vector_candidates.keys()) | set(bm25_candidates.keys())
+        results = {}
+        for name, future, timeout in futures:
+            try:
+                results[name] = future.result(timeout=max(0.0, start + timeout - time.monotonic()))
+            except FutureTimeoutError:
+                logger.warning(f"Hybrid leg '{name}' missed its {timeout:.1f}s deadline. Fusing without it.")
+            except Exception as e:
+                logger.warning(f"Hybrid leg '{name}' failed: {e}. Fusing without it.")
+        return results
         
-        RRF_K = 60
-        for doc_id in all_ids:
-            score = 0
-            if doc_id in vector_candidates:
-                score += 1 / (RRF_K + vector_candidates[doc_id]['rank'])
-            if doc_id in bm25_candidates:
-                score += 1 / (RRF_K + bm25_candidates[doc_id]['rank'])
+    def retrieve(self, query: str, k: int = 5) -> List[Dict]:
+        # 1. Vector + BM25 Search, concurrently (fetch more for fusion candidates)
+        leg_results = self._run_legs(query, k * 2)
             
-            fused_scores[doc_id] = score
+        # 2. Reciprocal Rank Fusion (RRF)
+        # score = sum over legs of 1 / (k + rank)
+        fused_scores = {}
+        for candidates in leg_results.values():
+            for doc_id, cand in candidates.items():
+                fused_scores[doc_id] = fused_scores.get(doc_id, 0) + 1 / (RRF_K + cand['rank'])
             
+        # Centrality prior (opt-in): rank the fused candidates by article PageRank and
+        # add a down-weighted RRF term to every candidate. This reranks the fused list,
+        # pulling central articles up, rather than only breaking ties
+        if self.centrality:
+            by_centrality = sorted(fused_scores, key=self._centrality_of, reverse=True)
+            for rank, doc_id in enumerate(by_centrality):
+                fused_scores[doc_id] += CENTRALITY_WEIGHT / (RRF_K + rank + 1)
+        
         # Sort by fused score
         sorted_ids = sorted(fused_scores.keys(), key=lambda x: fused_scores[x], reverse=True)[:k]
         
+        # 3. Content: reuse what a leg returned, fetch the rest from Chroma by id
+        content = {}
+        for candidates in leg_results.values():
+            for doc_id, cand in candidates.items():
+                if "doc" in cand:
+                    content.setdefault(doc_id, cand)
+        missing = [doc_id for doc_id in sorted_ids if doc_id not in content]
+        if missing:
+            fetched = self.vector_store.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, doc, meta in zip(fetched['ids'], fetched['documents'], fetched['metadatas'], strict=True):
+                content[doc_id] = {"doc": doc, "meta": meta}
+        
         # Format Final Results
         final_results = []
         for doc_id in sorted_ids:
-            # Get content from either source (they share the same doc/meta)
-            if doc_id in vector_candidates:
-                cand = vector_candidates[doc_id]
-            else:
-                cand = bm25_candidates[doc_id]
+            cand = content.get(doc_id)
+            if cand is None:
+                continue # Deleted from Chroma since the index was built
                 
             final_results.append({
                 "text": cand['doc'],
@@ -1,13 +1,16 @@
 import logging
 import chromadb
 from chromadb.config import Settings
-from google import genai
 from typing import List, Dict
 import os
 from dotenv import load_dotenv
 
 # Use our custom embedding function
 from src.utils.embeddings import GoogleGenAIEmbeddingFunction
+from src.retrieval.vector_backends import make_vector_backend
+from src.utils.llm_gateway import get_gateway
+from src.utils.deadline import stage_allowed
+from src.utils.tracing import span
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -31,9 +34,10 @@ class HyDEEnhancedRetriever:
             name="eu_ai_gdpr_rules",
             embedding_function=self.embedding_fn
         )
+        self.vector_store = make_vector_backend(self.collection, "eu_ai_gdpr_rules")
         
         # 2. Setup Generator for Hallucination (HyDE)
-        self.client = genai.Client(api_key=self.api_key)
+        self.llm = get_gateway(self.api_key)
         
     def generate_hypothetical_document(self, query: str) -> str:
         """
@@ -50,9 +54,10 @@ User Question: {query}
 Hypothetical Regulation Text:"""
 
         try:
-            response = self.client.models.generate_content(
+            response = self.llm.generate_content(
                 model='gemini-2.0-flash-lite-preview-02-05',
-                contents=prompt
+                contents=prompt,
+                component="hyde"
             )
             return response.text
         except Exception as e:
@@ -63,14 +68,17 @@ Hypothetical Regulation Text:"""
         """
         Retrieves using the hypothetical document embedding.
         """
-        # 1. Generate Hypothetical Document
-        logger.info(f"Generating HyDE document for: {query}")
-        hypothetical_doc = self.generate_hypothetical_document(query)
+        # 1. Generate Hypothetical Document (embeds the plain query when the deadline is short)
+        hypothetical_doc = query
+        if stage_allowed("hyde"):
+            logger.info(f"Generating HyDE document for: {query}")
+            with span("hyde"):
+                hypothetical_doc = self.generate_hypothetical_document(query)
         logger.debug(f"Hypothetical Doc: {hypothetical_doc[:100]}...")
         
         # 2. Vector Search using the Hypothetical Doc
-        results = self.collection.query(
-            query_texts=[hypothetical_doc],
+        results = self.vector_store.query(
+            query_embeddings=self.embedding_fn([hypothetical_doc]),
             n_results=k
         )
         
@@ -1,29 +1,63 @@
+import asyncio
+import contextvars
+import json
 import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 import chromadb
+import numpy as np
 from chromadb.config import Settings
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import os
-import pickle
-import networkx as nx
 from dotenv import load_dotenv
-from google import genai
 
 # Use our custom embedding function
 from src.utils.embeddings import GoogleGenAIEmbeddingFunction
+from src.data.parent_store import PARENT_STORE_DIR, ParentStore
+from src.data.graph_store import GRAPH_DIR, CompactGraph
+from src.retrieval.vector_backends import make_vector_backend
+from src.retrieval.article_lookup import ArticleLookup
+from src.retrieval.graph_expansion import EXPANSION_TOKEN_BUDGET, GraphExpander
+from src.utils.llm_gateway import get_gateway
+from src.utils.deadline import current_deadline, stage_allowed
+from src.utils.tracing import span
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 # Phase 3 Configuration
 COLLECTION_NAME = "eu_ai_gdpr_parent_child"
-GRAPH_PATH = "data/knowledge_graph.pkl"
+MAX_EXPANSION = 3 # Max graph-cited articles added to the context
+
+# Graph expansion modes:
+# - "serial":   one LLM relevance check per citation, one after another (legacy)
+# - "parallel": same per-citation check, bounded-concurrency fan-out over the shared client
+# - "batch":    all candidate citations judged in a single prompt
+# - "embedding": no LLM; cosine similarity of the query embedding against node
+#                embeddings precomputed by LegalGraphBuilder.embed_nodes
+# - "ppr":      no LLM; multi-hop neighbours (both citation directions) ranked by
+#                personalized PageRank from the retrieved seeds, under a node and token budget
+EXPANSION_MODES = ("serial", "parallel", "batch", "embedding", "ppr")
+EXPANSION_MODE = os.getenv("GRAPH_EXPANSION_MODE", "parallel")
+RELEVANCE_CONCURRENCY = int(os.getenv("GRAPH_RELEVANCE_CONCURRENCY", "4"))
+BATCH_MAX_CANDIDATES = 30 # Keeps the batched judge prompt bounded
+SIMILARITY_THRESHOLD = float(os.getenv("GRAPH_SIMILARITY_THRESHOLD", "0.6"))
+RELEVANCE_MODEL = 'gemini-2.0-flash-lite-preview-02-05'
+# Cross-encoder reranking of the vector hits (CPU; see src/retrieval/reranker.py)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_CANDIDATES_FACTOR = int(os.getenv("RERANK_CANDIDATES_FACTOR", "3")) # Parents fetched per returned parent
 
 class ParentChildRetriever:
     """
     Retrieves chunks (Children) but returns the Full Article Text (Parent).
     Optionally expands context using Citation Graph (NetworkX).
     """
-    def __init__(self):
+    def __init__(self, expansion_mode: str = EXPANSION_MODE):
+        if expansion_mode not in EXPANSION_MODES:
+            raise ValueError(f"Unknown expansion_mode '{expansion_mode}'. Expected one of {EXPANSION_MODES}")
+        self.expansion_mode = expansion_mode
+        
         self.api_key = os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY not found")
@@ -40,22 +74,66 @@ class ParentChildRetriever:
             name=COLLECTION_NAME,
             embedding_function=self.embedding_fn
         )
+        self.vector_store = make_vector_backend(self.collection, COLLECTION_NAME)
+        
+        # Full article texts (children only carry article_id)
+        self.parent_store = None
+        if ParentStore.exists(PARENT_STORE_DIR):
+            self.parent_store = ParentStore(PARENT_STORE_DIR)
+        else:
+            logger.warning("Parent store not found. Falling back to parent_text in chunk metadata.")
+        
+        # Shared LLM gateway for citation relevance checks (sync + async)
+        self.llm = get_gateway(self.api_key)
+        self._relevance_pool = ThreadPoolExecutor(
+            max_workers=RELEVANCE_CONCURRENCY,
+            thread_name_prefix="graph-relevance"
+        )
         
         # Load Graph
         self.graph = None
-        if os.path.exists(GRAPH_PATH):
+        if CompactGraph.exists(GRAPH_DIR):
             logger.info("Loading Legal Citation Graph...")
-            with open(GRAPH_PATH, "rb") as f:
-                self.graph = pickle.load(f)
+            self.graph = CompactGraph(GRAPH_DIR)
         else:
-            logger.warning("Graph not found. Retrieval will be vector-only.")
+            logger.warning(f"Graph not found at {GRAPH_DIR} (run src/data/graph_builder.py). Retrieval will be vector-only.")
+            
+        # Node embedding matrix for the "embedding" expansion mode (rows L2-normalised)
+        self._node_index = {}
+        self._node_embeddings = None
+        if self.graph is not None:
+            self._load_node_embeddings()
+            
+        if self.expansion_mode == "embedding" and self._node_embeddings is None:
+            logger.warning(
+                "GRAPH_EXPANSION_MODE=embedding, but the graph has no node embeddings "
+                "(rebuild with 'python -m src.data.graph_builder --embed'). Falling back to 'parallel' expansion."
+            )
+            self.expansion_mode = "parallel"
+            
+        # Explicit article references ("Article 35 GDPR") resolve straight to graph nodes
+        self.article_lookup = ArticleLookup(self.graph) if self.graph is not None else None
+        self.expander = GraphExpander(self.graph) if self.graph is not None else None
+        
+        self.reranker = None
+        if RERANK_ENABLED:
+            # Loads torch; only when enabled
+            from src.retrieval.reranker import ReRanker
+            self.reranker = ReRanker()
 
+    def _load_node_embeddings(self):
+        if self.graph.embeddings is None or not self.graph.has_embedding.any():
+            return
+        self._node_index = {
+            str(nid): i for i, nid in enumerate(self.graph.node_ids) if self.graph.has_embedding[i]
+        }
+        matrix = np.asarray(self.graph.embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._node_embeddings = matrix / np.maximum(norms, 1e-12)
 
-    def _is_neighbor_relevant(self, query: str, neighbor_text: str, neighbor_title: str) -> bool:
-        """
-        Uses LLM (Gemini) to check if a cited article is relevant to the query.
-        """
-        prompt = f"""
+
+    def _relevance_prompt(self, query: str, neighbor_text: str, neighbor_title: str) -> str:
+        return f"""
         You are a legal research assistant.
         Determine if the following CITED ARTICLE is relevant to the USER QUERY.
         
@@ -67,44 +145,181 @@ class ParentChildRetriever:
         Is this cited article necessary to answer the query?
         Return ONLY "YES" or "NO".
         """
+
+    def _is_neighbor_relevant(self, query: str, neighbor_text: str, neighbor_title: str) -> bool:
+        """
+        Uses LLM (Gemini) to check if a cited article is relevant to the query.
+        """
+        prompt = self._relevance_prompt(query, neighbor_text, neighbor_title)
         try:
-            # Use the existing client from __init__ if possible, or create new client
-            client = genai.Client(api_key=self.api_key)
-            response = client.models.generate_content(
-                model='gemini-2.0-flash-lite-preview-02-05',
-                contents=prompt
+            response = self.llm.generate_content(
+                model=RELEVANCE_MODEL,
+                contents=prompt,
+                component="graph_relevance"
             )
             return "YES" in response.text.strip().upper()
         except Exception as e:
             logger.warning(f"Relevance check failed: {e}")
             return False
 
-    def retrieve(self, query: str, k: int = 5, regulation_filter: str = None) -> List[Dict[str, Any]]:
+    async def _ais_neighbor_relevant(self, query: str, neighbor_text: str, neighbor_title: str) -> bool:
         """
-        1. Embed Query
-        2. Vector Search (Hybrid Parent-Child) - Optionally Filtered
-        3. Smart Graph Expansion (LLM Valided Citations)
-        4. Return Deduplicated Context
+        Async variant of `_is_neighbor_relevant` (non-blocking Gemini call).
         """
-        # --- Step 1 & 2: Vector Search ---
-        where_clause = {"regulation": regulation_filter} if regulation_filter else None
+        prompt = self._relevance_prompt(query, neighbor_text, neighbor_title)
+        try:
+            response = await self.llm.agenerate_content(
+                model=RELEVANCE_MODEL,
+                contents=prompt,
+                component="graph_relevance"
+            )
+            return "YES" in response.text.strip().upper()
+        except Exception as e:
+            logger.warning(f"Relevance check failed: {e}")
+            return False
+
+    def _batch_relevance_prompt(self, query: str, candidates: List[tuple]) -> str:
+        listing = "\n".join(
+            f'{i + 1}. "{data.get("title", "")}" ({nid}): "{data.get("full_text", "")[:300]}..."'
+            for i, (nid, data) in enumerate(candidates)
+        )
+        return f"""
+        You are a legal research assistant.
+        Determine which of the following CITED ARTICLES are relevant to the USER QUERY.
+        
+        User Query: "{query}"
+        
+        Cited Articles:
+        {listing}
+        
+        Which cited articles are necessary to answer the query?
+        Return ONLY JSON of the form {{"relevant": [<article numbers from the list above>]}}.
+        """
+
+    @staticmethod
+    def _parse_batch_relevance(response_text: str, n_candidates: int) -> List[int]:
+        """
+        Returns the 0-based indices judged relevant, in candidate order.
+        """
+        try:
+            picked = json.loads(response_text).get("relevant", [])
+        except (json.JSONDecodeError, AttributeError):
+            # Tolerate a plain list of numbers if the model ignores the JSON format
+            picked = re.findall(r'\d+', response_text)
+        indices = set()
+        for p in picked:
+            try:
+                idx = int(p) - 1
+            except (TypeError, ValueError):
+                continue
+            if 0 <= idx < n_candidates:
+                indices.add(idx)
+        return sorted(indices)
+
+    def _batch_relevant(self, query: str, candidates: List[tuple]) -> List[int]:
+        candidates = candidates[:BATCH_MAX_CANDIDATES]
+        try:
+            response = self.llm.generate_content(
+                model=RELEVANCE_MODEL,
+                contents=self._batch_relevance_prompt(query, candidates),
+                config={'response_mime_type': 'application/json'},
+                component="graph_relevance_batch"
+            )
+            return self._parse_batch_relevance(response.text, len(candidates))
+        except Exception as e:
+            logger.warning(f"Batched relevance check failed: {e}")
+            return []
+
+    async def _abatch_relevant(self, query: str, candidates: List[tuple]) -> List[int]:
+        candidates = candidates[:BATCH_MAX_CANDIDATES]
+        try:
+            response = await self.llm.agenerate_content(
+                model=RELEVANCE_MODEL,
+                contents=self._batch_relevance_prompt(query, candidates),
+                config={'response_mime_type': 'application/json'},
+                component="graph_relevance_batch"
+            )
+            return self._parse_batch_relevance(response.text, len(candidates))
+        except Exception as e:
+            logger.warning(f"Batched relevance check failed: {e}")
+            return []
+
+    def _similar_neighbors(self, query_embedding: List[float], candidates: List[tuple]) -> List[tuple]:
+        """
+        Scores all candidates with one matmul against the precomputed node embeddings
+        and keeps the top MAX_EXPANSION above SIMILARITY_THRESHOLD (best first).
+        """
+        scored = [(c, self._node_index[c[0]]) for c in candidates if c[0] in self._node_index]
+        if not scored:
+            return []
+        
+        q = np.asarray(query_embedding, dtype=np.float32)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+        sims = self._node_embeddings[[row for _, row in scored]] @ q
         
-        results = self.collection.query(
-            query_texts=[query],
+        relevant = []
+        for i in np.argsort(-sims)[:MAX_EXPANSION]:
+            if sims[i] < SIMILARITY_THRESHOLD:
+                break
+            relevant.append(scored[i][0])
+        return relevant
+
+    def lookup_articles(self, query: str, regulation_filter: str = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Fast path for queries that reference specific articles: returns them (plus
+        cited articles) from the graph without embedding, or None to fall through
+        to `retrieve`.
+        """
+        if self.article_lookup is None:
+            return None
+        return self.article_lookup.lookup(query, regulation_filter)
+
+    def _merge_referenced(self, query: str, regulation_filter: Optional[str], final_results: List[Dict[str, Any]],
+                          unique_parents: Dict[str, bool]) -> List[Dict[str, Any]]:
+        # Articles a (non-lookup) question names explicitly lead the context and seed graph expansion
+        if self.article_lookup is None:
+            return final_results
+        node_ids = [nid for nid in self.article_lookup.referenced(query, regulation_filter) or [] if nid not in unique_parents]
+        for nid in node_ids:
+            unique_parents[nid] = True
+        return self.article_lookup.articles(node_ids) + final_results
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.embedding_fn([query])[0]
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return (await self.embedding_fn.aembed([query]))[0]
+
+    def _vector_query(self, query_embedding: List[float], k: int, regulation_filter: str = None) -> Dict[str, Any]:
+        where_clause = {"regulation": regulation_filter} if regulation_filter else None
+        # Child text is not needed (parents are resolved separately)
+        return self.vector_store.query(
+            query_embeddings=[query_embedding],
             n_results=k * 2,
-            where=where_clause
+            where=where_clause,
+            include=["metadatas", "distances"]
         )
-        
+
+    def _parent_text(self, meta: Dict[str, Any]) -> str:
+        if self.parent_store is not None:
+            text = self.parent_store.get(meta.get('article_id'))
+            if text is not None:
+                return text
+        return meta.get('parent_text', '')
+
+    def _collect_parents(self, results: Dict[str, Any], k: int):
+        """
+        Collapses child hits into (at most k) unique parent articles.
+        Returns (final_results, unique_parents).
+        """
         unique_parents = {}
         final_results = []
         
-        if results['documents']:
+        if results['metadatas']:
             metadatas = results['metadatas'][0]
             scores = results['distances'][0]
             
             for i, meta in enumerate(metadatas):
-                parent_id = meta.get('article_id') 
-                
                 reg = meta.get('regulation')
                 num = meta.get('article_number')
                 graph_node_id = f"{reg}_{num}"
@@ -115,7 +330,7 @@ class ParentChildRetriever:
                 unique_parents[graph_node_id] = True
                 
                 final_results.append({
-                    "text": meta.get('parent_text', ''),
+                    "text": self._parent_text(meta),
                     "metadata": meta,
                     "score": scores[i],
                     "match_type": "vector",
@@ -124,49 +339,269 @@ class ParentChildRetriever:
                 
                 if len(final_results) >= k:
                     break
+                    
+        return final_results, unique_parents
+
+    def _rerank(self, query: str, final_results: List[Dict[str, Any]], k: int):
+        """
+        Cross-encoder reorders the over-fetched parents and keeps the best k.
+        Returns (final_results, unique_parents).
+        """
+        final_results = self.reranker.rerank(query, final_results, top_k=k)
+        return final_results, {res['node_id']: True for res in final_results}
+
+    def _expansion_candidates(self, final_results: List[Dict[str, Any]], unique_parents: Dict[str, bool]) -> List[tuple]:
+        """
+        Returns unique (neighbor_id, neighbor_data) pairs for citations of the
+        retrieved articles that are not already part of the context, in seed order.
+        """
+        candidates = []
+        seen = set(unique_parents)
+        for res in final_results:
+            node_id = res['node_id']
+            
+            if self.graph.has_node(node_id):
+                for neighbor_id in self.graph.successors(node_id):
+                    if neighbor_id not in seen:
+                        seen.add(neighbor_id)
+                        candidates.append((neighbor_id, self.graph.node(neighbor_id)))
+        return candidates
+
+    def _graph_result(self, neighbor_id: str, neighbor_data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "text": neighbor_data.get('full_text', ''),
+            "metadata": {
+                "title": neighbor_data.get('title', ''),
+                "article_number": neighbor_data.get('article_number'),
+                "regulation": neighbor_data.get('regulation'),
+                "source": "graph_citation_smart"
+            },
+            "score": 0.0,
+            "match_type": "graph_smart",
+            "node_id": neighbor_id
+        }
+
+    def _ppr_expand(self, final_results: List[Dict[str, Any]], unique_parents: Dict[str, bool]) -> List[Dict[str, Any]]:
+        """
+        "ppr" expansion: seeds are the retrieved articles weighted by their scores.
+        """
+        weights = GraphExpander.seed_weights([res['score'] for res in final_results])
+        seeds = {}
+        for res, weight in zip(final_results, weights, strict=True):
+            seeds[res['node_id']] = seeds.get(res['node_id'], 0.0) + float(weight)
+        
+        expanded = []
+        for neighbor_id, score in self.expander.expand(
+            seeds, exclude=set(unique_parents), node_budget=MAX_EXPANSION, token_budget=EXPANSION_TOKEN_BUDGET
+        ):
+            result = self._graph_result(neighbor_id, self.graph.node(neighbor_id))
+            result.update(score=score, match_type="graph_ppr")
+            result['metadata']['source'] = "graph_ppr"
+            expanded.append(result)
+        return expanded
+
+    def _expand_graph(self, query: str, candidates: List[tuple], query_embedding: List[float],
+                      cutoff: Optional[float] = None) -> List[tuple]:
+        """
+        Returns up to MAX_EXPANSION relevant candidates (LLM modes keep candidate order),
+        stopping as soon as enough have been found.
+
+        Raises TimeoutError once `cutoff` (time.monotonic()) passes while waiting
+        for the per-citation checks ("serial" and "parallel"); the single
+        "batch" call is not interrupted.
+        """
+        relevant = []
+        
+        def remaining() -> Optional[float]:
+            if cutoff is None:
+                return None
+            left = cutoff - time.monotonic()
+            if left <= 0:
+                raise TimeoutError
+            return left
+        
+        if self.expansion_mode == "embedding":
+            return self._similar_neighbors(query_embedding, candidates)
+        
+        if self.expansion_mode == "batch":
+            return [candidates[i] for i in self._batch_relevant(query, candidates)][:MAX_EXPANSION]
+        
+        if self.expansion_mode == "serial":
+            for neighbor_id, neighbor_data in candidates:
+                remaining()
+                if self._is_neighbor_relevant(query, neighbor_data.get('full_text', ''), neighbor_data.get('title', '')):
+                    relevant.append((neighbor_id, neighbor_data))
+                    if len(relevant) >= MAX_EXPANSION:
+                        break
+            return relevant
+        
+        # "parallel": at most RELEVANCE_CONCURRENCY checks in flight. Results are
+        # consumed in candidate order so the outcome matches "serial".
+        # Each check runs in a copy of the request context (keeps its trace)
+        futures = [
+            self._relevance_pool.submit(
+                contextvars.copy_context().run,
+                self._is_neighbor_relevant, query, data.get('full_text', ''), data.get('title', '')
+            )
+            for _, data in candidates
+        ]
+        try:
+            for candidate, future in zip(candidates, futures, strict=True):
+                if future.result(timeout=remaining()):
+                    relevant.append(candidate)
+                    if len(relevant) >= MAX_EXPANSION:
+                        break
+        finally:
+            # Early stop: drop checks that have not started yet
+            for future in futures:
+                future.cancel()
+        return relevant
+
+    async def _aexpand_graph(self, query: str, candidates: List[tuple], query_embedding: List[float]) -> List[tuple]:
+        """
+        Async variant of `_expand_graph`.
+        """
+        relevant = []
+        
+        if self.expansion_mode == "embedding":
+            return self._similar_neighbors(query_embedding, candidates)
+        
+        if self.expansion_mode == "batch":
+            return [candidates[i] for i in await self._abatch_relevant(query, candidates)][:MAX_EXPANSION]
+        
+        if self.expansion_mode == "serial":
+            for neighbor_id, neighbor_data in candidates:
+                if await self._ais_neighbor_relevant(query, neighbor_data.get('full_text', ''), neighbor_data.get('title', '')):
+                    relevant.append((neighbor_id, neighbor_data))
+                    if len(relevant) >= MAX_EXPANSION:
+                        break
+            return relevant
+        
+        semaphore = asyncio.Semaphore(RELEVANCE_CONCURRENCY)
+        
+        async def judge(data: Dict[str, Any]) -> bool:
+            async with semaphore:
+                return await self._ais_neighbor_relevant(query, data.get('full_text', ''), data.get('title', ''))
+        
+        tasks = [asyncio.create_task(judge(data)) for _, data in candidates]
+        try:
+            for candidate, task in zip(candidates, tasks, strict=True):
+                if await task:
+                    relevant.append(candidate)
+                    if len(relevant) >= MAX_EXPANSION:
+                        break
+        finally:
+            for task in tasks:
+                task.cancel()
+        return relevant
+
+    def retrieve(self, query: str, k: int = 5, regulation_filter: str = None,
+                 query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """
+        1. Embed Query (skipped if the caller already has `query_embedding`)
+        2. Vector Search (Hybrid Parent-Child) - Optionally Filtered,
+           then cross-encoder reranking if enabled
+        2b. Articles the query names explicitly are merged in (ArticleLookup)
+        3. Smart Graph Expansion (LLM Valided Citations)
+        4. Return Deduplicated Context
+        
+        Reranking and graph expansion are skipped when the request deadline
+        (src/utils/deadline.py) has too little time left for them; graph
+        expansion is also cut short if it would eat into the time left for
+        generation (checked between relevance checks; a "batch" judge call runs to
+        completion here, unlike in `aretrieve`).
+        """
+        # --- Step 1 & 2: Vector Search ---
+        if query_embedding is None:
+            with span("embed_query"):
+                query_embedding = self.embed_query(query)
+        rerank = self.reranker is not None and stage_allowed("rerank")
+        n_parents = k * RERANK_CANDIDATES_FACTOR if rerank else k
+        with span("vector_search"):
+            results = self._vector_query(query_embedding, n_parents, regulation_filter)
+            final_results, unique_parents = self._collect_parents(results, n_parents)
+        if rerank:
+            with span("rerank"):
+                final_results, unique_parents = self._rerank(query, final_results, k)
+        final_results = self._merge_referenced(query, regulation_filter, final_results, unique_parents)
         
         # --- Step 3: Smart Graph Expansion ---
-        if self.graph:
-            expanded_results = []
-            logger.info("Checking graph for relevant citations...")
+        expand = self.graph is not None and stage_allowed("graph_expansion")
+        if expand and self.expansion_mode == "ppr":
+            with span("graph_expansion"):
+                expanded = self._ppr_expand(final_results, unique_parents)
+            for result in expanded:
+                logger.info(f"  -> Graph neighbour {result['node_id']} (PPR {result['score']:.4f}). Adding.")
+                unique_parents[result['node_id']] = True
+                final_results.append(result)
+        elif expand:
+            candidates = self._expansion_candidates(final_results, unique_parents)
+            logger.info(f"Checking {len(candidates)} graph citations for relevance ({self.expansion_mode})...")
             
-            for res in final_results:
-                node_id = res['node_id']
-                
-                if self.graph.has_node(node_id):
-                    neighbors = list(self.graph.successors(node_id))
-                    
-                    for neighbor_id in neighbors:
-                        if neighbor_id not in unique_parents:
-                            
-                            neighbor_data = self.graph.nodes[neighbor_id]
-                            n_text = neighbor_data.get('full_text', '')
-                            n_title = neighbor_data.get('title', '')
-                            
-                            # SMART FILTER: Ask LLM if this is relevant
-                            if self._is_neighbor_relevant(query, n_text, n_title):
-                                logger.info(f"  -> Cited article {neighbor_id} is RELEVANT. Adding.")
-                                unique_parents[neighbor_id] = True
-                                
-                                expanded_results.append({
-                                    "text": n_text,
-                                    "metadata": {
-                                        "title": n_title,
-                                        "article_number": neighbor_data.get('article_number'),
-                                        "regulation": neighbor_data.get('regulation'),
-                                        "source": "graph_citation_smart"
-                                    },
-                                    "score": 0.0,
-                                    "match_type": "graph_smart",
-                                    "node_id": neighbor_id
-                                })
-                            else:
-                                 logger.debug(f"  -> Cited article {neighbor_id} filtered out (Irrelevant).")
+            deadline = current_deadline()
+            with span("graph_expansion"):
+                try:
+                    # Cut short if it would eat into the time left for generation
+                    cutoff = time.monotonic() + deadline.stage_timeout() if deadline else None
+                    relevant = self._expand_graph(query, candidates, query_embedding, cutoff)
+                except TimeoutError:
+                    deadline.degrade("graph_expansion", "cut short")
+                    relevant = []
+            for neighbor_id, neighbor_data in relevant:
+                logger.info(f"  -> Cited article {neighbor_id} is RELEVANT. Adding.")
+                unique_parents[neighbor_id] = True
+                final_results.append(self._graph_result(neighbor_id, neighbor_data))
+            
+        return final_results
 
+    async def aretrieve(self, query: str, k: int = 5, regulation_filter: str = None,
+                        query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Async variant of `retrieve`: embedding and LLM relevance checks use the
+        async Gemini client, and the (blocking) Chroma query runs in a worker thread.
+        """
+        # --- Step 1 & 2: Vector Search ---
+        if query_embedding is None:
+            with span("embed_query"):
+                query_embedding = await self.aembed_query(query)
+        rerank = self.reranker is not None and stage_allowed("rerank")
+        n_parents = k * RERANK_CANDIDATES_FACTOR if rerank else k
+        with span("vector_search"):
+            results = await asyncio.to_thread(self._vector_query, query_embedding, n_parents, regulation_filter)
+            final_results, unique_parents = self._collect_parents(results, n_parents)
+        if rerank:
+            with span("rerank"):
+                final_results, unique_parents = await asyncio.to_thread(self._rerank, query, final_results, k)
+        final_results = self._merge_referenced(query, regulation_filter, final_results, unique_parents)
+        
+        # --- Step 3: Smart Graph Expansion ---
+        expand = self.graph is not None and stage_allowed("graph_expansion")
+        if expand and self.expansion_mode == "ppr":
+            with span("graph_expansion"):
+                expanded = self._ppr_expand(final_results, unique_parents)
+            for result in expanded:
+                logger.info(f"  -> Graph neighbour {result['node_id']} (PPR {result['score']:.4f}). Adding.")
+                unique_parents[result['node_id']] = True
+                final_results.append(result)
+        elif expand:
+            candidates = self._expansion_candidates(final_results, unique_parents)
+            logger.info(f"Checking {len(candidates)} graph citations for relevance ({self.expansion_mode})...")
             
-            # Limit total context size
-            MAX_EXPANSION = 3
-            final_results.extend(expanded_results[:MAX_EXPANSION])
+            deadline = current_deadline()
+            with span("graph_expansion"):
+                try:
+                    # Cut short if it would eat into the time left for generation
+                    relevant = await asyncio.wait_for(
+                        self._aexpand_graph(query, candidates, query_embedding),
+                        timeout=deadline.stage_timeout() if deadline else None
+                    )
+                except TimeoutError:
+                    deadline.degrade("graph_expansion", "cut short")
+                    relevant = []
+            for neighbor_id, neighbor_data in relevant:
+                logger.info(f"  -> Cited article {neighbor_id} is RELEVANT. Adding.")
+                unique_parents[neighbor_id] = True
+                final_results.append(self._graph_result(neighbor_id, neighbor_data))
             
         return final_results
 
@@ -185,7 +620,7 @@ class ParentChildRetriever:
         for nid in node_ids:
             if self.graph.has_node(nid):
                 if nid not in seen_nodes:
-                    data = self.graph.nodes[nid]
+                    data = self.graph.node(nid, text=False)
                     nodes.append({
                         "id": nid,
                         "label": f"{data.get('regulation')} {data.get('article_number')}",
@@ -207,7 +642,7 @@ class ParentChildRetriever:
                      
                      # Add neighbor node if not seen
                      if neighbor not in seen_nodes and self.graph.has_node(neighbor):
-                         n_data = self.graph.nodes[neighbor]
+                         n_data = self.graph.node(neighbor, text=False)
                          nodes.append({
                              "id": neighbor,
                              "label": f"{n_data.get('regulation')} {n_data.get('article_number')}",
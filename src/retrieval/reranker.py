@@ -1,51 +1,186 @@
+import hashlib
 import logging
-from typing import List, Dict
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
 from sentence_transformers import CrossEncoder
 
 logger = logging.getLogger(__name__)
 
+RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# "torch" (fp32), or opt in to "int8" (torch dynamic quantization of the Linear layers)
+# or "onnx" (ONNX Runtime via sentence-transformers; needs `sentence-transformers[onnx]`).
+# Both are faster on CPU but shift scores slightly.
+RERANKER_BACKEND = os.getenv("RERANKER_BACKEND", "torch")
+RERANKER_MAX_LENGTH = int(os.getenv("RERANKER_MAX_LENGTH", "256")) # Tokens per (query, passage) pair
+RERANKER_BATCH_SIZE = int(os.getenv("RERANKER_BATCH_SIZE", "32"))
+RERANKER_CACHE_SIZE = int(os.getenv("RERANKER_CACHE_SIZE", "4096"))
+# Opt in to scoring passages of each article and max-pooling, instead of one
+# truncated pair per article (more cross-encoder pairs per query)
+RERANKER_PASSAGES = os.getenv("RERANKER_PASSAGES", "0") == "1"
+RERANKER_BACKENDS = ("torch", "int8", "onnx")
+CHARS_PER_TOKEN = 4 # Texts are cut to ~max_length tokens before tokenization
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
 class ReRanker:
-    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"):
-        logger.info(f"Loading CrossEncoder model: {model_name}...")
-        self.model = CrossEncoder(model_name)
-        
+    """
+    CPU cross-encoder reranking.
+
+    - Pairs are truncated to `max_length` tokens and scored in length-sorted
+      batches of `batch_size` (less padding per batch).
+    - Scores are cached in an LRU keyed by (query hash, passage hash), so
+      repeated queries and articles that recur across queries are not re-scored.
+    - With `passages`, each article is split into paragraph windows of about
+      `max_length` tokens; the article scores as its best passage (max-pooling),
+      so relevant text deep inside a long article is not cut off.
+    """
+    def __init__(self, model_name: str = RERANKER_MODEL, backend: str = RERANKER_BACKEND,
+                 max_length: int = RERANKER_MAX_LENGTH, batch_size: int = RERANKER_BATCH_SIZE,
+                 cache_size: int = RERANKER_CACHE_SIZE, passages: bool = RERANKER_PASSAGES):
+        if backend not in RERANKER_BACKENDS:
+            raise ValueError(f"Unknown reranker backend '{backend}'. Expected one of {RERANKER_BACKENDS}")
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.passages = passages
+
+        logger.info(f"Loading CrossEncoder model: {model_name} ({backend}, max_length={max_length})...")
+        self.model, self.backend = self._load(model_name, backend, max_length)
+
+        self._cache: OrderedDict[Tuple[str, str], float] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _load(model_name: str, backend: str, max_length: int) -> Tuple[CrossEncoder, str]:
+        """
+        Returns (model, backend actually loaded); "onnx" falls back to "torch" if it cannot load.
+        """
+        if backend == "onnx":
+            try:
+                return CrossEncoder(model_name, max_length=max_length, device="cpu", backend="onnx"), backend
+            except (ImportError, OSError, RuntimeError) as e: # Missing `sentence-transformers[onnx]` or failed export
+                logger.warning(f"ONNX reranker backend unavailable ({e}). Falling back to 'torch'.")
+                backend = "torch"
+
+        model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        if backend == "int8":
+            import torch
+            model.model = torch.ao.quantization.quantize_dynamic(model.model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model, backend
+
+    def _split_passages(self, text: str) -> List[str]:
+        """
+        Greedily joins consecutive paragraphs into windows of ~max_length tokens.
+        """
+        limit = self.max_length * CHARS_PER_TOKEN
+        if not self.passages or len(text) <= limit:
+            return [text[:limit]]
+
+        windows, current = [], ""
+        for para in (p.strip() for p in text.split('\n')):
+            if not para:
+                continue
+            if current and len(current) + len(para) + 1 > limit:
+                windows.append(current)
+                current = ""
+            current = f"{current}\n{para}" if current else para
+            while len(current) > limit: # Single paragraph longer than a window
+                windows.append(current[:limit])
+                current = current[limit:]
+        if current:
+            windows.append(current)
+        return windows
+
+    def score_pairs(self, query: str, texts: List[str]) -> np.ndarray:
+        """
+        Cross-encoder scores of (query, text) pairs, served from the LRU cache where possible.
+        """
+        q_key = _digest(query)
+        keys = [(q_key, _digest(t)) for t in texts]
+        scores = np.empty(len(texts), dtype=np.float32)
+
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    scores[i] = cached
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            # Length-sorted batches pad less
+            order = sorted(missing, key=lambda i: len(texts[i]))
+            predicted = self.model.predict(
+                [(query, texts[i]) for i in order],
+                batch_size=self.batch_size,
+                show_progress_bar=False
+            )
+            with self._lock:
+                for i, score in zip(order, predicted, strict=True):
+                    scores[i] = float(score)
+                    self._cache[keys[i]] = float(score)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
     def rerank(self, query: str, docs: List[Dict], top_k: int = 5) -> List[Dict]:
         """
         Re-ranks a list of retrieved documents based on their relevance to the query.
         """
         if not docs:
             return []
-            
-        # Prepare pairs for the model: (query, text)
-        pairs = [(query, doc['text']) for doc in docs]
-        
-        # Predict scores
-        scores = self.model.predict(pairs)
-        
-        # Attach scores to docs
-        for i, doc in enumerate(docs):
-            doc['rerank_score'] = float(scores[i])
-            
+
+        # Passages per doc, scored in one batched call, then max-pooled per doc
+        passages = [self._split_passages(doc['text']) for doc in docs]
+        flat = [p for doc_passages in passages for p in doc_passages]
+        scores = self.score_pairs(query, flat)
+
+        start = 0
+        for doc, doc_passages in zip(docs, passages, strict=True):
+            doc['rerank_score'] = float(scores[start:start + len(doc_passages)].max())
+            start += len(doc_passages)
+
         # Sort by new score
         sorted_docs = sorted(docs, key=lambda x: x['rerank_score'], reverse=True)
-        
+
         return sorted_docs[:top_k]
 
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     reranker = ReRanker()
-    
+
     query = "What is GDPR?"
     docs = [
         {"text": "The GDPR is a regulation in EU law on data protection.", "metadata": {}},
         {"text": "Apples are a type of fruit.", "metadata": {}},
         {"text": "GDPR fines can be huge.", "metadata": {}}
     ]
-    
+
     print("\nBefore Ranking:")
     for d in docs: print(f"- {d['text']}")
-    
+
     ranked = reranker.rerank(query, docs)
-    
+
     print("\nAfter Ranking:")
     for d in ranked: print(f"[{d['rerank_score']:.4f}] {d['text']}")
@@ -1,29 +1,134 @@
 import os
 import logging
-from typing import List, Dict, Optional
+import re
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 import chromadb
 from chromadb.config import Settings
-from google import genai
 from dotenv import load_dotenv
 
 # Use our custom embedding function
 from src.utils.embeddings import GoogleGenAIEmbeddingFunction
+from src.retrieval.vector_backends import make_vector_backend
+from src.utils.llm_gateway import get_gateway
+from src.utils.deadline import stage_allowed
+from src.utils.tracing import span
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Local classification: lexicon hits + similarity to per-regulation centroids.
+# The LLM is only asked when the local margin is below CLASSIFIER_MARGIN.
+CLASSIFIER_MARGIN = float(os.getenv("CLASSIFIER_MARGIN", "0.2"))
+CLASSIFIER_MODEL = "gemini-2.0-flash-lite-preview-02-05"
+LABELS = ("GDPR", "EU_AI_Act", "BOTH")
+CENTROID_SCALE = 0.05 # Cosine gap between the two centroids that counts as a confident call
+LEXICON_WEIGHT = 0.5
+
+LEXICON = {
+    "GDPR": [
+        "gdpr", "personal data", "data subject", "controller", "processor", "dpo",
+        "data protection officer", "consent", "erasure", "right to be forgotten", "privacy",
+        "data breach", "dpia", "data protection impact assessment", "lawful basis",
+        "legitimate interest", "supervisory authority", "profiling", "special categories",
+        "data portability", "rectification", "cross-border transfer", "adequacy decision"
+    ],
+    "EU_AI_Act": [
+        "ai act", "ai system", "ai systems", "artificial intelligence", "high-risk", "high risk",
+        "provider", "deployer", "general-purpose ai", "gpai", "foundation model",
+        "prohibited practice", "prohibited practices", "conformity assessment", "ce marking",
+        "biometric", "emotion recognition", "social scoring", "ai office", "regulatory sandbox",
+        "post-market monitoring", "systemic risk", "deepfake", "chatbot"
+    ],
+}
+# Cues that the question spans both regulations (comparison / interplay)
+BOTH_CUES = ["both", "interplay", "intersection", "interact", "compare", "comparison", "versus", " vs ", "overlap", "conflict"]
+
+def _lexicon_pattern(terms: List[str]) -> re.Pattern:
+    return re.compile(r"\b(" + "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)) + r")\b")
+
+LEXICON_PATTERNS = {label: _lexicon_pattern(terms) for label, terms in LEXICON.items()}
+
+def regulation_centroids(collection) -> Dict[str, np.ndarray]:
+    """
+    Mean of the normalised chunk embeddings per regulation (one pass at startup).
+    """
+    data = collection.get(include=["embeddings", "metadatas"])
+    embeddings = np.asarray(data['embeddings'], dtype=np.float32)
+    if not len(embeddings):
+        return {}
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    regulations = np.array([(m or {}).get('regulation', '') for m in data['metadatas']])
+
+    centroids = {}
+    for label in LEXICON:
+        rows = embeddings[regulations == label]
+        if len(rows):
+            centroid = rows.mean(axis=0)
+            centroids[label] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    return centroids
+
 class QueryClassifier:
-    def __init__(self):
+    def __init__(self, embedding_fn=None, centroids: Optional[Dict[str, np.ndarray]] = None,
+                 margin_threshold: float = CLASSIFIER_MARGIN):
         self.api_key = os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY not found")
-        # Initialize new SDK client
-        self.client = genai.Client(api_key=self.api_key)
-        
-    def classify(self, query: str) -> str:
+        # Shared LLM gateway (only used for low-margin fallbacks)
+        self.llm = get_gateway(self.api_key)
+        self.embedding_fn = embedding_fn
+        self.centroids = centroids or {}
+        self.margin_threshold = margin_threshold
+
+        self.local = 0
+        self.fallbacks = 0
+        self.fallback_failures = 0
+
+    def predict(self, query: str, query_embedding: Optional[List[float]] = None) -> Tuple[str, float]:
+        """
+        Local classification. Returns (label, margin); margin is in [0, 1],
+        and low values mean the lexicon and centroids do not agree on a side.
+        """
+        text = f" {query.lower()} "
+        hits = {label: len(pattern.findall(text)) for label, pattern in LEXICON_PATTERNS.items()}
+        if hits["GDPR"] and hits["EU_AI_Act"] and any(cue in text for cue in BOTH_CUES):
+            return "BOTH", 1.0
+
+        # Signed score: > 0 leans GDPR, < 0 leans EU_AI_Act
+        lexicon = (hits["GDPR"] - hits["EU_AI_Act"]) / (hits["GDPR"] + hits["EU_AI_Act"] + 1)
+        centroid = 0.0
+        if len(self.centroids) == 2:
+            if query_embedding is None and self.embedding_fn is not None:
+                query_embedding = self.embedding_fn([query])[0]
+            if query_embedding is not None:
+                q = np.asarray(query_embedding, dtype=np.float32)
+                q = q / max(np.linalg.norm(q), 1e-12)
+                gap = float(q @ self.centroids["GDPR"] - q @ self.centroids["EU_AI_Act"])
+                centroid = float(np.clip(gap / CENTROID_SCALE, -1.0, 1.0))
+
+        score = LEXICON_WEIGHT * lexicon + (1 - LEXICON_WEIGHT) * centroid
+        if hits["GDPR"] and hits["EU_AI_Act"] and abs(score) < self.margin_threshold:
+            return "BOTH", 1.0 - abs(score) # Both named, neither dominates
+        return ("GDPR" if score >= 0 else "EU_AI_Act"), abs(score)
+
+    def classify(self, query: str, query_embedding: Optional[List[float]] = None) -> str:
         """
         Classifies the query into 'GDPR', 'EU_AI_Act', or 'BOTH'.
         """
+        label, margin = self.predict(query, query_embedding)
+        if margin >= self.margin_threshold:
+            self.local += 1
+            return label
+
+        if not stage_allowed("classifier_llm"):
+            self.local += 1
+            return label # Out of time for the LLM; keep the local call
+        
+        self.fallbacks += 1
+        logger.info(f"Local classification margin {margin:.2f} < {self.margin_threshold}. Asking the LLM.")
+        return self._classify_llm(query)
+
+    def _classify_llm(self, query: str) -> str:
         prompt = f"""
         You are a legal modification assistant. Classify the following query based on which regulation it pertains to.
         
@@ -35,46 +140,35 @@ class QueryClassifier:
         Query: "{query}"
         
         """
+        # The gateway paces and retries transient errors
         try:
-            import time
-            from google.genai import types
-            
-            # RATE LIMIT SAFETY: Sleep briefly to prevent accidental cost spikes
-            time.sleep(1.0) 
+            response = self.llm.generate_content(
+                model=CLASSIFIER_MODEL,
+                contents=prompt,
+                component="classifier"
+            )
+            classification = response.text.strip()
             
-            # Simple retry with backoff
-            max_retries = 2
-            for attempt in range(max_retries):
-                try:
-                    response = self.client.models.generate_content(
-                        model='gemini-2.0-flash-lite-preview-02-05',
-                        contents=prompt
-                    )
-                    classification = response.text.strip()
-                    
-                    # Safety cleanup
-                    for valid in ["GDPR", "EU_AI_Act", "BOTH"]:
-                        if valid in classification:
-                            return valid
-                    return "BOTH" # Fallback if model hallucinates
-                    
-                except Exception as e:
-                    if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                        if attempt < max_retries - 1:
-                            sleep_time = 2 
-                            logger.warning(f"Rate limited. Retrying in {sleep_time}s...")
-                            time.sleep(sleep_time)
-                            continue
-                    
-                    # If we fail or run out of retries, log and fallback
-                    logger.warning(f"Classification API failed: {e}. Falling back to 'BOTH'.")
-                    return "BOTH"
-            
-            return "BOTH" # Default fallback
+            # Safety cleanup
+            for valid in LABELS:
+                if valid in classification:
+                    return valid
+            return "BOTH" # Fallback if model hallucinates
             
         except Exception as e:
-            logger.error(f"Classification failed: {e}")
-            return "BOTH"
+            logger.warning(f"Classification API failed: {e}. Falling back to 'BOTH'.")
+        
+        self.fallback_failures += 1
+        return "BOTH" # Default fallback
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.local + self.fallbacks
+        return {
+            "local": self.local,
+            "llm_fallbacks": self.fallbacks,
+            "llm_fallback_failures": self.fallback_failures,
+            "fallback_rate": self.fallbacks / total if total else 0.0
+        }
 
 class RegulationRetriever:
     def __init__(self):
@@ -94,11 +188,20 @@ class RegulationRetriever:
             name="eu_ai_gdpr_rules",
             embedding_function=self.embedding_fn
         )
-        self.classifier = QueryClassifier()
+        self.vector_store = make_vector_backend(self.collection, "eu_ai_gdpr_rules")
+        self.classifier = QueryClassifier(
+            embedding_fn=self.embedding_fn,
+            centroids=regulation_centroids(self.collection)
+        )
+        
+    def retrieve(self, query: str, k: int = 5, query_embedding: Optional[List[float]] = None) -> List[Dict]:
+        # Embed once: shared by the classifier and the vector search
+        if query_embedding is None:
+            query_embedding = self.embedding_fn([query])[0]
         
-    def retrieve(self, query: str, k: int = 5) -> List[Dict]:
         # 1. Classify
-        category = self.classifier.classify(query)
+        with span("classify"):
+            category = self.classifier.classify(query, query_embedding=query_embedding)
         logger.info(f"Query classified as: {category}")
         
         # 2. Define Filter
@@ -110,11 +213,12 @@ class RegulationRetriever:
         # If BOTH, no filter
         
         # 3. Query Vector Store
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=k,
-            where=where_filter
-        )
+        with span("vector_search"):
+            results = self.vector_store.query(
+                query_embeddings=[query_embedding],
+                n_results=k,
+                where=where_filter
+            )
         
         # 4. Format Results
         documents = []
@@ -147,3 +251,4 @@ if __name__ == "__main__":
         print(f"Classification: {docs[0]['classification'] if docs else 'None'}")
         for d in docs:
             print(f"[{d['metadata']['regulation']}] {d['text'][:80]}...")
+    print(f"\nClassifier: {retriever.classifier.stats()}")
@@ -0,0 +1,368 @@
+import json
+import logging
+import mmap
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# "chroma" (PersistentClient / HNSW) or "numpy" (exact, memory-mapped matrix)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+VECTOR_INDEX_DIR = Path("data/vector_index")
+# NumpyBackend first-pass scan: "none" (exact), "int8" or "binary" (sign bits),
+# followed by full-precision rescoring of n_results * VECTOR_RESCORE_FACTOR candidates
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+# Storage dtype of the full-precision matrix; float16 halves its size (and page-ins)
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+QUANTIZATIONS = ("none", "int8", "binary")
+DTYPES = ("float32", "float16")
+FILTER_OPERATORS = ("$eq", "$ne", "$in", "$nin")
+SCAN_BLOCK_ROWS = 4096 # Bounds the float32 upcast of int8 codes during a scan
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+DEFAULT_INCLUDE = ["documents", "metadatas", "distances"]
+
+def collection_space(collection) -> str:
+    """
+    Distance space of a Chroma collection: from its configuration (chromadb >= 1.0),
+    else the legacy "hnsw:space" metadata, else Chroma's default "l2".
+    """
+    config = getattr(collection, "configuration_json", None) or {}
+    for index in ("hnsw", "spann"):
+        space = (config.get(index) or {}).get("space")
+        if space:
+            return space
+    return (collection.metadata or {}).get("hnsw:space") or "l2"
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"): # numpy >= 2.0
+        return np.bitwise_count(words)
+    return POPCOUNT[words.view(np.uint8)].reshape(words.shape + (-1,)).sum(axis=-1)
+
+class VectorBackend(ABC):
+    """
+    Minimal vector-store surface used by the retrievers. Results use the same
+    shape as `chromadb.Collection.query` / `.get`, so callers are backend-agnostic.
+    """
+    @abstractmethod
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None,
+              include: Optional[List[str]] = None) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def get(self, ids: List[str], include: Optional[List[str]] = None) -> Dict[str, Any]:
+        ...
+
+class ChromaBackend(VectorBackend):
+    def __init__(self, collection):
+        self.collection = collection
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=include or DEFAULT_INCLUDE
+        )
+
+    def get(self, ids, include=None):
+        return self.collection.get(ids=ids, include=include or ["documents", "metadatas"])
+
+class NumpyBackend(VectorBackend):
+    """
+    Exact nearest-neighbour search over one memory-mapped embedding matrix.
+
+    Layout (one directory per collection):
+    - embeddings.npy   float32 (or float16) [N, dim]
+    - sq_norms.npy     float32 [N], squared L2 norms (for l2 distance)
+    - regulation.npy   int16 [N], index into meta.json "regulations" (filter column)
+    - ids.npy          chunk ids
+    - texts.bin        UTF-8 documents, concatenated (memory-mapped); row i is
+                       texts.bin[text_offsets[i]:text_offsets[i + 1]] (text_offsets.npy int64 [N + 1])
+    - metadatas.bin    one JSON object per row, same layout (metadata_offsets.npy),
+                       decoded only for the rows a result returns
+    - meta.json        {"space", "dtype", "dim", "regulations"}
+    - int8_codes.npy   int8 [N, dim] + int8_scale.npy float32 [dim] (per-dimension scale)
+    - binary_codes.npy uint8 [N, dim / 8], packed sign bits
+
+    Top-k is one matmul plus `argpartition`; distances match the collection's
+    distance space ("l2" = squared L2, as Chroma reports it; "cosine"; "ip").
+
+    With `quantization` "int8" / "binary" the first pass scans the packed codes
+    (int8 dot products / Hamming popcount), and only the best
+    n_results * rescore_factor candidates are rescored against the full-precision
+    rows, so the float matrix is only paged in for those rows.
+    """
+    def __init__(self, path: Path, quantization: str = "none", rescore_factor: int = VECTOR_RESCORE_FACTOR):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}'. Expected one of {QUANTIZATIONS}")
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self.path = Path(path)
+        with open(self.path / "meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.text_offsets, self._texts_file, self._texts = self._map_blob("texts", "text_offsets")
+        self.metadata_offsets, self._metadatas_file, self._metadatas = self._map_blob("metadatas", "metadata_offsets")
+
+        self.embeddings = np.load(self.path / "embeddings.npy", mmap_mode='r')
+        self.sq_norms = np.load(self.path / "sq_norms.npy", mmap_mode='r')
+        self.regulation = np.load(self.path / "regulation.npy", mmap_mode='r')
+        self.ids = np.load(self.path / "ids.npy", mmap_mode='r')
+        self.space = self.meta.get("space", "l2")
+        self._regulation_codes = {r: i for i, r in enumerate(self.meta["regulations"])}
+        self._row_of = {str(doc_id): i for i, doc_id in enumerate(self.ids)}
+        self._mask_cache: Dict[tuple, np.ndarray] = {}
+
+        if quantization == "int8":
+            self.int8_codes = np.load(self.path / "int8_codes.npy", mmap_mode='r')
+            self.int8_scale = np.load(self.path / "int8_scale.npy")
+        elif quantization == "binary":
+            self.binary_codes = np.load(self.path / "binary_codes.npy", mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def exists(path: Path) -> bool:
+        # An index from before texts.bin (records.json) counts as missing and is re-exported
+        return (Path(path) / "meta.json").exists() and (Path(path) / "texts.bin").exists()
+
+    @staticmethod
+    def stored_dtype(path: Path) -> str:
+        with open(Path(path) / "meta.json", "r", encoding="utf-8") as f:
+            return json.load(f).get("dtype", "float32")
+
+    @staticmethod
+    def build(collection, path: Path, dtype: str = VECTOR_DTYPE):
+        """
+        Exports a Chroma collection (embeddings, documents, metadatas) to the numpy layout.
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown vector dtype '{dtype}'. Expected one of {DTYPES}")
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        embeddings = np.asarray(data['embeddings'], dtype=np.float32)
+        metadatas = data['metadatas']
+
+        regulations = sorted({m.get('regulation', '') for m in metadatas})
+        codes = {r: i for i, r in enumerate(regulations)}
+
+        np.save(path / "embeddings.npy", embeddings.astype(dtype))
+        NumpyBackend._save_codes(embeddings, path)
+        np.save(path / "sq_norms.npy", (embeddings ** 2).sum(axis=1).astype(np.float32))
+        np.save(path / "regulation.npy", np.array([codes[m.get('regulation', '')] for m in metadatas], dtype=np.int16))
+        np.save(path / "ids.npy", np.array(data['ids'], dtype=str))
+        NumpyBackend._write_blob([(doc or "").encode("utf-8") for doc in data['documents']], path, "texts", "text_offsets")
+        NumpyBackend._write_blob([json.dumps(m).encode("utf-8") for m in metadatas], path, "metadatas", "metadata_offsets")
+        (path / "records.json").unlink(missing_ok=True) # Previous layout
+        with open(path / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "space": collection_space(collection),
+                "dtype": dtype,
+                "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+                "regulations": regulations
+            }, f)
+        logger.info(f"Vector index written: {path} ({len(data['ids'])} x {embeddings.shape[-1]} {dtype})")
+
+    @staticmethod
+    def _write_blob(values: List[bytes], path: Path, name: str, offsets_name: str):
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        with open(path / f"{name}.bin", "wb") as f:
+            for i, data in enumerate(values):
+                f.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+        np.save(path / f"{offsets_name}.npy", offsets)
+
+    def _map_blob(self, name: str, offsets_name: str):
+        offsets = np.load(self.path / f"{offsets_name}.npy", mmap_mode='r')
+        f = open(self.path / f"{name}.bin", "rb")
+        # mmap cannot map an empty file
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if offsets[-1] > 0 else b""
+        return offsets, f, data
+
+    def _document(self, row: int) -> str:
+        return self._texts[self.text_offsets[row]:self.text_offsets[row + 1]].decode("utf-8")
+
+    def _metadata(self, row: int) -> Dict[str, Any]:
+        return json.loads(self._metadatas[self.metadata_offsets[row]:self.metadata_offsets[row + 1]])
+
+    @staticmethod
+    def _save_codes(embeddings: np.ndarray, path: Path):
+        # int8: symmetric per-dimension scale so each column uses the full [-127, 127] range
+        scale = np.abs(embeddings).max(axis=0) / 127.0 if len(embeddings) else np.ones(embeddings.shape[-1])
+        scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+        np.save(path / "int8_codes.npy", np.clip(np.rint(embeddings / scale), -127, 127).astype(np.int8))
+        np.save(path / "int8_scale.npy", scale)
+        # binary: one sign bit per dimension
+        np.save(path / "binary_codes.npy", np.packbits(embeddings > 0, axis=1))
+
+    def _equals(self, field: str, value: Any) -> np.ndarray:
+        key = (field, value)
+        if key not in self._mask_cache:
+            if field == "regulation":
+                code = self._regulation_codes.get(value, -1)
+                self._mask_cache[key] = np.asarray(self.regulation) == code
+            else:
+                self._mask_cache[key] = np.array(
+                    [self._metadata(row).get(field) == value for row in range(len(self.ids))], dtype=bool
+                )
+        return self._mask_cache[key]
+
+    def _mask(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Boolean row mask for a metadata filter: {"field": value} or
+        {"field": {op: value}} with op in FILTER_OPERATORS, combined with "$and".
+        """
+        if not where:
+            return None
+        if "$and" in where:
+            masks = [self._mask(clause) for clause in where["$and"]]
+            return np.logical_and.reduce(masks)
+
+        mask = np.ones(len(self.ids), dtype=bool)
+        for field, value in where.items():
+            op = "$eq"
+            if isinstance(value, dict):
+                if len(value) != 1:
+                    raise ValueError(f"Expected one operator per field in filter, got {value}")
+                (op, value), = value.items()
+            unsupported = field if field.startswith("$") else (op if op not in FILTER_OPERATORS else None)
+            if unsupported:
+                raise ValueError(f"NumpyBackend does not support the '{unsupported}' filter operator. Supported: {FILTER_OPERATORS} and $and")
+            values = value if op in ("$in", "$nin") else [value]
+            column = np.logical_or.reduce([self._equals(field, v) for v in values]) if values else np.zeros(len(self.ids), dtype=bool)
+            mask &= ~column if op in ("$ne", "$nin") else column
+        return mask
+
+    def _distances(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Exact distances of queries to all rows (or to `rows` only).
+        """
+        embeddings = self.embeddings if rows is None else self.embeddings[rows]
+        sq_norms = self.sq_norms if rows is None else self.sq_norms[rows]
+        dots = queries @ embeddings.T # float16 storage is upcast by the matmul
+        if self.space == "ip":
+            return 1.0 - dots
+        if self.space == "cosine":
+            q_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            d_norms = np.sqrt(sq_norms)[None, :]
+            return 1.0 - dots / np.maximum(q_norms * d_norms, 1e-12)
+        q_sq = (queries ** 2).sum(axis=1, keepdims=True)
+        return np.maximum(q_sq + sq_norms[None, :] - 2.0 * dots, 0.0)
+
+    def _approx_distances(self, queries: np.ndarray) -> np.ndarray:
+        """
+        First-pass scores from the quantized codes (lower is better; only the
+        ranking matters).
+        """
+        n_rows = len(self.ids)
+        out = np.empty((len(queries), n_rows), dtype=np.float32)
+
+        if self.quantization == "binary":
+            # Hamming distance; 64-bit words when the code width allows it
+            q_bits = np.packbits(queries > 0, axis=1)
+            word = np.uint64 if q_bits.shape[1] % 8 == 0 else np.uint8
+            q_bits = q_bits.view(word)
+            for start in range(0, n_rows, SCAN_BLOCK_ROWS):
+                block = np.ascontiguousarray(self.binary_codes[start:start + SCAN_BLOCK_ROWS]).view(word)
+                xor = np.bitwise_xor(block[None, :, :], q_bits[:, None, :])
+                out[:, start:start + len(block)] = _popcount(xor).sum(axis=2)
+            return out
+
+        # int8: dot(q, codes * scale) == dot(q * scale, codes)
+        q_scaled = queries * self.int8_scale[None, :]
+        for start in range(0, n_rows, SCAN_BLOCK_ROWS):
+            block = np.asarray(self.int8_codes[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            out[:, start:start + len(block)] = q_scaled @ block.T
+        if self.space == "cosine":
+            out /= np.maximum(np.sqrt(self.sq_norms), 1e-12)[None, :]
+        elif self.space == "l2":
+            # ||d||^2 - 2 q.d (the ||q||^2 term is constant per query)
+            out = self.sq_norms[None, :] - 2.0 * out
+            return out
+        return -out
+
+    def _format(self, rows_per_query: List[np.ndarray], distances: List[np.ndarray], include: List[str]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"ids": [[str(self.ids[r]) for r in rows] for rows in rows_per_query]}
+        result["documents"] = [[self._document(r) for r in rows] for rows in rows_per_query] if "documents" in include else None
+        result["metadatas"] = [[self._metadata(r) for r in rows] for rows in rows_per_query] if "metadatas" in include else None
+        result["distances"] = [d.tolist() for d in distances] if "distances" in include else None
+        return result
+
+    @staticmethod
+    def _top_n(row: np.ndarray, n: int) -> np.ndarray:
+        top = np.argpartition(row, n - 1)[:n] if n < len(row) else np.arange(len(row))
+        return top[np.argsort(row[top], kind="stable")]
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        include = include or DEFAULT_INCLUDE
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        quantized = self.quantization != "none"
+        dist = self._approx_distances(queries) if quantized else self._distances(queries)
+
+        mask = self._mask(where)
+        if mask is not None:
+            dist[:, ~mask] = np.inf
+            available = int(mask.sum())
+        else:
+            available = dist.shape[1]
+        n = min(n_results, available)
+        n_candidates = min(available, n * self.rescore_factor)
+
+        rows_per_query, distances = [], []
+        for i, row in enumerate(dist):
+            if n <= 0:
+                rows_per_query.append(np.array([], dtype=np.int64))
+                distances.append(np.array([], dtype=np.float32))
+                continue
+            if not quantized:
+                top = self._top_n(row, n)
+                rows_per_query.append(top)
+                distances.append(row[top])
+                continue
+            # Rescore the first-pass candidates at full precision
+            candidates = np.sort(self._top_n(row, n_candidates))
+            exact = self._distances(queries[i:i + 1], rows=candidates)[0]
+            best = self._top_n(exact, n)
+            rows_per_query.append(candidates[best])
+            distances.append(exact[best])
+        return self._format(rows_per_query, distances, include)
+
+    def get(self, ids, include=None):
+        include = include or ["documents", "metadatas"]
+        rows = [self._row_of[i] for i in ids if i in self._row_of]
+        formatted = self._format([np.asarray(rows, dtype=np.int64)], [np.zeros(len(rows))], include)
+        return {
+            "ids": formatted["ids"][0],
+            "documents": formatted["documents"][0] if formatted["documents"] is not None else None,
+            "metadatas": formatted["metadatas"][0] if formatted["metadatas"] is not None else None
+        }
+
+def make_vector_backend(collection, collection_name: str, backend: str = VECTOR_BACKEND,
+                        quantization: str = VECTOR_QUANTIZATION, dtype: str = VECTOR_DTYPE) -> VectorBackend:
+    """
+    Returns the configured backend for a collection. The numpy index is exported
+    from Chroma on first use if ingestion has not written it yet, and again if
+    it was written with another storage dtype.
+    """
+    if backend == "chroma":
+        return ChromaBackend(collection)
+    if backend == "numpy":
+        path = VECTOR_INDEX_DIR / collection_name
+        if not NumpyBackend.exists(path):
+            logger.info(f"Vector index for '{collection_name}' not found. Exporting from Chroma (one-time)...")
+            NumpyBackend.build(collection, path, dtype=dtype)
+        elif NumpyBackend.stored_dtype(path) != dtype:
+            logger.info(f"Vector index for '{collection_name}' is not stored as {dtype}. Re-exporting from Chroma...")
+            NumpyBackend.build(collection, path, dtype=dtype)
+        elif quantization != "none" and not (path / f"{quantization}_codes.npy").exists():
+            logger.info(f"Quantized codes for '{collection_name}' not found. Writing them from the stored vectors...")
+            NumpyBackend._save_codes(np.asarray(np.load(path / "embeddings.npy"), dtype=np.float32), path)
+        return NumpyBackend(path, quantization=quantization)
+    raise ValueError(f"Unknown vector backend '{backend}'. Expected 'chroma' or 'numpy'.")
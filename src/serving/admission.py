@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict
+
+from src.utils.deadline import current_deadline
+from src.utils.tracing import incr, metrics
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "8")) # Pipeline executions at once
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32")) # Requests waiting for a slot
+ADMISSION_MAX_WAIT_MS = int(os.getenv("ADMISSION_MAX_WAIT_MS", "5000")) # Longest a request may wait in the queue
+INITIAL_SERVICE_TIME = 2.0 # Seconds; prior for the Retry-After estimate until executions are observed
+SERVICE_TIME_ALPHA = 0.2 # EWMA weight of the latest slot hold time
+
+class AdmissionRejectedError(Exception):
+    """
+    Raised instead of queueing: 429 when the queue is full, 503 when the wait timed out.
+    """
+    def __init__(self, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"Server busy ({reason}). Retry after {retry_after}s.")
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Bounds concurrent pipeline executions. Up to `max_concurrency` run at once;
+    up to `max_queue` more wait in FIFO order for at most `max_wait_ms` (or the
+    request's remaining deadline, if shorter). Everything beyond that is
+    rejected immediately, so admitted requests keep a bounded latency.
+
+    A released slot is handed directly to the oldest waiter, so a newcomer can
+    never overtake the queue.
+    """
+    def __init__(self, max_concurrency: int = ADMISSION_MAX_CONCURRENCY, max_queue: int = ADMISSION_MAX_QUEUE,
+                 max_wait_ms: int = ADMISSION_MAX_WAIT_MS):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait_ms / 1000
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._service_time = INITIAL_SERVICE_TIME
+
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    def retry_after(self) -> int:
+        """
+        Seconds until a slot is likely free: queue ahead of us times the mean service time, per slot.
+        """
+        return max(1, math.ceil((len(self._waiters) + 1) * self._service_time / self.max_concurrency))
+
+    def _reject(self, reason: str, status_code: int) -> AdmissionRejectedError:
+        if reason == "queue_full":
+            self.rejected_queue_full += 1
+        else:
+            self.rejected_timeout += 1
+        incr("admission_rejected", reason=reason)
+        error = AdmissionRejectedError(reason, status_code, self.retry_after())
+        logger.warning(f"Admission: {error} (active {self._active}, queued {len(self._waiters)})")
+        return error
+
+    def _admit(self, waited: float):
+        self.admitted += 1
+        metrics.observe("admission_wait", waited)
+
+    async def acquire(self):
+        """
+        Takes a slot, waiting in the queue if needed. Raises AdmissionRejectedError.
+        """
+        start = time.perf_counter()
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            self._admit(0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full", 429)
+
+        max_wait = self.max_wait
+        deadline = current_deadline()
+        if deadline is not None:
+            max_wait = max(0.0, min(max_wait, deadline.remaining()))
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=max_wait)
+        except asyncio.CancelledError: # Client went away while queued
+            if waiter.done() and not waiter.cancelled():
+                self.release() # The slot was already handed over; pass it on
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            raise
+
+        if not waiter.done():
+            waiter.cancel()
+            self._waiters.remove(waiter)
+            raise self._reject("queue_timeout", 503)
+        self._admit(time.perf_counter() - start)
+
+    def release(self):
+        # Hand the slot to the oldest live waiter (it keeps the active count), else free it
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def _observe_service(self, seconds: float):
+        self._service_time = (1 - SERVICE_TIME_ALPHA) * self._service_time + SERVICE_TIME_ALPHA * seconds
+
+    async def run(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs `fn()` holding a slot.
+        """
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            return await fn()
+        finally:
+            self._observe_service(time.perf_counter() - start)
+            self.release()
+
+    async def hold(self, source: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Passes a stream through while holding an already-acquired slot; the
+        slot is released when the stream ends (normally, by error or by close).
+        """
+        start = time.perf_counter()
+        try:
+            async for event in source:
+                yield event
+        finally:
+            self._observe_service(time.perf_counter() - start)
+            self.release()
+
+    async def run_stream(self, source: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Passes a stream through holding a slot, acquiring it first (queueing as
+        usual). Raises AdmissionRejectedError before the first event.
+        """
+        await self.acquire()
+        async for event in self.hold(source):
+            yield event
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "queued": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "service_time_seconds": round(self._service_time, 3)
+        }
+
+class StreamAdmission:
+    """
+    Admission for shared (single-flight) streams. The slot is taken before the
+    response starts, so a rejection is still a plain 429/503, but the stream's
+    producer only exists once a subscriber starts iterating. Concurrent
+    requests for the same key therefore share one admission decision, and the
+    admitted slot is reserved for the key until the producer claims it.
+    """
+    def __init__(self, controller: AdmissionController):
+        self.controller = controller
+        self._admitting: Dict[Any, asyncio.Future] = {}
+        self._reserved: Dict[Any, int] = {}
+
+    async def admit(self, key: Any) -> bool:
+        """
+        Admits a request for `key`; True if it reserved a slot, False if it
+        shares the slot of a request admitted (or being admitted) for the same
+        stream. Raises AdmissionRejectedError.
+        """
+        if self._reserved.get(key):
+            return False
+        while key in self._admitting:
+            pending = self._admitting[key]
+            try:
+                await asyncio.shield(pending)
+                return False
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The request being admitted went away; try again ourselves
+
+        pending = self._admitting[key] = asyncio.get_running_loop().create_future()
+        try:
+            await self.controller.acquire()
+        except AdmissionRejectedError as e:
+            pending.set_exception(e)
+            pending.exception() # Mark retrieved; joiners re-raise it from their own await
+            raise
+        except BaseException:
+            pending.cancel()
+            raise
+        else:
+            self._reserved[key] = self._reserved.get(key, 0) + 1
+            pending.set_result(None)
+            return True
+        finally:
+            self._admitting.pop(key, None)
+
+    def claim(self, key: Any) -> bool:
+        """
+        Takes a reserved slot for `key` when starting its producer.
+        """
+        if not self._reserved.get(key):
+            return False
+        self._unreserve(key)
+        return True
+
+    def _unreserve(self, key: Any):
+        self._reserved[key] -= 1
+        if not self._reserved[key]:
+            del self._reserved[key]
+
+    def give_back(self, key: Any):
+        """
+        Releases a reservation for `key` that no producer claimed (the request
+        joined a stream that was already running, or went away).
+        """
+        if self._reserved.get(key):
+            self._unreserve(key)
+            self.controller.release()
@@ -1,13 +1,19 @@
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional
+import json
 import uvicorn
 import logging
 
 from src.generation.generator import RAGGenerator
+from src.serving.admission import AdmissionController, AdmissionRejectedError, StreamAdmission
+from src.serving.single_flight import SingleFlight, StreamSingleFlight, flight_key
+from src.utils.embedding_cache import get_default_cache
+from src.utils.deadline import request_deadline
+from src.utils.tracing import metrics, request_trace
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO)
@@ -32,15 +38,45 @@ except Exception as e:
     logger.error(f"Failed to initialize RAGGenerator: {e}")
     generator = None
 
+# Identical concurrent queries share one pipeline execution
+answer_flights = SingleFlight()
+stream_flights = StreamSingleFlight()
+# Bounds concurrent pipeline executions; excess requests queue briefly or are rejected
+admission = AdmissionController()
+stream_admission = StreamAdmission(admission)
+
+# Component stats exported as gauges on /api/metrics
+metrics.register_stats("single_flight", lambda: {
+    "executions": answer_flights.executions + stream_flights.executions,
+    "coalesced": answer_flights.coalesced + stream_flights.coalesced
+})
+metrics.register_stats("admission", admission.stats)
+metrics.register_stats("embedding_cache", lambda: get_default_cache().stats())
+if generator:
+    metrics.register_stats("llm_gateway", generator.llm.stats)
+    if generator.cache:
+        metrics.register_stats("semantic_cache", generator.cache.stats)
+    if generator.retriever.article_lookup:
+        metrics.register_stats("article_lookup", generator.retriever.article_lookup.stats)
+    if generator.retriever.reranker:
+        metrics.register_stats("reranker", generator.retriever.reranker.stats)
+
 class ChatRequest(BaseModel):
     query: str
     regulation: Optional[str] = None
+    trace: bool = False # Attach the per-stage timing trace to the response
+    deadline_ms: Optional[int] = Field(default=None, gt=0) # Time budget; defaults to REQUEST_DEADLINE_MS
 
 class ChatResponse(BaseModel):
     answer: str
     confidence: float
     context: List[Dict[str, Any]]
     graph_data: Dict[str, Any]
+    trace: Optional[Dict[str, Any]] = None
+    degraded: List[str] = [] # Optional stages skipped or cut short to meet the deadline
+
+def busy(error: AdmissionRejectedError) -> HTTPException:
+    return HTTPException(status_code=error.status_code, detail=str(error), headers={"Retry-After": str(error.retry_after)})
 
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
@@ -49,28 +85,123 @@ async def chat(request: ChatRequest):
         
     logger.info(f"Received query: {request.query}")
     try:
-        result = generator.generate_answer(request.query, regulation_filter=request.regulation)
+        # The single-flight task is created inside the trace and deadline, so the leader's stages see both.
+        # Only the leader takes an admission slot; coalesced requests add no work. A request
+        # with a larger budget than the leader's runs (and is admitted) on its own.
+        with request_trace("chat") as trace, request_deadline(request.deadline_ms):
+            result = await answer_flights.do(
+                flight_key(request.query, request.regulation),
+                lambda: admission.run(lambda: generator.agenerate_answer(request.query, regulation_filter=request.regulation))
+            )
         return ChatResponse(
             answer=result['answer'],
             confidence=result.get('confidence', 0),
             context=result.get('context', []),
-            graph_data=result.get('graph_data', {"nodes": [], "edges": []})
+            graph_data=result.get('graph_data', {"nodes": [], "edges": []}),
+            trace=trace.to_dict() if request.trace else None,
+            degraded=result.get('degraded', [])
         )
+    except AdmissionRejectedError as e:
+        raise busy(e) from e
+    except TimeoutError as e: # Coalesced onto a slower request and ran out of its own deadline
+        raise HTTPException(status_code=504, detail="Deadline exceeded waiting for an identical in-flight request") from e
     except Exception as e:
         logger.error(f"Error processing request: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+class StreamingResponseWithCleanup(StreamingResponse):
+    """
+    Runs `cleanup` once the response is over however it ended, including a
+    client that disconnected before the body was iterated (where neither the
+    body generator's `finally` nor a background task would run).
+    """
+    def __init__(self, content: AsyncIterator[str], cleanup: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()
+            finally:
+                self.cleanup()
+
+class Reservation:
+    """
+    Admission slot reserved for a stream key by one request; given back at most once.
+    """
+    def __init__(self, key: Any, held: bool):
+        self.key = key
+        self.held = held
+
+    def give_back(self):
+        if self.held:
+            self.held = False
+            stream_admission.give_back(self.key)
+
+async def traced_stream(request: ChatRequest, reservation: Reservation, deadline_ms: Optional[int] = None) -> AsyncIterator[str]:
+    """
+    Follows the shared stream for `request` inside a request trace and deadline;
+    with `request.trace`, the trace is sent as a final {"type": "trace", ...} event.
+
+    Whoever starts the stream's producer claims the admission slot reserved for
+    the key and holds it until the pipeline finishes. A request that reserved
+    a slot but joined a running stream gives it back.
+    """
+    def start() -> AsyncIterator[str]:
+        source = generator.agenerate_answer_stream(request.query, regulation_filter=request.regulation)
+        if stream_admission.claim(reservation.key):
+            return admission.hold(source)
+        # The reserved slot was given back (its request went away, or the stream seen
+        # at admission ended before we subscribed): queue for a slot like any request
+        return admission.run_stream(source)
+
+    try:
+        with request_trace("chat_stream") as trace, request_deadline(deadline_ms):
+            try:
+                async for event in stream_flights.subscribe(reservation.key, start):
+                    reservation.give_back()
+                    yield event
+            except TimeoutError: # Joined a slower stream and ran out of its own deadline
+                yield json.dumps({"type": "error", "content": "Deadline exceeded waiting for an identical in-flight request"}) + "\n"
+    finally:
+        reservation.give_back()
+    if request.trace:
+        yield json.dumps({"type": "trace", **trace.to_dict()}) + "\n"
+
 @app.post("/api/chat/stream")
 async def chat_stream(request: ChatRequest):
     if not generator:
         raise HTTPException(status_code=500, detail="RAG Generator not initialized")
         
     logger.info(f"Received streaming query: {request.query} (Filter: {request.regulation})")
-    return StreamingResponse(
-        generator.generate_answer_stream(request.query, regulation_filter=request.regulation),
+    # Admission happens before the response starts so a rejection is still a proper 429/503.
+    # Joining an in-flight stream needs no slot.
+    key = flight_key(request.query, request.regulation)
+    reserved = False
+    deadline_ms = request.deadline_ms
+    if not stream_flights.in_flight(key):
+        with request_deadline(request.deadline_ms) as deadline:
+            try:
+                reserved = await stream_admission.admit(key)
+            except AdmissionRejectedError as e:
+                raise busy(e) from e
+        if deadline is not None: # Time spent queueing counts against the request's budget
+            deadline_ms = max(1, int(deadline.remaining() * 1000))
+    reservation = Reservation(key, reserved)
+    return StreamingResponseWithCleanup(
+        traced_stream(request, reservation, deadline_ms),
+        cleanup=reservation.give_back,
         media_type="application/x-ndjson"
     )
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/health")
 def health_check():
     return {"status": "ok"}
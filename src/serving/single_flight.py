@@ -0,0 +1,137 @@
+import asyncio
+import json
+import logging
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.utils.deadline import current_deadline
+
+logger = logging.getLogger(__name__)
+
+def flight_key(query: str, regulation: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Normalised (query, regulation) key: case-folded, whitespace collapsed,
+    trailing punctuation dropped.
+    """
+    normalised = re.sub(r'\s+', ' ', query).strip().lower().rstrip('?!. ')
+    return normalised, regulation or ""
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+    The first caller starts the work, later callers await the same result.
+    The work runs as its own task, so a disconnecting caller does not cancel
+    it for the others.
+
+    The work runs under the first caller's deadline and trace. A later caller
+    waits at most until its own deadline and then gets TimeoutError.
+    A later caller with a larger budget than the first one runs its own
+    execution instead, so it is not handed stages the first caller's deadline
+    made it skip.
+    """
+    def __init__(self):
+        self._inflight: Dict[Any, Tuple[asyncio.Task, Optional[float]]] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def _covers(leader_budget_ms: Optional[float], budget_ms: Optional[float]) -> bool:
+        # None = no deadline
+        if leader_budget_ms is None:
+            return True
+        return budget_ms is not None and budget_ms <= leader_budget_ms
+
+    async def do(self, key: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        deadline = current_deadline()
+        budget_ms = deadline.budget_ms if deadline is not None else None
+        entry = self._inflight.get(key)
+        if entry is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = (task, budget_ms)
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            return await asyncio.shield(task)
+
+        task, leader_budget_ms = entry
+        if not self._covers(leader_budget_ms, budget_ms):
+            logger.info(f"Not coalescing onto an in-flight execution with a smaller budget: {key}")
+            self.executions += 1
+            return await fn()
+
+        self.coalesced += 1
+        logger.info(f"Coalescing request onto in-flight execution: {key}")
+        if deadline is None:
+            return await asyncio.shield(task)
+        return await asyncio.wait_for(asyncio.shield(task), timeout=max(0.0, deadline.remaining()))
+
+class _StreamFlight:
+    def __init__(self):
+        self.events: List[str] = []
+        self.done = False
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None # Producer; referenced here so it is not garbage-collected
+
+class StreamSingleFlight:
+    """
+    Single-flight for streaming responses. One producer consumes the source
+    stream into a shared buffer; every subscriber (including ones that join
+    mid-flight) replays the buffer from the start and then follows it live.
+
+    A subscriber that joined an existing flight waits for the first event at
+    most until its own deadline (TimeoutError); once the stream has
+    started it is followed to the end, like the leader's. If the source stream
+    fails, subscribers get a final {"type": "error", ...} event.
+    """
+    def __init__(self):
+        self._inflight: Dict[Any, _StreamFlight] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: Any) -> bool:
+        return key in self._inflight
+
+    async def _produce(self, key: Any, flight: _StreamFlight, source: AsyncIterator[str]):
+        try:
+            async for event in source:
+                async with flight.changed:
+                    flight.events.append(event)
+                    flight.changed.notify_all()
+        except Exception as e:
+            logger.error(f"Shared stream failed: {e}")
+            async with flight.changed:
+                flight.events.append(json.dumps({"type": "error", "content": str(e)}) + "\n")
+        finally:
+            self._inflight.pop(key, None)
+            async with flight.changed:
+                flight.done = True
+                flight.task = None
+                flight.changed.notify_all()
+
+    async def subscribe(self, key: Any, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        flight = self._inflight.get(key)
+        deadline = None
+        if flight is None:
+            self.executions += 1
+            flight = _StreamFlight()
+            self._inflight[key] = flight
+            flight.task = asyncio.create_task(self._produce(key, flight, fn()))
+        else:
+            self.coalesced += 1
+            logger.info(f"Subscribing to in-flight stream: {key}")
+            deadline = current_deadline()
+
+        cursor = 0
+        while True:
+            async with flight.changed:
+                ready = flight.changed.wait_for(lambda cursor=cursor: cursor < len(flight.events) or flight.done)
+                if deadline is not None and cursor == 0:
+                    await asyncio.wait_for(ready, timeout=max(0.0, deadline.remaining()))
+                else:
+                    await ready
+                pending = flight.events[cursor:]
+                finished = flight.done
+            for event in pending:
+                yield event
+            cursor += len(pending)
+            if finished and cursor >= len(flight.events):
+                return
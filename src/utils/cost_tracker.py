@@ -1,4 +1,5 @@
 import tiktoken
+from functools import lru_cache
 from typing import Literal
 
 EncoderModel = Literal["gpt-4o", "gpt-4o-mini", "text-embedding-3-small"]
@@ -9,12 +10,16 @@ PRICES_PER_1M_TOKENS = {
     "text-embedding-3-small": {"input": 0.02, "output": 0.0},
 }
 
-def count_tokens(text: str, model: str = "gpt-4o") -> int:
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-4o") -> tiktoken.Encoding:
+    # Loading a BPE table takes tens of milliseconds; do it once per model
     try:
-        encoding = tiktoken.encoding_for_model(model)
+        return tiktoken.encoding_for_model(model)
     except KeyError:
-        encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(text))
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    return len(get_encoding(model).encode(text))
 
 def estimate_cost(text: str, model: EncoderModel, type: Literal["input", "output"]) -> float:
     tokens = count_tokens(text, model)
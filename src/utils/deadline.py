@@ -0,0 +1,97 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from src.utils.tracing import incr
+
+logger = logging.getLogger(__name__)
+
+# Server-side budget for requests that do not bring their own (0 = no deadline)
+REQUEST_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", "20000"))
+
+# Time that must still be left for an optional stage to run. Larger reserves
+# are given up first as the budget shrinks: graph expansion, then reranking,
+# then the JSON confidence pass (HyDE and the LLM classifier fallback sit in between).
+STAGE_RESERVE_MS: Dict[str, int] = {
+    "graph_expansion": int(os.getenv("DEADLINE_GRAPH_EXPANSION_MS", "12000")),
+    "hyde": int(os.getenv("DEADLINE_HYDE_MS", "10000")),
+    "rerank": int(os.getenv("DEADLINE_RERANK_MS", "8000")),
+    "classifier_llm": int(os.getenv("DEADLINE_CLASSIFIER_LLM_MS", "7000")),
+    "confidence": int(os.getenv("DEADLINE_CONFIDENCE_MS", "5000")),
+}
+# Time kept back for generation when an optional stage is cut short
+GENERATION_RESERVE_MS = int(os.getenv("DEADLINE_GENERATION_MS", "5000"))
+
+class Deadline:
+    """
+    Time budget of one request. Optional stages ask `allows(stage)` before
+    running; the ones that were skipped or cut short are listed in `degraded`.
+    """
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000
+        self.degraded: List[str] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        """
+        Seconds left (negative once expired).
+        """
+        return self.expires_at - time.monotonic()
+
+    def degrade(self, stage: str, reason: str = "skipped"):
+        with self._lock:
+            if stage in self.degraded:
+                return
+            self.degraded.append(stage)
+        incr("degraded_stages", stage=stage)
+        logger.warning(f"Deadline: {stage} {reason} ({self.remaining() * 1000:.0f} ms left of {self.budget_ms:.0f})")
+
+    def allows(self, stage: str) -> bool:
+        if self.remaining() * 1000 >= STAGE_RESERVE_MS.get(stage, 0):
+            return True
+        self.degrade(stage)
+        return False
+
+    def stage_timeout(self) -> float:
+        """
+        Seconds an allowed stage may take while leaving GENERATION_RESERVE_MS for generation.
+        """
+        return max(0.0, self.remaining() - GENERATION_RESERVE_MS / 1000)
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("rag_deadline", default=None)
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+def stage_allowed(stage: str) -> bool:
+    """
+    True if `stage` may run under the current request's deadline (or there is none).
+    """
+    deadline = _current.get()
+    return deadline is None or deadline.allows(stage)
+
+def degraded_stages() -> List[str]:
+    deadline = _current.get()
+    return list(deadline.degraded) if deadline is not None else []
+
+@contextmanager
+def request_deadline(budget_ms: Optional[float] = None):
+    """
+    Sets the deadline for the enclosed work (and tasks/threads started from it).
+    `budget_ms` defaults to REQUEST_DEADLINE_MS; 0 disables the deadline.
+    """
+    budget_ms = REQUEST_DEADLINE_MS if budget_ms is None else budget_ms
+    deadline = Deadline(budget_ms) if budget_ms > 0 else None
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError: # Generator finalised in another context
+            _current.set(None)
@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = "data/cache/embeddings.sqlite"
+DEFAULT_MAX_ENTRIES = 20000
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache:
+    - Memory: LRU of float32 vectors (`max_entries`)
+    - Disk: SQLite table of float32 blobs (optional, survives restarts and re-ingestion)
+
+    Keys are content hashes over (model name, output dimensionality, text),
+    so a model or dimensionality change never returns stale vectors.
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if disk_path:
+            Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model_name: str, dimensionality: int, text: str) -> str:
+        h = hashlib.sha256()
+        h.update(f"{model_name}\x00{dimensionality}\x00".encode("utf-8"))
+        h.update(text.encode("utf-8"))
+        return h.hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Returns {key: vector} for every cached key (memory first, then disk).
+        Hits and misses are counted once per distinct key.
+        """
+        found = {}
+        with self._lock:
+            missing = []
+            for key in dict.fromkeys(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self.memory_hits += 1
+                else:
+                    missing.append(key)
+
+            if missing and self._db is not None:
+                for i in range(0, len(missing), 500): # SQLite variable limit
+                    batch = missing[i:i + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                        batch
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        self._remember(key, vector)
+                        found[key] = vector
+
+                for key in missing:
+                    if key in found:
+                        self.disk_hits += 1
+                    else:
+                        self.misses += 1
+            else:
+                self.misses += len(missing)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, np.asarray(vector, dtype=np.float32))
+            if self._db is not None and items:
+                try:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                        [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items.items()]
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Embedding cache disk write failed: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache() -> EmbeddingCache:
+    """
+    Process-wide cache shared by every GoogleGenAIEmbeddingFunction.
+    EMBEDDING_CACHE_PATH="" keeps it memory-only.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache(
+                max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", str(DEFAULT_MAX_ENTRIES))),
+                disk_path=os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH) or None
+            )
+        return _default_cache
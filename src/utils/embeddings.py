@@ -1,10 +1,12 @@
+import asyncio
 import logging
-import os
 from typing import List, Optional
 
 from chromadb import Documents, EmbeddingFunction, Embeddings
-from google import genai
 from google.genai import types
+from src.utils.embedding_cache import EmbeddingCache, get_default_cache
+from src.utils.llm_gateway import get_gateway
+from src.utils.tracing import incr
 
 logger = logging.getLogger(__name__)
 
@@ -12,11 +14,69 @@ class GoogleGenAIEmbeddingFunction(EmbeddingFunction):
     """
     Custom EmbeddingFunction for ChromaDB using the new `google-genai` SDK.
     Replaces the deprecated `google.generativeai` implementation.
+
+    Embeddings are cached (memory LRU + SQLite, see `EmbeddingCache`); only
+    cache misses are sent to the API.
     """
-    def __init__(self, api_key: str, model_name: str = "models/text-embedding-004"):
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = "models/text-embedding-004",
+        output_dimensionality: int = 768, # Standard for 004
+        cache: Optional[EmbeddingCache] = None,
+        use_cache: bool = True
+    ):
         self.api_key = api_key
         self.model_name = model_name
-        self.client = genai.Client(api_key=self.api_key)
+        self.output_dimensionality = output_dimensionality
+        # Shared gateway: pooled client, embedding quota, retries
+        self.llm = get_gateway(self.api_key)
+        self.cache = (cache or get_default_cache()) if use_cache else None
+
+    def _config(self) -> types.EmbedContentConfig:
+        return types.EmbedContentConfig(output_dimensionality=self.output_dimensionality)
+
+    def _parse_response(self, response, expected: int) -> Embeddings:
+        # Response should contain list of embeddings
+        # Structure depends on SDK version, usually response.embeddings
+        if not hasattr(response, 'embeddings'):
+            raise ValueError(f"Unexpected response format from Google GenAI: {response}")
+        # Each embedding object usually has a 'values' attribute
+        embeddings = [e.values for e in response.embeddings or []]
+        if len(embeddings) != expected:
+            raise ValueError(f"Expected {expected} embeddings from Google GenAI, got {len(embeddings)}")
+        return embeddings
+
+    def _split_cached(self, input: Documents):
+        """
+        Returns (keys, cached {key: vector}, texts still to embed).
+        """
+        keys = [EmbeddingCache.make_key(self.model_name, self.output_dimensionality, t) for t in input]
+        cached = self.cache.get_many(keys)
+        # Distinct texts only: a text repeated in the batch is one lookup (and one embedding)
+        distinct = dict(zip(keys, input, strict=True))
+        misses = [t for k, t in distinct.items() if k not in cached]
+        incr("embedding_cache_lookups", len(distinct) - len(misses), result="hit")
+        incr("embedding_cache_lookups", len(misses), result="miss")
+        return keys, cached, misses
+
+    def _merge(self, input: Documents, keys: List[str], cached: dict, misses: List[str], fresh: Embeddings) -> Embeddings:
+        new_items = {
+            EmbeddingCache.make_key(self.model_name, self.output_dimensionality, t): v
+            for t, v in zip(misses, fresh, strict=True)
+        }
+        self.cache.put_many(new_items)
+        cached.update(new_items)
+        return [list(map(float, cached[k])) for k in keys]
+
+    def _embed(self, texts: List[str]) -> Embeddings:
+        # looking at SDK docs pattern: client.models.embed_content(model=..., contents=[...])
+        response = self.llm.embed_content(
+            model=self.model_name,
+            contents=texts,
+            config=self._config()
+        )
+        return self._parse_response(response, len(texts))
 
     def __call__(self, input: Documents) -> Embeddings:
         """
@@ -27,34 +87,47 @@ class GoogleGenAIEmbeddingFunction(EmbeddingFunction):
             
         try:
             # The new SDK supports batched generation
-            # API expects 'model' and 'content'
-            # We map input documents to the expected format
-            
             # Note: The Google GenAI SDK might have specific batch limits. 
             # ChromaDB usually sends batches, but we should process carefully.
+            if self.cache is None:
+                return self._embed(list(input))
             
-            embeddings = []
-            
-            # Simple iteration for now to ensure robustness, or batch if SDK supports list
-            # looking at SDK docs pattern: client.models.embed_content(model=..., contents=[...])
-            
-            response = self.client.models.embed_content(
+            keys, cached, misses = self._split_cached(input)
+            fresh = self._embed(misses) if misses else []
+            return self._merge(input, keys, cached, misses, fresh)
+                
+        except Exception as e:
+            logger.error(f"Error generating embeddings with Google GenAI: {e}")
+            raise e
+
+    async def aembed(self, input: Documents) -> Embeddings:
+        """
+        Async variant of __call__ using the `client.aio` surface, so the
+        serving event loop is not blocked while the embedding request is in flight.
+        Cache reads and writes (SQLite) run in a worker thread for the same reason.
+        """
+        if not input:
+            return []
+
+        async def embed(texts: List[str]) -> Embeddings:
+            response = await self.llm.aembed_content(
                 model=self.model_name,
-                contents=input,
-                config=types.EmbedContentConfig(output_dimensionality=768) # Standard for 004
+                contents=texts,
+                config=self._config()
             )
-            
-            # Response should contain list of embeddings
-            # Structure depends on SDK version, usually response.embeddings
-            
-            if hasattr(response, 'embeddings'):
-                 # Each embedding object usually has a 'values' attribute
-                return [e.values for e in response.embeddings]
-            else:
-                # Fallback or single item check (unlikely with list input)
-                logger.error(f"Unexpected response format from Google GenAI: {response}")
-                return []
-                
+            return self._parse_response(response, len(texts))
+
+        try:
+            if self.cache is None:
+                return await embed(list(input))
+
+            keys, cached, misses = await asyncio.to_thread(self._split_cached, input)
+            fresh = await embed(misses) if misses else []
+            return await asyncio.to_thread(self._merge, input, keys, cached, misses, fresh)
+
         except Exception as e:
             logger.error(f"Error generating embeddings with Google GenAI: {e}")
             raise e
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats() if self.cache else {}
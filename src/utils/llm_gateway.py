@@ -0,0 +1,508 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_futures
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional, Tuple
+
+import httpx
+from google import genai
+from google.genai import errors
+
+from src.utils.rate_limiter import RateLimiter, estimate_tokens
+from src.utils.tracing import incr
+
+logger = logging.getLogger(__name__)
+
+# Quota of the Gemini project (shared by every component in the process)
+LLM_RPM = float(os.getenv("LLM_RPM", "60"))
+LLM_TPM = float(os.getenv("LLM_TPM", "1000000"))
+EMBED_RPM = float(os.getenv("EMBED_RPM", "1500"))
+EMBED_TPM = float(os.getenv("EMBED_TPM", "1000000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4")) # Retries after the first attempt
+BACKOFF_BASE = 1.0 # Seconds; doubles per retry, with full jitter
+BACKOFF_MAX = 30.0
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5")) # Consecutive transient failures that open the circuit
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30")) # Seconds before a trial call is let through
+RETRYABLE_CODES = (408, 429, 500, 502, 503, 504)
+
+# Hedging: if a (non-streaming) generation call is slower than the component's
+# HEDGE_PERCENTILE latency, send a duplicate and keep whichever returns first
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.05")) # Max hedges as a fraction of hedgeable calls
+HEDGE_MIN_DELAY = 0.1 # Seconds; never hedge sooner than this
+HEDGE_MIN_SAMPLES = 20 # Latencies seen for a component before it is hedged
+HEDGE_WINDOW = 500 # Recent latencies kept per component
+HEDGE_WORKERS = 32 # Threads running hedged sync calls
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+def is_retryable(e: Exception) -> bool:
+    """
+    Rate limits, server errors and transport failures; not bad requests.
+    """
+    if isinstance(e, errors.APIError):
+        return e.code in RETRYABLE_CODES
+    if isinstance(e, (httpx.TransportError, TimeoutError, ConnectionError)):
+        return True
+    return "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e)
+
+def backoff_delay(attempt: int) -> float:
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures and fails
+    calls fast for `cooldown` seconds; then lets one trial call through
+    (half-open) and closes again on its success.
+    """
+    def __init__(self, name: str = "LLM", failure_threshold: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        """
+        Raises CircuitOpenError while open. Returns True if the caller is the half-open trial.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} circuit open (retry in {self.cooldown - (time.monotonic() - self.opened_at):.0f}s)")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def abandon_trial(self):
+        # The trial was cancelled before the API answered; let the next call try again
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"{self.name} circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+def _request_tokens(contents: Any, config: Any = None) -> int:
+    """
+    Estimated prompt tokens (contents plus system instruction) for the TPM bucket.
+    """
+    texts = [contents] if isinstance(contents, str) else [c for c in (contents or []) if isinstance(c, str)]
+    instruction = config.get("system_instruction") if isinstance(config, dict) else getattr(config, "system_instruction", None)
+    if isinstance(instruction, str):
+        texts.append(instruction)
+    return sum(estimate_tokens(t) for t in texts)
+
+class LLMGateway:
+    """
+    The one path to Gemini for the whole process.
+
+    - One `genai.Client` per API key, so every component reuses the same
+      HTTP connection pools (sync and `client.aio`).
+    - Process-wide requests/tokens-per-minute buckets (generation and
+      embeddings have separate quotas); a call only waits when the bucket is empty.
+    - Transient errors (429, 5xx, transport) are retried with exponential
+      backoff and full jitter; other errors are raised immediately.
+    - A circuit breaker per quota (generation, embeddings) fails calls fast
+      while that API keeps failing, so an embedding outage does not stop generation.
+    - Optional hedging (LLM_HEDGE_ENABLED) of non-streaming generation calls
+      that run past their component's tail latency, capped at HEDGE_BUDGET.
+    """
+    def __init__(self, api_key: str):
+        self.client = genai.Client(api_key=api_key)
+        self.generation_limiter = RateLimiter(LLM_RPM, LLM_TPM)
+        self.embedding_limiter = RateLimiter(EMBED_RPM, EMBED_TPM)
+        self.breakers = {
+            "generation": CircuitBreaker("Generation"),
+            "embedding": CircuitBreaker("Embedding")
+        }
+        self.max_retries = LLM_MAX_RETRIES
+
+        # Counters below are updated from many threads; guarded by _lock
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.throttled_seconds = 0.0
+
+        self.hedge_enabled = HEDGE_ENABLED
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self.hedgeable = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _breaker(self, limiter: RateLimiter) -> CircuitBreaker:
+        return self.breakers["embedding" if limiter is self.embedding_limiter else "generation"]
+
+    def _before_call(self, limiter: RateLimiter, tokens: int, component: str) -> Tuple[float, bool]:
+        """
+        Checks the breaker and reserves quota. Returns the seconds to wait and
+        whether this call is the breaker's half-open trial.
+        """
+        trial = self._breaker(limiter).allow()
+        wait = limiter.reserve(tokens)
+        with self._lock:
+            self.calls += 1
+            self.throttled_seconds += wait
+        if wait > 0:
+            incr("llm_throttled_seconds", wait, component=component)
+        incr("embedding_calls" if limiter is self.embedding_limiter else "llm_calls", component=component)
+        return wait, trial
+
+    def _after_failure(self, breaker: CircuitBreaker, e: Exception, attempt: int, component: str) -> Optional[float]:
+        """
+        Returns the backoff before the next attempt, or None if `e` should be raised.
+        """
+        if isinstance(e, CircuitOpenError):
+            return None
+        if not is_retryable(e):
+            breaker.record_success() # The API answered; it is the request that is bad
+            return None
+        breaker.record_failure()
+        if attempt >= self.max_retries:
+            with self._lock:
+                self.failures += 1
+            return None
+        with self._lock:
+            self.retries += 1
+        incr("llm_retries", component=component)
+        delay = backoff_delay(attempt)
+        logger.warning(f"{component}: transient LLM error ({e}). Retrying in {delay:.1f}s...")
+        return delay
+
+    def _call(self, limiter: RateLimiter, tokens: int, component: str, fn, hedge: bool = False, **kwargs):
+        breaker = self._breaker(limiter)
+        attempt = 0
+        while True:
+            trial = False
+            try:
+                wait, trial = self._before_call(limiter, tokens, component)
+                if wait > 0:
+                    time.sleep(wait)
+                if hedge and self.hedge_enabled:
+                    result = self._hedged(limiter, tokens, component, fn, kwargs)
+                else:
+                    result = fn(**kwargs)
+                breaker.record_success()
+                return result
+            except Exception as e:
+                delay = self._after_failure(breaker, e, attempt, component)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+            except BaseException: # Interrupted; the outcome is unknown
+                if trial:
+                    breaker.abandon_trial()
+                raise
+
+    async def _acall(self, limiter: RateLimiter, tokens: int, component: str, fn, hedge: bool = False, **kwargs):
+        breaker = self._breaker(limiter)
+        attempt = 0
+        while True:
+            trial = False
+            try:
+                wait, trial = self._before_call(limiter, tokens, component)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                if hedge and self.hedge_enabled:
+                    result = await self._ahedged(limiter, tokens, component, fn, kwargs)
+                else:
+                    result = await fn(**kwargs)
+                breaker.record_success()
+                return result
+            except Exception as e:
+                delay = self._after_failure(breaker, e, attempt, component)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+            except BaseException: # Cancelled (deadline, hedge loser, client gone); the outcome is unknown
+                if trial:
+                    breaker.abandon_trial()
+                raise
+
+    def _stream(self, limiter: RateLimiter, tokens: int, component: str, fn, **kwargs) -> Iterator[Any]:
+        """
+        genai makes a streaming request only when the stream is iterated, so
+        the retry loop wraps the iteration. Failures before the first chunk
+        are retried; a stream that fails midway is not replayed.
+        """
+        breaker = self._breaker(limiter)
+        attempt = 0
+        while True:
+            trial = False
+            started = False
+            try:
+                wait, trial = self._before_call(limiter, tokens, component)
+                if wait > 0:
+                    time.sleep(wait)
+                for chunk in fn(**kwargs):
+                    if not started:
+                        started, trial = True, False
+                        breaker.record_success()
+                    yield chunk
+                if not started:
+                    breaker.record_success()
+                return
+            except Exception as e:
+                if started:
+                    raise
+                delay = self._after_failure(breaker, e, attempt, component)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+            except BaseException: # Closed by the consumer or interrupted
+                if trial:
+                    breaker.abandon_trial()
+                raise
+
+    async def _astream(self, limiter: RateLimiter, tokens: int, component: str, fn, **kwargs) -> AsyncIterator[Any]:
+        """
+        Async counterpart of `_stream`.
+        """
+        breaker = self._breaker(limiter)
+        attempt = 0
+        while True:
+            trial = False
+            started = False
+            try:
+                wait, trial = self._before_call(limiter, tokens, component)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                async for chunk in await fn(**kwargs):
+                    if not started:
+                        started, trial = True, False
+                        breaker.record_success()
+                    yield chunk
+                if not started:
+                    breaker.record_success()
+                return
+            except Exception as e:
+                if started:
+                    raise
+                delay = self._after_failure(breaker, e, attempt, component)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+            except BaseException: # Closed by the consumer or cancelled
+                if trial:
+                    breaker.abandon_trial()
+                raise
+
+    def _hedge_delay(self, component: str) -> Optional[float]:
+        """
+        Seconds to wait before hedging: the component's HEDGE_PERCENTILE latency
+        (None until HEDGE_MIN_SAMPLES calls have been seen).
+        """
+        with self._lock:
+            self.hedgeable += 1
+            samples = self._latencies.get(component)
+            if samples is None or len(samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))
+        return max(HEDGE_MIN_DELAY, ordered[index])
+
+    def _record_latency(self, component: str, seconds: float):
+        with self._lock:
+            samples = self._latencies.get(component)
+            if samples is None:
+                samples = self._latencies[component] = deque(maxlen=HEDGE_WINDOW)
+            samples.append(seconds)
+
+    def _try_hedge(self, limiter: RateLimiter, tokens: int, component: str) -> bool:
+        """
+        A hedge is sent only within HEDGE_BUDGET, with the circuit closed and
+        quota available right now (a hedge never waits for the bucket).
+        """
+        with self._lock:
+            if self.hedges + 1 > HEDGE_BUDGET * self.hedgeable:
+                return False
+            if self._breaker(limiter).state != "closed" or not limiter.try_acquire(tokens):
+                return False
+            self.hedges += 1
+            self.calls += 1
+        incr("llm_calls", component=component)
+        incr("llm_hedges", component=component)
+        return True
+
+    def _hedge_won(self, component: str):
+        with self._lock:
+            self.hedge_wins += 1
+        incr("llm_hedge_wins", component=component)
+
+    def _hedged(self, limiter: RateLimiter, tokens: int, component: str, fn, kwargs: Dict[str, Any]):
+        """
+        Sync hedging on a thread pool. The losing call cannot be interrupted;
+        it finishes in the background and its result is dropped.
+        """
+        start = time.perf_counter()
+        delay = self._hedge_delay(component)
+        if delay is None:
+            result = fn(**kwargs)
+            self._record_latency(component, time.perf_counter() - start)
+            return result
+
+        if self._hedge_pool is None:
+            with self._lock:
+                if self._hedge_pool is None:
+                    self._hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="llm-hedge")
+        primary = self._hedge_pool.submit(contextvars.copy_context().run, fn, **kwargs)
+        done, _ = wait_futures([primary], timeout=delay)
+        if done or not self._try_hedge(limiter, tokens, component):
+            result = primary.result()
+            self._record_latency(component, time.perf_counter() - start)
+            return result
+
+        hedge = self._hedge_pool.submit(contextvars.copy_context().run, fn, **kwargs)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._hedge_won(component)
+                    self._record_latency(component, time.perf_counter() - start)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _ahedged(self, limiter: RateLimiter, tokens: int, component: str, fn, kwargs: Dict[str, Any]):
+        """
+        Async hedging: the first successful call wins and the other is cancelled.
+        """
+        start = time.perf_counter()
+        delay = self._hedge_delay(component)
+        if delay is None:
+            result = await fn(**kwargs)
+            self._record_latency(component, time.perf_counter() - start)
+            return result
+
+        primary = asyncio.ensure_future(fn(**kwargs))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._try_hedge(limiter, tokens, component):
+                result = await primary
+                self._record_latency(component, time.perf_counter() - start)
+                return result
+
+            hedge = asyncio.ensure_future(fn(**kwargs))
+            pending, error = {primary, hedge}, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._hedge_won(component)
+                        self._record_latency(component, time.perf_counter() - start)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def generate_content(self, model: str, contents: Any, config: Any = None, component: str = "llm"):
+        return self._call(
+            self.generation_limiter, _request_tokens(contents, config), component,
+            self.client.models.generate_content, hedge=True, model=model, contents=contents, config=config
+        )
+
+    async def agenerate_content(self, model: str, contents: Any, config: Any = None, component: str = "llm"):
+        return await self._acall(
+            self.generation_limiter, _request_tokens(contents, config), component,
+            self.client.aio.models.generate_content, hedge=True, model=model, contents=contents, config=config
+        )
+
+    def generate_content_stream(self, model: str, contents: Any, config: Any = None, component: str = "llm"):
+        return self._stream(
+            self.generation_limiter, _request_tokens(contents, config), component,
+            self.client.models.generate_content_stream, model=model, contents=contents, config=config
+        )
+
+    async def agenerate_content_stream(self, model: str, contents: Any, config: Any = None, component: str = "llm"):
+        # Awaitable like genai's own method, so callers keep `async for chunk in await ...`
+        return self._astream(
+            self.generation_limiter, _request_tokens(contents, config), component,
+            self.client.aio.models.generate_content_stream, model=model, contents=contents, config=config
+        )
+
+    def embed_content(self, model: str, contents: Any, config: Any = None, component: str = "embedding"):
+        return self._call(
+            self.embedding_limiter, _request_tokens(contents), component,
+            self.client.models.embed_content, model=model, contents=contents, config=config
+        )
+
+    async def aembed_content(self, model: str, contents: Any, config: Any = None, component: str = "embedding"):
+        return await self._acall(
+            self.embedding_limiter, _request_tokens(contents), component,
+            self.client.aio.models.embed_content, model=model, contents=contents, config=config
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "throttled_seconds": round(self.throttled_seconds, 3),
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedge_rate": self.hedges / self.hedgeable if self.hedgeable else 0.0,
+                "hedge_win_rate": self.hedge_wins / self.hedges if self.hedges else 0.0
+            }
+        for lane, breaker in self.breakers.items():
+            stats[f"{lane}_circuit_open"] = breaker.state != "closed"
+            stats[f"{lane}_circuit_rejected"] = breaker.rejected
+        return stats
+
+_gateways: Dict[str, LLMGateway] = {}
+_gateways_lock = threading.Lock()
+
+def get_gateway(api_key: Optional[str] = None) -> LLMGateway:
+    """
+    Process-wide gateway for `api_key` (default: GEMINI_API_KEY).
+    """
+    api_key = api_key or os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found")
+    with _gateways_lock:
+        gateway = _gateways.get(api_key)
+        if gateway is None:
+            gateway = _gateways[api_key] = LLMGateway(api_key)
+        return gateway
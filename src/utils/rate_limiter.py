@@ -0,0 +1,92 @@
+import threading
+import time
+from typing import Optional
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+    `acquire(n)` blocks until n tokens are available.
+    """
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """
+        Takes `amount` tokens (possibly going into debt) and returns the number of
+        seconds the caller must wait before using them.
+        """
+        # A request larger than the bucket can never be satisfied; cap it
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, amount: float = 1.0):
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+    def try_acquire(self, amount: float = 1.0) -> bool:
+        """
+        Takes `amount` tokens only if they are available now (never waits or goes into debt).
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens < amount:
+                return False
+            self._tokens -= amount
+            return True
+
+    def release(self, amount: float = 1.0):
+        """
+        Returns unused tokens to the bucket.
+        """
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + min(amount, self.capacity))
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits applied together.
+    """
+    def __init__(self, requests_per_minute: float, tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def reserve(self, tokens: int = 0) -> float:
+        wait = self.requests.reserve(1)
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def acquire(self, tokens: int = 0):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    def try_acquire(self, tokens: int = 0) -> bool:
+        """
+        Non-blocking: takes one request (and `tokens`) only if both buckets have room now.
+        """
+        if not self.requests.try_acquire(1):
+            return False
+        if self.tokens is not None and tokens and not self.tokens.try_acquire(tokens):
+            self.requests.release(1)
+            return False
+        return True
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token) for quota accounting."""
+    return max(1, len(text) // 4)
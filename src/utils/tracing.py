@@ -0,0 +1,210 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger("trace")
+
+# Write every finished request trace as one JSON log line
+TRACE_LOG = os.getenv("TRACE_LOG", "0") == "1"
+METRIC_PREFIX = "rag"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0) # Seconds
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(**labels: Any) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped, strict=True)) + "}"
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+
+class MetricsRegistry:
+    """
+    Process-wide counters and latency histograms, rendered in the Prometheus
+    text format. Components with a `stats()` dict can register it; its numeric
+    values are exported as gauges `rag_<name>_<key>` at scrape time.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = defaultdict(dict)
+        self._gauges: Dict[str, Dict[Labels, float]] = defaultdict(dict)
+        self._stats: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: Any):
+        with self._lock:
+            self._counters[name][_labels(**labels)] += value
+
+    def observe(self, name: str, seconds: float, **labels: Any):
+        key = _labels(**labels)
+        with self._lock:
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = _Histogram()
+            histogram.observe(seconds)
+
+    def set_gauge(self, name: str, value: float, **labels: Any):
+        with self._lock:
+            self._gauges[name][_labels(**labels)] = value
+
+    def register_stats(self, name: str, fn: Callable[[], Dict[str, Any]]):
+        self._stats[name] = fn
+
+    def _stats_gauges(self) -> List[str]:
+        lines = []
+        for name, fn in list(self._stats.items()):
+            try:
+                stats = fn()
+            except Exception as e:
+                logger.warning(f"Stats collector '{name}' failed: {e}")
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                metric = f"{METRIC_PREFIX}_{name}_{key}"
+                lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return lines
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = f"{METRIC_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines += [f"{metric}{_format_labels(labels)} {value:g}" for labels, value in sorted(series.items())]
+            for name, series in sorted(self._gauges.items()):
+                metric = f"{METRIC_PREFIX}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines += [f"{metric}{_format_labels(labels)} {value:g}" for labels, value in sorted(series.items())]
+            for name, series in sorted(self._histograms.items()):
+                metric = f"{METRIC_PREFIX}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, n in zip(LATENCY_BUCKETS, histogram.buckets, strict=True):
+                        cumulative += n
+                        lines.append(f"{metric}_bucket{_format_labels(labels, ('le', f'{bound:g}'))} {cumulative}")
+                    lines.append(f"{metric}_bucket{_format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+                    lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+        lines += self._stats_gauges()
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+class Trace:
+    """
+    Spans and counters of one request. Lives in a context variable, so it
+    follows the request through awaits, `asyncio.to_thread` and tasks created
+    while it is active (e.g. a single-flight leader's pipeline task).
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+        self.counters: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, seconds: float, error: bool = False):
+        span = {"name": name, "start_ms": round((start - self.started) * 1000, 3), "duration_ms": round(seconds * 1000, 3)}
+        if error:
+            span["error"] = True
+        with self._lock:
+            self.spans.append(span)
+
+    def add(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "name": self.name,
+                "duration_ms": self.duration_ms,
+                "spans": list(self.spans),
+                "counters": dict(self.counters)
+            }
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("rag_trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+@contextmanager
+def request_trace(name: str):
+    """
+    Starts a trace for one request. On exit, records the total latency in
+    `rag_request_seconds{endpoint=name}` and, with TRACE_LOG, logs the trace as JSON.
+    """
+    trace = Trace(name)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        seconds = time.perf_counter() - trace.started
+        trace.duration_ms = round(seconds * 1000, 3)
+        metrics.observe("request", seconds, endpoint=name)
+        try:
+            _current.reset(token)
+        except ValueError: # Generator finalised in another context
+            _current.set(None)
+        if TRACE_LOG:
+            trace_logger.info(json.dumps(trace.to_dict()))
+
+@contextmanager
+def span(name: str):
+    """
+    Times a pipeline stage into `rag_stage_seconds{stage=name}` and the current trace.
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe("stage", seconds, stage=name)
+        trace = _current.get()
+        if trace is not None:
+            trace.add_span(name, start, seconds, error)
+
+def incr(name: str, value: float = 1, **labels: Any):
+    """
+    Increments counter `rag_<name>_total` and the current trace's counter `name`.
+    """
+    metrics.inc(name, value, **labels)
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, value)